@@ -0,0 +1,18 @@
+"""
+First module preloaded by the fork server of
+:class:`~.workers.ForkserverWorker`.
+
+The fork server is a new interpreter whose ``sys.path`` is the default one:
+the generated task modules, often found through the ``sys.path`` of the
+process creating the worker only, could not be preloaded. This module puts
+that ``sys.path``, passed in :data:`path_variable`, in front of the server's
+before the next modules are imported.
+"""
+import os
+import sys
+
+#: environment variable holding the ``sys.path`` of the process creating the worker
+path_variable = "PYDRA_SEM_FORKSERVER_PATH"
+
+_paths = [path for path in os.environ.get(path_variable, "").split(os.pathsep) if path]
+sys.path[:] = _paths + [path for path in sys.path if path not in _paths]
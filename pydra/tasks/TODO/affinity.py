@@ -0,0 +1,147 @@
+"""
+CPU affinity and thread counts of co-located SEM tools.
+
+ITK based tools start one thread per core of the node by default, so a few
+tools running side by side oversubscribe it. A task given a core set is
+pinned to it with ``sched_setaffinity`` and its thread count environment
+variables are set to its size; :class:`CoreAllocator` hands out core sets
+to the tasks of a node, contiguous and within one NUMA node when possible.
+"""
+import contextlib
+import glob
+import os
+import re
+import socket
+import time
+import uuid
+
+from .locking import SqliteStore
+
+#: environment variables of the thread pools of ITK and OpenMP
+thread_variables = ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS", "OMP_NUM_THREADS"]
+
+
+def parse_cpulist(text):
+    """CPUs of a ``cpulist`` as found in sysfs
+
+    >>> parse_cpulist("0-3,8,10-11")
+    [0, 1, 2, 3, 8, 10, 11]
+    """
+    cpus = []
+    for item in text.strip().split(","):
+        if not item:
+            continue
+        first, _, last = item.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes():
+    """``{node: [cpus]}`` of the CPUs this process may run on"""
+    allowed = os.sched_getaffinity(0)
+    nodes = {}
+    for path in glob.glob("/sys/devices/system/node/node*/cpulist"):
+        node = int(re.search(r"node(\d+)", path).group(1))
+        with open(path) as f:
+            cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in allowed]
+        if cpus:
+            nodes[node] = cpus
+    return nodes or {0: sorted(allowed)}
+
+
+def thread_environment(threads, env=None):
+    """Copy of ``env`` (``os.environ`` by default) limiting the tool to ``threads``"""
+    env = dict(os.environ if env is None else env)
+    for name in thread_variables:
+        env[name] = str(threads)
+    return env
+
+
+def pick_cores(free, nodes, count):
+    """Best ``count`` cores among ``free``, None when there are not enough
+
+    A contiguous range within the NUMA node leaving the fewest free cores is
+    preferred, then any cores of one node, then cores of several nodes.
+
+    >>> nodes = {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+    >>> pick_cores({0, 2, 3, 4, 5, 6, 7}, nodes, 2)
+    [2, 3]
+    >>> pick_cores({0, 2, 5, 6, 7}, nodes, 3)
+    [5, 6, 7]
+    >>> pick_cores({0, 2, 7}, nodes, 3)
+    [0, 2, 7]
+    """
+    if count > len(free):
+        return None
+    candidates = []
+    for cpus in nodes.values():
+        available = [cpu for cpu in cpus if cpu in free]
+        if len(available) < count:
+            continue
+        for start in range(len(available) - count + 1):
+            window = available[start : start + count]
+            if window[-1] - window[0] == count - 1:
+                candidates.append((0, len(available), window))
+                break
+        else:
+            candidates.append((1, len(available), available[:count]))
+    if candidates:
+        return min(candidates)[2]
+    return sorted(free)[:count]
+
+
+class CoreAllocator(SqliteStore):
+    """Core sets allocated to the tasks of a node, in the sqlite database ``path``
+
+    ``path`` must be node-local.
+
+    >>> import tempfile
+    >>> allocator = CoreAllocator(os.path.join(tempfile.mkdtemp(), "cores.sqlite"),
+    ...                           nodes={0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+    >>> with allocator.allocate(4) as first, allocator.allocate(2) as second:
+    ...     first, second
+    ([0, 1, 2, 3], [4, 5])
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS cores ("
+        "core INTEGER PRIMARY KEY, allocation TEXT, host TEXT, pid INTEGER)"
+    ]
+    autocommit = True
+
+    def __init__(self, path, nodes=None, poll=1.0):
+        super().__init__(path)
+        self.path = str(path)
+        self.nodes = nodes if nodes is not None else numa_nodes()
+        self.poll = poll
+
+    def _try_allocate(self, allocation, count):
+        host = socket.gethostname()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._reap_dead(db, "cores", "core")
+            used = {core for (core,) in db.execute("SELECT core FROM cores")}
+            free = {cpu for cpus in self.nodes.values() for cpu in cpus} - used
+            cores = pick_cores(free, self.nodes, count)
+            if cores is None:
+                return None
+            db.executemany(
+                "INSERT INTO cores VALUES (?, ?, ?, ?)",
+                [(core, allocation, host, os.getpid()) for core in cores],
+            )
+        return cores
+
+    @contextlib.contextmanager
+    def allocate(self, count):
+        """Hold ``count`` cores (at most all of them), waiting for them to be free"""
+        count = max(1, min(count, sum(len(cpus) for cpus in self.nodes.values())))
+        allocation = uuid.uuid4().hex
+        cores = self._try_allocate(allocation, count)
+        while cores is None:
+            time.sleep(self.poll)
+            cores = self._try_allocate(allocation, count)
+        try:
+            yield cores
+        finally:
+            with self._connect() as db:
+                db.execute("DELETE FROM cores WHERE allocation = ?", (allocation,))
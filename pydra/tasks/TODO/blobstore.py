@@ -0,0 +1,133 @@
+"""
+Content-addressed deduplication of SEM task outputs.
+
+Many tools write byte-identical outputs across re-runs, and workflows copy
+the same masks into several task directories. :class:`BlobStore` keeps one
+copy of every content under ``<root>/blobs/<digest>`` and replaces the files
+of each task directory by hard links to it (or reflinks when hard links are
+not possible), so identical files take the space of one.
+
+Deduplicated files share their inode with the blob, they are made
+read-only since an in-place change would alter every copy.
+"""
+import os
+import stat
+
+from .locking import SqliteStore
+from .nodecache import sha256_file
+from .staging import reflink
+
+
+class BlobStore(SqliteStore):
+    """Blob store rooted at ``root``, on the same filesystem as the cache
+
+    Files smaller than ``min_size`` are left alone.
+
+    >>> import tempfile
+    >>> cache_dir = tempfile.mkdtemp()
+    >>> store = BlobStore(os.path.join(cache_dir, ".sem_blobs"), min_size=1)
+    >>> for task in ["a", "b"]:
+    ...     os.mkdir(os.path.join(cache_dir, task))
+    ...     with open(os.path.join(cache_dir, task, "mask.nii"), "wb") as f:
+    ...         _ = f.write(b"same mask")
+    ...     store.dedupe_dir(os.path.join(cache_dir, task))
+    ['mask.nii']
+    ['mask.nii']
+    >>> os.stat(os.path.join(cache_dir, "a", "mask.nii")).st_nlink
+    3
+    >>> import shutil
+    >>> shutil.rmtree(os.path.join(cache_dir, "a"))
+    >>> shutil.rmtree(os.path.join(cache_dir, "b"))
+    >>> store.gc()
+    1
+    """
+
+    schema = ["CREATE TABLE IF NOT EXISTS refs (path TEXT PRIMARY KEY, digest TEXT)"]
+
+    def __init__(self, root, min_size=1 << 16):
+        self.root = str(root)
+        self.min_size = min_size
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        super().__init__(os.path.join(self.root, "refs.sqlite"))
+
+    def _blob(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _replace(self, path, blob):
+        """Replace ``path`` by a link or clone of ``blob``, False if neither works
+
+        ``path`` is left untouched when it cannot be replaced.
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                reflink(blob, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            return False
+        return True
+
+    def ingest(self, path):
+        """Replace ``path`` by a link to the blob of its content, returns the digest
+
+        Returns None, leaving ``path`` as it is, when it can be neither linked
+        nor cloned from the blob.
+        """
+        path = os.path.abspath(str(path))
+        digest = sha256_file(path)
+        blob = self._blob(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            # first copy of this content: the file itself becomes the blob
+            os.link(path, blob)
+        except FileExistsError:
+            if not os.path.samefile(path, blob) and not self._replace(path, blob):
+                return None
+        except OSError:
+            # other filesystem: keep the file as it is
+            return None
+        mode = os.stat(blob).st_mode
+        os.chmod(blob, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO refs VALUES (?, ?)", (path, digest))
+        return digest
+
+    def dedupe_dir(self, task_dir):
+        """Deduplicate the outputs of ``task_dir``, returns the files linked"""
+        task_dir = str(task_dir)
+        deduped = []
+        for root, _, files in os.walk(task_dir):
+            for name in files:
+                # pydra bookkeeping (_result.pklz, ...) stays private to the task
+                if name.startswith("_") or name.endswith((".lock", ".tmp")):
+                    continue
+                path = os.path.join(root, name)
+                if os.path.islink(path) or os.path.getsize(path) < self.min_size:
+                    continue
+                if self.ingest(path) is not None:
+                    deduped.append(os.path.relpath(path, task_dir))
+        return deduped
+
+    def gc(self):
+        """Remove the blobs no task directory refers to, returns how many"""
+        with self._connect() as db:
+            refs = db.execute("SELECT path, digest FROM refs").fetchall()
+            gone = [(path,) for path, _ in refs if not os.path.exists(path)]
+            db.executemany("DELETE FROM refs WHERE path = ?", gone)
+            referenced = {
+                digest for (digest,) in db.execute("SELECT DISTINCT digest FROM refs")
+            }
+        removed = 0
+        blobs_dir = os.path.join(self.root, "blobs")
+        for prefix in os.listdir(blobs_dir):
+            for digest in os.listdir(os.path.join(blobs_dir, prefix)):
+                blob = os.path.join(blobs_dir, prefix, digest)
+                # a hard-linked reference keeps the link count above 1
+                if os.stat(blob).st_nlink == 1 and digest not in referenced:
+                    os.unlink(blob)
+                    removed += 1
+        return removed
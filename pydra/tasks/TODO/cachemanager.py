@@ -0,0 +1,229 @@
+"""
+Size and age budgets for the cache directory of SEM tasks.
+
+Task directories are registered in ``<cache_dir>/.sem_cache_index.sqlite``
+with their size, last access time and number of hits when the task runs or
+is served from the cache, so eviction never needs to walk the cache. A
+directory is only removed while holding the lock pydra takes to run the
+task in it, so entries being written or read by a task are left alone.
+"""
+import os
+import shutil
+import time
+
+from filelock import SoftFileLock, Timeout
+
+from .locking import SqliteStore
+
+index_name = ".sem_cache_index.sqlite"
+
+
+def directory_size(path):
+    """Disk usage of the files below ``path``, in bytes"""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class CacheManager(SqliteStore):
+    """Evict task directories of ``cache_dir`` beyond ``max_bytes``/``max_age``
+
+    ``policy`` is "lru" (least recently used first) or "lfu" (least
+    frequently used first, least recently used among equals). Pinned
+    entries, e.g. tasks holding terminal outputs, are never evicted.
+    Tasks call :meth:`evict_due`, which evicts once the budgets are
+    exceeded and at most every ``evict_interval`` seconds for the whole
+    cache; with ``evict_interval=None`` eviction is left to :meth:`evict`
+    run out of band, e.g. by a periodic job.
+
+    >>> import tempfile
+    >>> cache_dir = tempfile.mkdtemp()
+    >>> manager = CacheManager(cache_dir, max_bytes=250)
+    >>> for name, pinned in [("a", True), ("b", False), ("c", False)]:
+    ...     os.mkdir(os.path.join(cache_dir, name))
+    ...     with open(os.path.join(cache_dir, name, "out.nii"), "wb") as f:
+    ...         _ = f.write(bytes(100))
+    ...     manager.record(name, pinned=pinned)
+    >>> manager.touch("b")
+    >>> manager.evict()
+    ['c']
+    >>> manager.total_size()
+    200
+    >>> manager.over_budget(), manager.evict_due()
+    (False, [])
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "name TEXT PRIMARY KEY, size INTEGER, created REAL, "
+        "last_access REAL, hits INTEGER, pinned INTEGER)",
+        "CREATE TABLE IF NOT EXISTS evictions (id INTEGER PRIMARY KEY, last REAL)",
+    ]
+
+    def __init__(
+        self, cache_dir, max_bytes=None, max_age=None, policy="lru", evict_interval=60
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(
+                f"unknown eviction policy {policy!r}, expected 'lru' or 'lfu'"
+            )
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.policy = policy
+        self.evict_interval = evict_interval
+        super().__init__(os.path.join(self.cache_dir, index_name))
+
+    def record(self, name, pinned=False):
+        """Register (or refresh the size of) the task directory ``name``"""
+        name = os.path.basename(str(name))
+        size = directory_size(os.path.join(self.cache_dir, name))
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT(name) DO UPDATE SET size = excluded.size, "
+                "last_access = excluded.last_access, "
+                "pinned = MAX(pinned, excluded.pinned)",
+                (name, size, now, now, int(pinned)),
+            )
+
+    def refresh_size(self, name):
+        """Update the size of ``name`` after its files changed, e.g. once compressed"""
+        name = os.path.basename(str(name))
+        size = directory_size(os.path.join(self.cache_dir, name))
+        with self._connect() as db:
+            db.execute("UPDATE entries SET size = ? WHERE name = ?", (size, name))
+
+    def register(self, task_dir, executed=True, pinned=False):
+        """Register a run (``executed``) or a cache hit of ``task_dir``, evicting if due
+
+        Directories of other caches are not managed here. Returns the names
+        evicted.
+        """
+        task_dir = os.path.realpath(task_dir)
+        if os.path.dirname(task_dir) != os.path.realpath(self.cache_dir):
+            return []
+        if executed:
+            self.record(task_dir, pinned=pinned)
+        else:
+            self.touch(task_dir)
+        return self.evict_due(keep=[task_dir])
+
+    def touch(self, name):
+        """Mark ``name`` as used, registering it when unknown"""
+        name = os.path.basename(str(name))
+        with self._connect() as db:
+            updated = db.execute(
+                "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE name = ?",
+                (time.time(), name),
+            ).rowcount
+        if not updated:
+            self.record(name)
+
+    def pin(self, name, pinned=True):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE entries SET pinned = ? WHERE name = ?",
+                (int(pinned), os.path.basename(str(name))),
+            )
+
+    def unpin(self, name):
+        self.pin(name, pinned=False)
+
+    def total_size(self):
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[
+                0
+            ]
+
+    def scan(self):
+        """Register the task directories already present in the cache"""
+        for entry in os.scandir(self.cache_dir):
+            # skips the stores kept in the cache, e.g. .sem_blobs
+            if entry.is_dir() and not entry.name.startswith("."):
+                with self._connect() as db:
+                    known = db.execute(
+                        "SELECT 1 FROM entries WHERE name = ?", (entry.name,)
+                    ).fetchone()
+                if not known:
+                    self.record(entry.name)
+
+    def _remove(self, name):
+        """Remove the task directory ``name``, False when a task holds its lock"""
+        # the lock pydra takes next to the task directory to run it
+        lock = SoftFileLock(os.path.join(self.cache_dir, f"{name}.lock"))
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            return False
+        try:
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            with self._connect() as db:
+                db.execute("DELETE FROM entries WHERE name = ?", (name,))
+        finally:
+            lock.release()
+        return True
+
+    def over_budget(self):
+        """Whether the entries exceed ``max_bytes`` or some are older than ``max_age``"""
+        with self._connect() as db:
+            total, oldest = db.execute(
+                "SELECT (SELECT COALESCE(SUM(size), 0) FROM entries), "
+                "(SELECT MIN(last_access) FROM entries WHERE pinned = 0)"
+            ).fetchone()
+        if self.max_bytes is not None and total > self.max_bytes:
+            return True
+        return (
+            self.max_age is not None
+            and oldest is not None
+            and time.time() - oldest > self.max_age
+        )
+
+    def evict_due(self, keep=()):
+        """:meth:`evict` when over budget and not evicted for ``evict_interval``
+
+        Returns the names evicted.
+        """
+        if self.evict_interval is None or not self.over_budget():
+            return []
+        now = time.time()
+        with self._connect() as db:
+            # the first process past the interval evicts, the others go on
+            claimed = db.execute(
+                "INSERT INTO evictions VALUES (0, ?) ON CONFLICT(id) "
+                "DO UPDATE SET last = excluded.last WHERE last < ?",
+                (now, now - self.evict_interval),
+            ).rowcount
+        return self.evict(keep) if claimed else []
+
+    def evict(self, keep=()):
+        """Remove entries until the budgets are met, returns their names
+
+        Entries whose task directory is locked, by a task running or reading
+        it, are skipped.
+        """
+        keep = {os.path.basename(str(name)) for name in keep}
+        order = "last_access" if self.policy == "lru" else "hits, last_access"
+        with self._connect() as db:
+            candidates = db.execute(
+                f"SELECT name, size, last_access FROM entries WHERE pinned = 0 ORDER BY {order}"
+            ).fetchall()
+        total = self.total_size()
+        now = time.time()
+        evicted = []
+        for name, size, last_access in candidates:
+            if name in keep:
+                continue
+            expired = self.max_age is not None and now - last_access > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or too_big) or not self._remove(name):
+                continue
+            total -= size
+            evicted.append(name)
+        return evicted
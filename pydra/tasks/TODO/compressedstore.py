@@ -0,0 +1,188 @@
+"""
+zstd-compressed storage of cached SEM task outputs.
+
+Label and probability maps compress very well. :meth:`CompressedStore.compact`
+replaces the output files of idle task directories by ``<name>.zst``; when
+a task is served from the cache its outputs are transparently decompressed
+again (:meth:`CompressedStore.materialize`), or they can be read without
+decompressing them to disk with :meth:`CompressedStore.open`. The tasks
+using a store compact their cache at most every ``compact_interval``
+seconds (:meth:`CompressedStore.compact_due`); with ``compact_interval=None``
+:meth:`CompressedStore.compact` is left to a periodic job::
+
+    CompressedStore().compact(cache_dir, manager=CacheManager(cache_dir))
+
+Requires the optional ``zstandard`` package (``pip install pydra-TODO[zstd]``).
+"""
+import json
+import os
+import time
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+manifest_name = "_compressed.json"
+suffix = ".zst"
+#: file of the cache directory touched whenever it is compacted
+compact_stamp = ".sem_compacted"
+
+
+class CompressedStore:
+    """Compress task outputs of at least ``min_size`` bytes at zstd ``level``
+
+    ``threads`` is the number of zstd worker threads, -1 for one per CPU.
+    :meth:`compact` compresses the task directories unused for ``idle``
+    seconds, :meth:`compact_due` runs it at most every ``compact_interval``
+    seconds per cache directory.
+
+    >>> import tempfile
+    >>> task_dir = tempfile.mkdtemp()
+    >>> with open(os.path.join(task_dir, "labels.nii"), "wb") as f:
+    ...     _ = f.write(bytes(4096))
+    >>> store = CompressedStore(min_size=1024)
+    >>> store.compress_dir(task_dir)
+    ['labels.nii']
+    >>> sorted(os.listdir(task_dir))
+    ['_compressed.json', 'labels.nii.zst']
+    >>> store.open(os.path.join(task_dir, "labels.nii")).read(8)
+    b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00'
+    >>> store.materialize(task_dir)
+    ['labels.nii']
+    >>> os.path.getsize(os.path.join(task_dir, "labels.nii"))
+    4096
+    """
+
+    def __init__(
+        self, level=3, min_size=1 << 20, threads=-1, idle=3600, compact_interval=600
+    ):
+        if zstandard is None:
+            raise ImportError(
+                "CompressedStore requires the zstandard package, "
+                "install it with: pip install zstandard"
+            )
+        self.level = level
+        self.min_size = min_size
+        self.threads = threads
+        self.idle = idle
+        self.compact_interval = compact_interval
+
+    @staticmethod
+    def _manifest(task_dir):
+        try:
+            with open(os.path.join(task_dir, manifest_name)) as f:
+                return json.load(f)["files"]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _write_manifest(task_dir, files):
+        path = os.path.join(task_dir, manifest_name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"files": sorted(set(files))}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _candidates(self, task_dir):
+        for root, _, files in os.walk(task_dir):
+            for name in files:
+                # pydra bookkeeping (_result.pklz, ...) and lock files stay as they are
+                if name.startswith("_") or name.endswith((suffix, ".lock", ".tmp")):
+                    continue
+                path = os.path.join(root, name)
+                if not os.path.islink(path) and os.path.getsize(path) >= self.min_size:
+                    yield os.path.relpath(path, task_dir)
+
+    def compress_dir(self, task_dir):
+        """Replace the outputs of ``task_dir`` by their compressed version"""
+        task_dir = str(task_dir)
+        files = self._manifest(task_dir)
+        compressed = []
+        for name in list(self._candidates(task_dir)):
+            path = os.path.join(task_dir, name)
+            if name not in files or not os.path.exists(path + suffix):
+                compressor = zstandard.ZstdCompressor(
+                    level=self.level, threads=self.threads
+                )
+                with open(path, "rb") as src, open(f"{path}{suffix}.tmp", "wb") as dst:
+                    compressor.copy_stream(src, dst)
+                os.replace(f"{path}{suffix}.tmp", path + suffix)
+                files.append(name)
+            compressed.append(name)
+            # only written once the compressed copy is complete
+            self._write_manifest(task_dir, files)
+            os.unlink(path)
+        return compressed
+
+    def materialize(self, task_dir):
+        """Decompress the outputs of ``task_dir`` that are only stored compressed"""
+        task_dir = str(task_dir)
+        restored = []
+        for name in self._manifest(task_dir):
+            path = os.path.join(task_dir, name)
+            if os.path.exists(path) or not os.path.exists(path + suffix):
+                continue
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(path + suffix, "rb") as src, open(tmp, "wb") as dst:
+                zstandard.ZstdDecompressor().copy_stream(src, dst)
+            os.replace(tmp, path)
+            restored.append(name)
+        manifest = os.path.join(task_dir, manifest_name)
+        if os.path.exists(manifest):
+            # marks the directory as used for compact()
+            os.utime(manifest)
+        return restored
+
+    def open(self, path):
+        """Binary reader of ``path``, decompressing on the fly when needed"""
+        path = str(path)
+        if os.path.exists(path):
+            return open(path, "rb")
+        return zstandard.ZstdDecompressor().stream_reader(open(path + suffix, "rb"))
+
+    def compact(self, cache_dir, idle=None, manager=None, keep=()):
+        """Compress the task directories of ``cache_dir`` unused for ``idle`` seconds
+
+        ``idle`` defaults to the one of the store, the directories ``keep``
+        are left alone. The sizes of the
+        directories compressed are updated in the
+        :class:`~.cachemanager.CacheManager` ``manager``. Returns their names.
+        """
+        idle = self.idle if idle is None else idle
+        keep = {os.path.basename(str(name)) for name in keep}
+        now = time.time()
+        compacted = []
+        for entry in os.scandir(cache_dir):
+            if not entry.is_dir() or entry.name in keep:
+                continue
+            result = os.path.join(entry.path, "_result.pklz")
+            if not os.path.exists(result):
+                # still running or failed
+                continue
+            manifest = os.path.join(entry.path, manifest_name)
+            last_use = os.path.getmtime(result)
+            if os.path.exists(manifest):
+                last_use = max(last_use, os.path.getmtime(manifest))
+            if now - last_use > idle:
+                if self.compress_dir(entry.path):
+                    compacted.append(entry.name)
+                    if manager is not None:
+                        manager.refresh_size(entry.name)
+        return compacted
+
+    def compact_due(self, cache_dir, manager=None, keep=()):
+        """:meth:`compact` unless done for ``cache_dir`` within ``compact_interval``
+
+        Returns the names of the directories compressed.
+        """
+        if self.compact_interval is None:
+            return []
+        stamp = os.path.join(str(cache_dir), compact_stamp)
+        try:
+            if time.time() - os.stat(stamp).st_mtime < self.compact_interval:
+                return []
+        except FileNotFoundError:
+            pass
+        with open(stamp, "a"):
+            os.utime(stamp)
+        return self.compact(cache_dir, manager=manager, keep=keep)
@@ -0,0 +1,88 @@
+"""
+Multi-threaded gzip compression of SEM outputs.
+
+ITK writers compress ``.nii.gz`` outputs on a single thread. Instead, the
+tool can write an uncompressed file which is then compressed here in blocks
+on several threads (zlib releases the GIL). Like ``pigz --independent``, every
+block is a complete gzip member; multi-member files are standard gzip and
+are read by gzip, zlib, nibabel and ITK.
+"""
+import collections
+import concurrent.futures
+import os
+import zlib
+
+
+def available_cpus():
+    """Number of CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _gzip_member(block, compresslevel):
+    # wbits=31: deflate stream with a gzip header and trailer
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+def parallel_gzip(src, dst, threads=None, compresslevel=6, block_size=1 << 20):
+    """Compress ``src`` to ``dst`` as a multi-member gzip file
+
+    >>> import gzip, tempfile
+    >>> workdir = tempfile.mkdtemp()
+    >>> src = os.path.join(workdir, "volume.nii")
+    >>> with open(src, "wb") as f:
+    ...     _ = f.write(bytes(range(256)) * 10000)
+    >>> dst = parallel_gzip(src, src + ".gz", threads=4, block_size=100000)
+    >>> with gzip.open(dst) as f:
+    ...     f.read() == open(src, "rb").read()
+    True
+    """
+    threads = threads or available_cpus()
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            pending = collections.deque()
+            for block in iter(lambda: fsrc.read(block_size), b""):
+                pending.append(pool.submit(_gzip_member, block, compresslevel))
+                # bound the number of blocks held in memory
+                while len(pending) >= 2 * threads:
+                    fdst.write(pending.popleft().result())
+            while pending:
+                fdst.write(pending.popleft().result())
+    return dst
+
+
+def uncompressed_outputs(values):
+    """``values``, ``{field: path or list of paths}``, written as ``.nii`` rather than ``.nii.gz``
+
+    Returns the values and the ``{uncompressed: compressed}`` paths.
+
+    >>> uncompressed_outputs({"outputVolume": "out.nii.gz", "outputTransform": "t.h5"})
+    ({'outputVolume': 'out.nii', 'outputTransform': 't.h5'}, {'out.nii': 'out.nii.gz'})
+    """
+    compressed = {}
+
+    def uncompressed(path):
+        path = str(path)
+        if not path.endswith(".nii.gz"):
+            return path
+        compressed[path[: -len(".gz")]] = path
+        return path[: -len(".gz")]
+
+    values = {
+        name: [uncompressed(item) for item in value]
+        if isinstance(value, (list, tuple))
+        else uncompressed(value)
+        for name, value in values.items()
+    }
+    return values, compressed
+
+
+def compress_outputs(compressed, threads=None, compresslevel=6):
+    """Compress the ``{uncompressed: compressed}`` files written, removing the originals"""
+    for plain, path in compressed.items():
+        if os.path.exists(plain):
+            parallel_gzip(plain, path, threads=threads, compresslevel=compresslevel)
+            os.unlink(plain)
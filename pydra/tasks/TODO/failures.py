@@ -0,0 +1,169 @@
+"""
+Negative cache of deterministic SEM tool failures.
+
+Some failures only depend on the inputs: an image with a corrupt header, a
+landmark missing from a file or an invalid parameter make the tool fail the
+same way every time it runs. :class:`FailureCache` records them by task
+checksum and executable so resubmitting the workflow fails them immediately
+instead of running the tool again; changing the inputs or updating the tool
+changes the key, and :meth:`FailureCache.clear` forgets failures
+explicitly.
+
+Failures that may not happen again (killed by a signal, out of memory, I/O
+errors of the filesystem, any error not recognised below) are never cached.
+"""
+import functools
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import time
+
+from .locking import SqliteStore
+from .nodecache import sha256_file
+
+#: failure classes recognised from the stderr of the tools, in order; errors
+#: that a flaky network filesystem also causes ("Invalid argument", "Could
+#: not create IO object", ...) are left out
+failure_classes = [
+    ("usage", re.compile(r"PARSE ERROR|Required argument missing")),
+    (
+        "missing-landmark",
+        re.compile(r"landmark\S* (?:\S+ )?(?:not found|missing)", re.IGNORECASE),
+    ),
+    ("unreadable-input", re.compile(r"Unknown (?:image|file) format|[Cc]orrupt")),
+    ("itk-exception", re.compile(r"itk::\w*Exception|ExceptionObject caught")),
+]
+
+#: classes that fail again with the same inputs
+deterministic_classes = {"usage", "missing-landmark", "unreadable-input"}
+
+
+def classify_failure(return_code, stderr):
+    """Class of the failure of a tool exiting with ``return_code``
+
+    >>> classify_failure(1, "Unknown image format for t1.nii")
+    'unreadable-input'
+    >>> classify_failure(1, "Could not create IO object for reading file t1.nii")
+    'unknown'
+    >>> classify_failure(-9, "")
+    'signal'
+    >>> classify_failure(1, "Segmentation fault")
+    'unknown'
+    """
+    if return_code < 0 or return_code > 128:
+        # killed, e.g. by the OOM killer, the scheduler or a timeout
+        return "signal"
+    for name, pattern in failure_classes:
+        if pattern.search(stderr or ""):
+            return name
+    return "unknown"
+
+
+@functools.lru_cache()
+def _file_digest(path, size, mtime_ns):
+    return sha256_file(path)
+
+
+def executable_digest(executable):
+    """Digest of the file run as ``executable``, "" when it cannot be found
+
+    The digest is computed once per version (size and modification time)
+    of the file.
+    """
+    path = shutil.which(str(executable))
+    if path is None:
+        return ""
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    return _file_digest(path, st.st_size, st.st_mtime_ns)
+
+
+def failure_key(checksum, executable):
+    """Key of the failures of a task of ``checksum`` run by ``executable``
+
+    A new build of the tool gets new keys, its failures are not assumed.
+
+    >>> failure_key("8589cfe6", "/bin/true") == failure_key("8589cfe6", "/bin/false")
+    False
+    """
+    digest = executable_digest(executable)
+    return hashlib.sha256(f"{checksum}\0{digest}".encode()).hexdigest()
+
+
+class KnownFailureError(RuntimeError):
+    """The task already failed deterministically with the same inputs"""
+
+
+class FailureCache(SqliteStore):
+    """Deterministic failures stored in the sqlite database ``path``
+
+    The failures are recorded by key, see :func:`failure_key`.
+
+    >>> import os, tempfile
+    >>> cache = FailureCache(os.path.join(tempfile.mkdtemp(), "failures.sqlite"))
+    >>> cache.record("8589cfe6", "BRAINSResample", -9, "")
+    False
+    >>> cache.record("8589cfe6", "BRAINSResample", 1, "Unknown image format")
+    True
+    >>> cache.lookup("8589cfe6")["failure_class"]
+    'unreadable-input'
+    >>> cache.clear(tool="BRAINSResample")
+    1
+    >>> cache.lookup("8589cfe6")
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS failures ("
+        "key TEXT PRIMARY KEY, tool TEXT, return_code INTEGER, "
+        "failure_class TEXT, message TEXT, recorded REAL)"
+    ]
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = str(path)
+
+    def record(self, key, tool, return_code, stderr):
+        """Record the failure if it is deterministic, returns whether it was"""
+        failure_class = classify_failure(return_code, stderr)
+        if failure_class not in deterministic_classes:
+            return False
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, return_code, failure_class, stderr, time.time()),
+            )
+        return True
+
+    def lookup(self, key):
+        """The failure recorded for ``key`` as a dict, or None"""
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            row = db.execute("SELECT * FROM failures WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def check(self, key, tool):
+        """Raise :class:`KnownFailureError` when ``tool`` already failed for ``key``"""
+        known = self.lookup(key)
+        if known is not None:
+            raise KnownFailureError(
+                f"{tool} already failed with these inputs "
+                f"({known['failure_class']}, exit code {known['return_code']}), "
+                f"clear it from {self.path} to run it again:\n{known['message']}"
+            )
+
+    def clear(self, key=None, tool=None):
+        """Forget the failures of ``key`` and/or ``tool`` (all by default)"""
+        query, params = "DELETE FROM failures", []
+        conditions = []
+        if key is not None:
+            conditions.append("key = ?")
+            params.append(key)
+        if tool is not None:
+            conditions.append("tool = ?")
+            params.append(tool)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._connect() as db:
+            return db.execute(query, params).rowcount
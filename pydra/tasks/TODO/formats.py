@@ -0,0 +1,81 @@
+"""
+Output file format policy of the generated SEM tasks.
+
+Compressing NIfTI outputs is often the single largest cost of a tool run,
+while uncompressed outputs bloat the archive. The package-level
+:class:`OutputPolicy` decides, for the output filenames generated from the
+tool defaults, whether intermediates (consumed within a workflow) and
+terminal outputs are written compressed.
+"""
+
+# uncompressed extension -> compressed extension
+compressed_extensions = {".nii": ".nii.gz"}
+
+
+class OutputPolicy:
+    """Whether intermediate and terminal outputs are gzip-compressed"""
+
+    def __init__(self, compress_intermediate=False, compress_terminal=True):
+        self.compress_intermediate = compress_intermediate
+        self.compress_terminal = compress_terminal
+
+    def __repr__(self):
+        return (
+            f"OutputPolicy(compress_intermediate={self.compress_intermediate}, "
+            f"compress_terminal={self.compress_terminal})"
+        )
+
+
+_policy = OutputPolicy()
+
+
+def get_output_policy():
+    return _policy
+
+
+def set_output_policy(policy):
+    """Set the package-level policy, returns the previous one"""
+    global _policy
+    previous, _policy = _policy, policy
+    return previous
+
+
+def apply_output_policy(filename, terminal=False, policy=None):
+    """Switch ``filename`` to the compressed or uncompressed variant of its format
+
+    >>> apply_output_policy("outputVolume.nii.gz")
+    'outputVolume.nii'
+    >>> apply_output_policy("outputVolume.nii", terminal=True)
+    'outputVolume.nii.gz'
+    >>> apply_output_policy("outputTransform.h5", terminal=True)
+    'outputTransform.h5'
+    """
+    policy = policy or _policy
+    compress = policy.compress_terminal if terminal else policy.compress_intermediate
+    for plain, compressed in compressed_extensions.items():
+        if compress and filename.endswith(plain):
+            return filename[: -len(plain)] + compressed
+        if not compress and filename.endswith(compressed):
+            return filename[: -len(compressed)] + plain
+    return filename
+
+
+def resolve_output_filenames(inputs, defaults, terminal_outputs=(), policy=None):
+    """Replace the outputs requested with ``True`` by their default filename
+
+    ``defaults`` maps the output names of a tool to the filenames derived from
+    its XML, the policy picks their compression. Explicit filenames are kept.
+
+    >>> resolve_output_filenames(
+    ...     {"outputVolume": True, "outputTransform": "t.h5", "inputVolume": "in.nii"},
+    ...     {"outputVolume": "outputVolume.nii.gz", "outputTransform": "outputTransform.h5"},
+    ... )
+    {'outputVolume': 'outputVolume.nii', 'outputTransform': 't.h5', 'inputVolume': 'in.nii'}
+    """
+    resolved = dict(inputs)
+    for name, value in inputs.items():
+        if value is True and name in defaults:
+            resolved[name] = apply_output_policy(
+                defaults[name], terminal=name in terminal_outputs, policy=policy
+            )
+    return resolved
@@ -0,0 +1,120 @@
+"""
+Historical runtimes and memory usage of SEM tools.
+
+The history is a small JSON document shared by all the processes of a node
+(or of a cluster when it lives on a shared filesystem); updates are
+serialised with an ``fcntl`` lock on ``<path>.lock``.
+"""
+import json
+import math
+import os
+import time
+
+from .locking import file_lock
+
+
+def percentile(values, q):
+    """Return the ``q``-th percentile (0-100) of ``values``, linearly interpolated
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2.5
+    >>> percentile([10, 20, 30, 40, 50], 90)
+    46.0
+    """
+    values = sorted(values)
+    if not values:
+        raise ValueError("percentile of an empty sequence")
+    rank = (len(values) - 1) * q / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class RuntimeHistory:
+    """Wall-clock durations and peak memory of the runs of each tool
+
+    Only the last ``max_samples`` values of each kind are kept per tool, and
+    only the out of memory kills of the last ``oom_max_age`` seconds raise
+    the memory estimate: a run killed once next to a memory hog, or with an
+    unusual input, does not inflate the reservations of the tool for good.
+
+    >>> import os, tempfile
+    >>> history = RuntimeHistory(os.path.join(tempfile.mkdtemp(), "history.json"))
+    >>> history.record_memory("BRAINSABC", 3000)
+    >>> history.record_memory("BRAINSABC", 4000, oom=True)
+    >>> history.memory_estimate("BRAINSABC", min_samples=1)
+    4800.0
+    >>> history.oom_max_age = 0
+    >>> history.memory_estimate("BRAINSABC", min_samples=1)
+    3600.0
+    """
+
+    def __init__(self, path, max_samples=500, oom_max_age=7 * 24 * 3600):
+        self.path = str(path)
+        self.max_samples = max_samples
+        self.oom_max_age = oom_max_age
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, data):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def _samples(self, tool, kind):
+        return self._read().get(tool, {}).get(kind, [])
+
+    def _append(self, tool, kind, value):
+        with file_lock(f"{self.path}.lock"):
+            data = self._read()
+            samples = data.setdefault(tool, {}).setdefault(kind, [])
+            samples.append(value)
+            del samples[: -self.max_samples]
+            self._write(data)
+
+    def durations(self, tool):
+        return self._samples(tool, "durations")
+
+    def record(self, tool, duration):
+        self._append(tool, "durations", duration)
+
+    def record_memory(self, tool, memory_mb, oom=False):
+        """Record the peak memory of a successful run, or the memory of a run killed out of memory"""
+        if oom:
+            self._append(tool, "oom_memory", [memory_mb, time.time()])
+        else:
+            self._append(tool, "peak_memory", memory_mb)
+
+    def memory_estimate(self, tool, q=95, min_samples=10, margin=1.2):
+        """Memory (MB) to reserve for ``tool``, None without enough history
+
+        ``margin`` times the ``q``-th percentile of the peak memory of the
+        successful runs, or of the largest memory a run was recently killed
+        at.
+        """
+        peaks = self._samples(tool, "peak_memory")
+        now = time.time()
+        ooms = [
+            memory
+            for memory, killed in self._samples(tool, "oom_memory")
+            if now - killed <= self.oom_max_age
+        ]
+        estimates = [max(ooms)] if ooms else []
+        if peaks and len(peaks) >= min_samples:
+            estimates.append(percentile(peaks, q))
+        if not estimates:
+            return None
+        return margin * max(estimates)
+
+    def threshold(self, tool, q, min_samples=10):
+        """``q``-th percentile of the durations of ``tool``, None without enough history"""
+        durations = self.durations(tool)
+        if not durations or len(durations) < min_samples:
+            return None
+        return percentile(durations, q)
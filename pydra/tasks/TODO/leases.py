@@ -0,0 +1,174 @@
+"""
+Leases deduplicating identical SEM task runs across processes.
+
+pydra only serialises identical runs sharing a ``cache_dir``. Workflows of
+different users submitting the same run each have their own cache, so
+:class:`LeaseRegistry` keeps the runs in flight, by task checksum, in a
+sqlite database they all share: the first invocation takes the lease and
+runs the tool, the others wait for it to be released and reuse its result.
+
+A lease is renewed by its holder while the tool runs and expires ``ttl``
+seconds after the last renewal, so the lease of a crashed process is taken
+over instead of blocking the other invocations forever. A waiting
+invocation records where the result it reused lives next to its own task
+directory (see :func:`record_result_dir`), where its ``result()`` finds it.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .locking import SqliteStore
+
+
+#: suffix of the file next to a task directory naming the directory of its result
+pointer_suffix = ".result_dir"
+
+
+def record_result_dir(task_dir, result_dir):
+    """Record that the result of ``task_dir`` was computed in ``result_dir``"""
+    path = f"{task_dir}{pointer_suffix}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+        f.write(str(result_dir))
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def recorded_result_dir(task_dir):
+    """Directory recorded for the result of ``task_dir``, or None
+
+    >>> import tempfile
+    >>> task_dir = os.path.join(tempfile.mkdtemp(), "SEMShellCommandTask_8589cfe6")
+    >>> recorded_result_dir(task_dir) is None
+    True
+    >>> record_result_dir(task_dir, "/cache/a/SEMShellCommandTask_8589cfe6")
+    >>> recorded_result_dir(task_dir)
+    '/cache/a/SEMShellCommandTask_8589cfe6'
+    """
+    try:
+        with open(f"{task_dir}{pointer_suffix}") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class Lease:
+    """Lease held on ``key`` by ``owner``, renewed in the background while entered"""
+
+    def __init__(self, registry, key, owner):
+        self.registry = registry
+        self.key = key
+        self.owner = owner
+        self._stop = threading.Event()
+        self._renewer = threading.Thread(target=self._renew, daemon=True)
+
+    def _renew(self):
+        while not self._stop.wait(self.registry.ttl / 3):
+            self.registry.renew(self.key, self.owner)
+
+    def __enter__(self):
+        self._renewer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def release(self):
+        self._stop.set()
+        if self._renewer.is_alive():
+            self._renewer.join()
+        self.registry.release(self.key, self.owner)
+
+
+class LeaseRegistry(SqliteStore):
+    """Leases of the runs in flight, stored in the sqlite database ``path``
+
+    Every lease has an owner of its own, so the tasks of the threads of a
+    process sharing a registry never renew or release each other's leases.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "leases.sqlite")
+    >>> registry = LeaseRegistry(path, poll=0.01)
+    >>> lease = registry.acquire("8589cfe6", "/cache/a/SEMShellCommandTask_8589cfe6")
+    >>> registry.acquire("8589cfe6", "/cache/b/SEMShellCommandTask_8589cfe6")
+    >>> registry.holder("8589cfe6")
+    '/cache/a/SEMShellCommandTask_8589cfe6'
+    >>> threading.Timer(0.1, lease.release).start()
+    >>> registry.wait("8589cfe6")
+    '/cache/a/SEMShellCommandTask_8589cfe6'
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS leases ("
+        "key TEXT PRIMARY KEY, owner TEXT, task_dir TEXT, expires REAL)"
+    ]
+    autocommit = True
+
+    def __init__(self, path, ttl=60, poll=1.0):
+        super().__init__(path)
+        self.path = str(path)
+        self.ttl = ttl
+        self.poll = poll
+
+    def acquire(self, key, task_dir):
+        """:class:`Lease` on ``key`` for a run in ``task_dir``, None if held elsewhere"""
+        now = time.time()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        with self._connect() as db:
+            # check and take the lease in one write transaction
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT expires FROM leases WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                return None
+            # free, or left behind by a holder that stopped renewing it
+            db.execute(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)",
+                (key, owner, str(task_dir), now + self.ttl),
+            )
+        return Lease(self, key, owner)
+
+    def renew(self, key, owner):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE leases SET expires = ? WHERE key = ? AND owner = ?",
+                (time.time() + self.ttl, key, owner),
+            )
+
+    def release(self, key, owner):
+        with self._connect() as db:
+            db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def holder(self, key):
+        """Directory where the run holding ``key`` writes its result, or None"""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT task_dir, expires FROM leases WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def wait(self, key, timeout=None):
+        """Wait for the run holding ``key`` to end, returns its directory
+
+        Returns None when no run held the lease, when it expired (its holder
+        died) or when ``timeout`` seconds went by.
+        """
+        start = time.monotonic()
+        task_dir = None
+        while True:
+            holder = self.holder(key)
+            if holder is None:
+                with self._connect() as db:
+                    stale = db.execute(
+                        "SELECT 1 FROM leases WHERE key = ?", (key,)
+                    ).fetchone()
+                return None if stale else task_dir
+            # the lease may have been taken over by another run meanwhile
+            task_dir = holder
+            if timeout is not None and time.monotonic() - start > timeout:
+                return None
+            time.sleep(self.poll)
@@ -0,0 +1,153 @@
+"""
+Enforced memory and CPU limits of SEM tool processes.
+
+:class:`ResourceLimits` applies the resources declared for a task to the
+child process: ``RLIMIT_CPU`` and, when a delegated cgroup v2 directory is
+given, ``memory.max`` and ``cpu.max`` of a cgroup created for the child;
+``RLIMIT_DATA`` or ``RLIMIT_AS`` bound its memory where no cgroup can. The
+limits are applied by the parent right after the child started: no Python
+code runs between fork and exec.
+"""
+import logging
+import os
+import resource
+import uuid
+
+from .memory import memory_events
+
+logger = logging.getLogger(__name__)
+
+cpu_period = 100000
+
+
+def cgroup_controllers(directory):
+    """Controllers enabled for the children of the cgroup ``directory``"""
+    try:
+        with open(os.path.join(directory, "cgroup.subtree_control")) as f:
+            return set(f.read().split())
+    except OSError:
+        return set()
+
+
+class ResourceLimits:
+    """Limits of one child process
+
+    memory_mb: ``memory.max`` of the cgroup.
+    cpus: number of CPUs the child may use (``cpu.max``), cgroup only.
+    cpu_seconds: CPU time limit of the child, summed over its threads.
+    cgroup_parent: cgroup v2 directory delegated to the user, with the
+        memory and cpu controllers enabled for its children, where the
+        cgroup of the child is created. Without it only ``cpu_seconds``
+        and ``memory_rlimit`` apply.
+    memory_rlimit: ``"RLIMIT_DATA"`` or ``"RLIMIT_AS"``, set to
+        ``memory_headroom`` times ``memory_mb`` when no cgroup enforces
+        ``memory.max``; off by default. The address space (and to a lesser
+        extent the data segment) of ITK tools is much larger than their
+        resident memory, so the headroom is a guess per tool rather than a
+        bound on its resident memory; an allocation beyond it fails (see
+        :func:`~.memory.is_oom_kill`) instead of the tool being killed.
+    memory_headroom: factor applied to ``memory_mb`` for ``memory_rlimit``.
+
+    A warning is logged when ``memory_mb`` is given but enforced neither by a
+    cgroup nor by ``memory_rlimit``.
+
+    >>> import subprocess
+    >>> limits = ResourceLimits(memory_mb=1024, cpu_seconds=60)
+    >>> limits.create()
+    >>> limits.rlimits()
+    {'RLIMIT_CPU': 60}
+    >>> child = subprocess.Popen(["sleep", "10"])
+    >>> limits.apply(child.pid)
+    >>> resource.prlimit(child.pid, resource.RLIMIT_CPU)[0]
+    60
+    >>> child.kill()
+    >>> child.wait()
+    -9
+    >>> limits.release()
+    >>> limits = ResourceLimits(memory_mb=1024, memory_rlimit="RLIMIT_DATA")
+    >>> limits.create()
+    >>> limits.rlimits()
+    {'RLIMIT_DATA': 4294967296}
+    """
+
+    def __init__(
+        self,
+        memory_mb=None,
+        cpus=None,
+        cpu_seconds=None,
+        cgroup_parent=None,
+        memory_rlimit=None,
+        memory_headroom=4.0,
+    ):
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+        self.cpu_seconds = cpu_seconds
+        self.cgroup_parent = cgroup_parent
+        self.memory_rlimit = memory_rlimit
+        self.memory_headroom = memory_headroom
+        self.cgroup = None
+        self.memory_cgroup = False
+        self.events = None
+
+    def rlimits(self):
+        limits = {}
+        if self.cpu_seconds:
+            limits["RLIMIT_CPU"] = int(self.cpu_seconds)
+        if self.memory_mb and self.memory_rlimit and not self.memory_cgroup:
+            memory = self.memory_headroom * self.memory_mb * 2 ** 20
+            limits[self.memory_rlimit] = int(memory)
+        return limits
+
+    def create(self):
+        """Create the cgroup of the child, if a ``cgroup_parent`` is usable"""
+        self._create_cgroup()
+        if self.memory_mb and not (self.memory_cgroup or self.memory_rlimit):
+            logger.warning(
+                "memory_mb=%s is not enforced: no cgroup with the memory "
+                "controller under cgroup_parent=%r and no memory_rlimit",
+                self.memory_mb,
+                self.cgroup_parent,
+            )
+
+    def _create_cgroup(self):
+        if self.cgroup_parent is None or not (self.memory_mb or self.cpus):
+            return
+        controllers = cgroup_controllers(self.cgroup_parent)
+        if not {"memory", "cpu"} & controllers:
+            return
+        cgroup = os.path.join(self.cgroup_parent, f"sem-{uuid.uuid4().hex[:12]}")
+        os.mkdir(cgroup)
+        if self.memory_mb and "memory" in controllers:
+            with open(os.path.join(cgroup, "memory.max"), "w") as f:
+                f.write(str(int(self.memory_mb * 2 ** 20)))
+            self.memory_cgroup = True
+        if self.cpus and "cpu" in controllers:
+            with open(os.path.join(cgroup, "cpu.max"), "w") as f:
+                f.write(f"{int(self.cpus * cpu_period)} {cpu_period}")
+        self.cgroup = cgroup
+
+    def apply(self, pid):
+        """Applies the limits to the child ``pid``, from the parent
+
+        Raises :class:`ProcessLookupError` when the child already exited.
+        """
+        for name, value in self.rlimits().items():
+            limit = getattr(resource, name)
+            hard = resource.prlimit(pid, limit)[1]
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.prlimit(pid, limit, (value, hard))
+        if self.cgroup is not None:
+            with open(os.path.join(self.cgroup, "cgroup.procs"), "w") as f:
+                f.write(str(pid))
+
+    def release(self):
+        """Remove the cgroup once the child exited, keeping its ``events``"""
+        if self.cgroup is None:
+            return
+        self.events = memory_events(self.cgroup)
+        try:
+            os.rmdir(self.cgroup)
+        except OSError:
+            pass
+        self.cgroup = None
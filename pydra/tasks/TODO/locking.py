@@ -0,0 +1,131 @@
+"""
+Databases and locks shared by the processes running SEM tasks.
+
+The stores of this package (cache index, blob references, leases, memory
+and core reservations, ...) are small sqlite databases that every process
+of a node, or of a cluster, opens concurrently. :class:`SqliteStore` holds
+what they have in common: the creation of their tables, connections that
+are closed after every use and the reaping of the rows left behind by dead
+processes. :func:`file_lock` serialises updates of plain files and
+:func:`hold_lock` protects entries that other processes may remove.
+"""
+import contextlib
+import fcntl
+import os
+import socket
+import sqlite3
+
+
+def pid_alive(pid):
+    """Whether the process ``pid`` of this host still exists
+
+    >>> pid_alive(os.getpid())
+    True
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive ``fcntl`` lock on the file ``path`` (created if needed)"""
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def hold_lock(path, shared=False, blocking=True):
+    """Open the lock file ``path`` and ``fcntl`` lock it, returns the open file
+
+    The lock is released when the file is closed. Unless ``blocking``,
+    raises :class:`BlockingIOError` when another process holds the lock. A
+    holder of the exclusive lock may remove ``path``: the lock is taken
+    again on the new file when that happened while waiting for it.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "entry.lock")
+    >>> reader = hold_lock(path, shared=True)
+    >>> hold_lock(path, blocking=False)
+    Traceback (most recent call last):
+    ...
+    BlockingIOError: [Errno 11] Resource temporarily unavailable
+    >>> reader.close()
+    >>> hold_lock(path, blocking=False).close()
+    """
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    while True:
+        lock = open(path, "a")
+        try:
+            fcntl.flock(lock, operation)
+            if os.path.samestat(os.fstat(lock.fileno()), os.stat(path)):
+                return lock
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            lock.close()
+            raise
+        lock.close()
+
+
+class SqliteStore:
+    """Base of the stores kept in the sqlite database ``db_path``
+
+    ``schema`` lists the statements creating the tables of the store. With
+    ``autocommit``, statements run outside of transactions unless one is
+    started explicitly, e.g. with ``BEGIN IMMEDIATE`` to read and write
+    atomically.
+
+    >>> import tempfile
+    >>> class Counters(SqliteStore):
+    ...     schema = ["CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY)"]
+    >>> store = Counters(os.path.join(tempfile.mkdtemp(), "counters.sqlite"))
+    >>> with store._connect() as db:
+    ...     _ = db.execute("INSERT INTO counters VALUES ('a')")
+    >>> with store._connect() as db:
+    ...     db.execute("SELECT name FROM counters").fetchall()
+    [('a',)]
+    """
+
+    schema = []
+    autocommit = False
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        with self._connect() as db:
+            for statement in self.schema:
+                db.execute(statement)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connection committed when the block succeeds, and closed"""
+        db = sqlite3.connect(
+            self.db_path, timeout=60, isolation_level=None if self.autocommit else ""
+        )
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _reap_dead(db, table, key):
+        """Delete the rows of ``table`` held by dead processes of this host
+
+        The rows have ``host`` and ``pid`` columns, ``key`` identifies them.
+        """
+        rows = db.execute(
+            f"SELECT {key}, pid FROM {table} WHERE host = ?", (socket.gethostname(),)
+        ).fetchall()
+        dead = [(row_key,) for row_key, pid in rows if not pid_alive(pid)]
+        db.executemany(f"DELETE FROM {table} WHERE {key} = ?", dead)
+        return len(dead)
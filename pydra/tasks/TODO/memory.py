@@ -0,0 +1,169 @@
+"""
+Out-of-memory detection and node memory reservations for SEM tools.
+
+Large BRAINSABC or gtract* runs are sometimes killed by the kernel OOM
+killer. :func:`is_oom_kill` recognises these kills from the exit signal and
+the ``oom_kill`` counter of the cgroup v2 ``memory.events``, and
+:class:`MemoryBudget` lets the tasks running on a node reserve memory so
+that a run retried with a larger reservation has fewer concurrent
+neighbours.
+"""
+import contextlib
+import os
+import re
+import signal
+import socket
+import time
+import uuid
+
+from .locking import SqliteStore
+
+
+def cgroup_dir(pid="self"):
+    """cgroup v2 directory of process ``pid``, None outside cgroup v2"""
+    try:
+        with open(f"/proc/{pid}/cgroup") as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip("\n").split(":", 2)
+                if hierarchy == "0" and not controllers:
+                    directory = os.path.join("/sys/fs/cgroup", path.lstrip("/"))
+                    if os.path.isdir(directory):
+                        return directory
+    except OSError:
+        pass
+    return None
+
+
+def memory_events(directory=None):
+    """Counters of ``memory.events`` of the cgroup ``directory`` (ours by default)"""
+    directory = directory or cgroup_dir()
+    if directory is None:
+        return None
+    try:
+        with open(os.path.join(directory, "memory.events")) as f:
+            return {key: int(value) for key, value in (line.split() for line in f)}
+    except OSError:
+        return None
+
+
+allocation_failure = re.compile(r"std::bad_alloc|Cannot allocate memory|MemoryError")
+
+
+def is_oom_kill(return_code, events_before=None, events_after=None, stderr=None):
+    """Whether a run exiting with ``return_code`` was killed out of memory
+
+    ``events_before``/``events_after`` are the :func:`memory_events` of the
+    cgroup of the run; without them a SIGKILL is assumed to be an OOM kill.
+    A failed allocation reported on ``stderr`` counts as well.
+
+    >>> is_oom_kill(-9)
+    True
+    >>> is_oom_kill(-9, {"oom_kill": 2}, {"oom_kill": 2})
+    False
+    >>> is_oom_kill(1)
+    False
+    >>> is_oom_kill(1, stderr="terminate called after throwing 'std::bad_alloc'")
+    True
+    """
+    if return_code > 0 and stderr and allocation_failure.search(stderr):
+        return True
+    if events_before is not None and events_after is not None:
+        if events_after.get("oom_kill", 0) > events_before.get("oom_kill", 0):
+            return True
+        # killed by someone else (scheduler, timeout)
+        return False
+    # 137: killed child of a shell
+    return return_code in (-signal.SIGKILL, 128 + signal.SIGKILL)
+
+
+def killed_at(return_code, memory_mb=None, peak_rss_mb=None, events=None, stderr=None):
+    """Memory (MB) at which a run was killed out of memory, None when it was not
+
+    The largest of the ``memory_mb`` reserved and the ``peak_rss_mb`` of the
+    run, 0 when neither is known. ``events`` are the :func:`memory_events` of
+    the cgroup of the run alone (see :func:`is_oom_kill`).
+
+    >>> killed_at(-9, 2048, 1900.5)
+    2048
+    >>> killed_at(-9, None, None)
+    0
+    >>> killed_at(-9, 2048, events={"oom_kill": 0}) is None
+    True
+    >>> killed_at(0, 2048) is None
+    True
+    """
+    # only the cgroup of the run tells its own kills from the ones of its
+    # neighbours, a SIGKILL is taken for one otherwise
+    before = {} if events else None
+    if return_code == 0 or not is_oom_kill(return_code, before, events, stderr):
+        return None
+    return max(memory_mb or 0, peak_rss_mb or 0)
+
+
+def total_memory_mb():
+    """Physical memory of the node in MB"""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 ** 20
+
+
+class MemoryBudget(SqliteStore):
+    """Memory reservations of the tasks of a node, in the sqlite database ``path``
+
+    ``path`` must be node-local. A reservation waits until it fits in
+    ``total_mb`` (the physical memory by default) next to the others; a
+    reservation larger than the budget runs once it is alone.
+
+    >>> import tempfile
+    >>> budget = MemoryBudget(os.path.join(tempfile.mkdtemp(), "memory.sqlite"), 1000)
+    >>> with budget.reserve(600):
+    ...     budget.reserved()
+    600.0
+    >>> budget.reserved()
+    0
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS reservations ("
+        "id TEXT PRIMARY KEY, host TEXT, pid INTEGER, memory_mb REAL)"
+    ]
+    autocommit = True
+
+    def __init__(self, path, total_mb=None, poll=1.0):
+        super().__init__(path)
+        self.path = str(path)
+        self.total_mb = total_mb if total_mb is not None else total_memory_mb()
+        self.poll = poll
+
+    def reserved(self):
+        """Memory (MB) reserved by the tasks alive"""
+        with self._connect() as db:
+            return db.execute(
+                "SELECT COALESCE(SUM(memory_mb), 0) FROM reservations"
+            ).fetchone()[0]
+
+    def _try_reserve(self, reservation, memory_mb):
+        host = socket.gethostname()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._reap_dead(db, "reservations", "id")
+            used, count = db.execute(
+                "SELECT COALESCE(SUM(memory_mb), 0), COUNT(*) FROM reservations"
+            ).fetchone()
+            if count and used + memory_mb > self.total_mb:
+                return False
+            db.execute(
+                "INSERT INTO reservations VALUES (?, ?, ?, ?)",
+                (reservation, host, os.getpid(), memory_mb),
+            )
+        return True
+
+    @contextlib.contextmanager
+    def reserve(self, memory_mb):
+        """Hold ``memory_mb`` MB of the budget, waiting for it to be available"""
+        reservation = uuid.uuid4().hex
+        while not self._try_reserve(reservation, float(memory_mb)):
+            time.sleep(self.poll)
+        try:
+            yield
+        finally:
+            with self._connect() as db:
+                db.execute("DELETE FROM reservations WHERE id = ?", (reservation,))
@@ -0,0 +1,185 @@
+"""
+Prometheus metrics of the SEM tasks run by a process.
+
+:class:`MetricsRegistry` observes the events of the tasks (see
+:mod:`~.tracing`) and keeps, per tool:
+
+- ``sem_phase_in_progress``: phases in progress, e.g. the tasks running
+  (``phase="task"``) or waiting for an identical run (``phase="waiting"``)
+  or for cores and memory (``phase="reserving"``);
+- ``sem_phase_seconds``: histograms of the duration of the phases, the
+  runtime of the tools being ``phase="running"``;
+- ``sem_tasks_total``: tasks by ``outcome`` (executed, cached, errored),
+  from which the cache hit rate follows;
+- ``sem_hashed_bytes_total``: size of the input files hashed, to be divided
+  by the ``hashing`` seconds for a hashing rate;
+- ``sem_oom_retries_total``: runs retried after running out of memory;
+
+and, per worker queue, ``sem_queue_depth``: tasks submitted to the worker
+(e.g. a :class:`~.workers.ForkserverWorker`) waiting for a free process.
+
+:func:`serve` exposes them in the Prometheus text format on a local HTTP
+port, no external service needed.
+"""
+import bisect
+import collections
+import http.server
+import math
+import threading
+
+from .tracing import add_observer
+
+default_buckets = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200)
+
+
+def _labels(**labels):
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """Metrics of the task events it observes
+
+    >>> from pydra.tasks.TODO.tracing import TaskEvent
+    >>> registry = MetricsRegistry(buckets=(1, 10))
+    >>> registry(TaskEvent("running", "resample", "BRAINSResample", 0.0, 2.5, 1, 1,
+    ...                    {"return_code": 0}))
+    >>> print(registry.exposition())  # doctest: +ELLIPSIS
+    # HELP sem_phase_in_progress ...
+    sem_phase_seconds_bucket{tool="BRAINSResample",phase="running",le="1"} 0
+    sem_phase_seconds_bucket{tool="BRAINSResample",phase="running",le="10"} 1
+    sem_phase_seconds_bucket{tool="BRAINSResample",phase="running",le="+Inf"} 1
+    sem_phase_seconds_sum{tool="BRAINSResample",phase="running"} 2.5
+    sem_phase_seconds_count{tool="BRAINSResample",phase="running"} 1
+    ...
+    >>> registry.queue_changed("forkserver", 3)
+    >>> print(registry.exposition())  # doctest: +ELLIPSIS
+    # HELP ...
+    sem_queue_depth{queue="forkserver"} 3
+    <BLANKLINE>
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.in_progress = collections.Counter()
+        # (tool, phase) -> [count per bucket + overflow, sum, count]
+        self.histograms = {}
+        self.tasks = collections.Counter()
+        self.hashed_bytes = collections.Counter()
+        self.oom_retries = collections.Counter()
+        self.queue_depths = {}
+
+    def phase_started(self, event):
+        with self._lock:
+            self.in_progress[event.tool, event.name] += 1
+
+    def queue_changed(self, queue, depth):
+        with self._lock:
+            self.queue_depths[queue] = depth
+
+    def __call__(self, event):
+        key = event.tool, event.name
+        with self._lock:
+            if self.in_progress[key] > 0:
+                self.in_progress[key] -= 1
+            if event.name == "oom":
+                self.oom_retries[event.tool] += 1
+                return
+            histogram = self.histograms.setdefault(
+                key, [[0] * (len(self.buckets) + 1), 0.0, 0]
+            )
+            histogram[0][bisect.bisect_left(self.buckets, event.duration)] += 1
+            histogram[1] += event.duration
+            histogram[2] += 1
+            if event.name == "hashing":
+                self.hashed_bytes[event.tool] += event.args.get("bytes", 0)
+            elif event.name == "task":
+                if event.args.get("errored") or event.args.get("error"):
+                    outcome = "errored"
+                elif event.args.get("executed"):
+                    outcome = "executed"
+                else:
+                    outcome = "cached"
+                self.tasks[event.tool, outcome] += 1
+
+    def exposition(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header("sem_phase_in_progress", "gauge", "Task phases in progress.")
+            for (tool, name), value in sorted(self.in_progress.items()):
+                lines.append(
+                    f"sem_phase_in_progress{_labels(tool=tool, phase=name)} {value}"
+                )
+            header("sem_phase_seconds", "histogram", "Duration of the task phases.")
+            for (tool, name), (counts, total, count) in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    labels = _labels(tool=tool, phase=name, le=le)
+                    lines.append(f"sem_phase_seconds_bucket{labels} {cumulative}")
+                labels = _labels(tool=tool, phase=name)
+                lines.append(f"sem_phase_seconds_sum{labels} {total:g}")
+                lines.append(f"sem_phase_seconds_count{labels} {count}")
+            header("sem_tasks_total", "counter", "Tasks run, by outcome.")
+            for (tool, outcome), value in sorted(self.tasks.items()):
+                lines.append(
+                    f"sem_tasks_total{_labels(tool=tool, outcome=outcome)} {value}"
+                )
+            header("sem_hashed_bytes_total", "counter", "Bytes of input files hashed.")
+            for tool, value in sorted(self.hashed_bytes.items()):
+                lines.append(f"sem_hashed_bytes_total{_labels(tool=tool)} {value}")
+            header("sem_oom_retries_total", "counter", "Runs retried out of memory.")
+            for tool, value in sorted(self.oom_retries.items()):
+                lines.append(f"sem_oom_retries_total{_labels(tool=tool)} {value}")
+            header("sem_queue_depth", "gauge", "Tasks waiting for a worker process.")
+            for queue, value in sorted(self.queue_depths.items()):
+                lines.append(f"sem_queue_depth{_labels(queue=queue)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=9464, host="127.0.0.1", registry=None):
+    """Observe the tasks of this process and serve their metrics on ``host:port``
+
+    Returns the HTTP server, running in a daemon thread; ``server.registry``
+    is the :class:`MetricsRegistry` (a new one by default).
+    """
+    registry = registry if registry is not None else MetricsRegistry()
+    add_observer(registry)
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
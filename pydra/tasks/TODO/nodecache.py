@@ -0,0 +1,84 @@
+"""
+Read-only, content-addressed node cache of constant task inputs.
+
+Models and atlases (``inputTemplateModel``, ``llsModel``, ...) are the same
+for every subject. They are stored once per node under
+``<root>/objects/<digest>/<file name>`` and every task reads them from there.
+The digest of a file version is remembered in ``<root>/index.sqlite`` under
+its stat signature, so a file is hashed only the first time it is seen.
+"""
+import hashlib
+import os
+import stat
+
+from .locking import SqliteStore, file_lock
+from .staging import _stat_key, link_or_copy
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class NodeCache(SqliteStore):
+    """Content-addressed store of constant inputs rooted at ``root``"""
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS digests (stat_key TEXT PRIMARY KEY, digest TEXT)"
+    ]
+
+    def __init__(self, root):
+        self.root = str(root)
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        super().__init__(os.path.join(self.root, "index.sqlite"))
+
+    def digest(self, path):
+        """sha256 of ``path``, computed once per file version"""
+        key = _stat_key(path)
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT digest FROM digests WHERE stat_key = ?", (key,)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        digest = sha256_file(path)
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?)", (key, digest))
+        return digest
+
+    def materialize(self, path):
+        """Return the read-only cached copy of ``path``, storing it if needed"""
+        digest = self.digest(path)
+        object_dir = os.path.join(self.root, "objects", digest[:2], digest)
+        cached = os.path.join(object_dir, os.path.basename(path))
+        if os.path.exists(cached):
+            return cached
+        os.makedirs(object_dir, exist_ok=True)
+        with file_lock(f"{object_dir}.lock"):
+            if not os.path.exists(cached):
+                tmp = f"{cached}.{os.getpid()}.tmp"
+                # cached objects are snapshots of their content, never hard links
+                link_or_copy(path, tmp, hardlink=False)
+                mode = os.stat(tmp).st_mode
+                os.chmod(tmp, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                os.replace(tmp, cached)
+        return cached
+
+    def materialize_values(self, values):
+        """``values``, ``{field: path or list of paths}``, read from the cache
+
+        Only the files are cached, other paths are kept.
+        """
+
+        def cached(path):
+            return self.materialize(str(path)) if os.path.isfile(path) else path
+
+        return {
+            name: [cached(item) for item in value]
+            if isinstance(value, (list, tuple))
+            else cached(value)
+            for name, value in values.items()
+        }
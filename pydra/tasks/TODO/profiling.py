@@ -0,0 +1,95 @@
+"""
+Python overhead of SEM tasks, separated from the runtime of the tools.
+
+:class:`OverheadProfiler` observes the phases reported by the tasks (see
+:mod:`~.tracing`) and breaks the time spent around each tool down into
+spec construction, input hashing, preparation of the output directory,
+command line formatting, output collection and result pickling.
+Optionally the runs are profiled with ``cProfile`` as well.
+"""
+import collections
+import cProfile
+import io
+import pstats
+
+from .tracing import add_observer, remove_observer
+
+#: phases spent in Python rather than in the tool, in the order they happen
+python_phases = [
+    "building",
+    "hashing",
+    "preparing",
+    "formatting",
+    "collecting",
+    "saving",
+]
+
+
+class OverheadProfiler:
+    """Durations of the phases of the tasks run within ``with profiler:``
+
+    With ``cprofile`` the calling thread is profiled with ``cProfile`` as
+    well, see :meth:`stats`; tasks run by worker processes are only timed
+    when the profiler is entered in the worker.
+
+    >>> from pydra.tasks.TODO.tracing import TaskEvent
+    >>> profiler = OverheadProfiler()
+    >>> for name, duration in [("hashing", 0.002), ("running", 0.010)]:
+    ...     profiler(TaskEvent(name, "threshold", "ThresholdScalarVolume",
+    ...                        0.0, duration, 1, 1, {}))
+    >>> profiler.summary()["ThresholdScalarVolume"]["overhead"]
+    0.002
+    """
+
+    def __init__(self, cprofile=False):
+        self.durations = collections.defaultdict(lambda: collections.defaultdict(list))
+        self.profile = cProfile.Profile() if cprofile else None
+
+    def __call__(self, event):
+        self.durations[event.tool][event.name].append(event.duration)
+
+    def __enter__(self):
+        add_observer(self)
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+        remove_observer(self)
+
+    def summary(self):
+        """``{tool: {phase: mean seconds}}`` with the ``overhead`` of each tool
+
+        ``overhead`` is the sum of the means of the :data:`python_phases`,
+        ``running`` the mean runtime of the tool itself.
+        """
+        summary = {}
+        for tool, phases in self.durations.items():
+            means = {name: sum(values) / len(values) for name, values in phases.items()}
+            means["overhead"] = sum(means.get(name, 0.0) for name in python_phases)
+            summary[tool] = means
+        return summary
+
+    def report(self):
+        """Table of the mean durations per tool and phase, in milliseconds"""
+        columns = python_phases + ["overhead", "running"]
+        lines = [f"{'tool':40s}" + "".join(f"{name:>11s}" for name in columns)]
+        for tool, means in sorted(self.summary().items()):
+            lines.append(
+                f"{tool:40s}"
+                + "".join(
+                    f"{means[name] * 1000:11.2f}" if name in means else f"{'-':>11s}"
+                    for name in columns
+                )
+            )
+        return "\n".join(lines)
+
+    def stats(self, sort="cumulative", limit=30):
+        """``cProfile`` statistics of the profiled runs, as text"""
+        if self.profile is None:
+            raise RuntimeError("the profiler was created without cprofile=True")
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,204 @@
+"""
+Parsing of the progress markers printed by Slicer Execution Model tools.
+
+SEM executables report their progress on stdout with XML fragments::
+
+    <filter-start>
+    <filter-name>BRAINSFit</filter-name>
+    <filter-comment> Registering </filter-comment>
+    </filter-start>
+    <filter-progress>0.5</filter-progress>
+    <filter-stage-progress>0.25</filter-stage-progress>
+    <filter-end>
+    <filter-name>BRAINSFit</filter-name>
+    <filter-time>12.3</filter-time>
+    </filter-end>
+
+:class:`FilterProgressParser` parses them incrementally from the child stream
+into a :class:`ProgressState`. The state of every running
+``SEMShellCommandTask`` is listed by :func:`active_progress`.
+"""
+import re
+import threading
+import time
+
+_open_re = re.compile(r"<filter-(progress|stage-progress|start|end)>")
+_field_re = re.compile(r"<filter-(name|comment|time)>(.*?)</filter-\1>", re.S)
+
+# longest tail kept while waiting for the rest of a fragment
+_max_pending = 64 * 1024
+
+
+def _to_float(value):
+    try:
+        return float(value.strip())
+    except ValueError:
+        return None
+
+
+class ProgressState:
+    """Progress of one SEM tool run
+
+    ``stage`` is the name of the filter currently running and ``progress`` the
+    fraction of it that is done; ``finished_stages`` lists ``(name, seconds)``
+    of the filters that already ended.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.started = clock()
+        self.updated = self.started
+        self.stage = None
+        self.comment = None
+        self.stage_started = None
+        self.progress = 0.0
+        self.stage_progress = None
+        self.finished_stages = []
+
+    def eta(self, now=None):
+        """Seconds until the current stage ends, extrapolated from its progress
+
+        >>> now = [0.0]
+        >>> state = ProgressState(clock=lambda: now[0])
+        >>> parser = FilterProgressParser(state)
+        >>> parser.feed("<filter-start><filter-name>Fit</filter-name></filter-start>")
+        >>> now[0] = 30.0
+        >>> parser.feed("<filter-progress>0.25</filter-progress>")
+        >>> state.eta()
+        90.0
+        """
+        if not self.progress or self.progress <= 0:
+            return None
+        now = self._clock() if now is None else now
+        start = self.stage_started if self.stage_started is not None else self.started
+        return (now - start) * (1.0 - min(self.progress, 1.0)) / self.progress
+
+    def idle_time(self, now=None):
+        """Seconds since the tool last reported anything"""
+        now = self._clock() if now is None else now
+        return now - self.updated
+
+    def stalled(self, timeout, now=None):
+        """Whether no progress was reported for more than ``timeout`` seconds"""
+        return self.idle_time(now) > timeout
+
+    def __repr__(self):
+        return (
+            f"ProgressState(stage={self.stage!r}, progress={self.progress:.3f}, "
+            f"finished_stages={len(self.finished_stages)})"
+        )
+
+
+class FilterProgressParser:
+    """Incrementally parse SEM progress fragments into a :class:`ProgressState`
+
+    Text can be fed in arbitrary pieces, fragments split across several
+    ``feed`` calls are completed by the following ones. ``callback`` is called
+    with the state after every update.
+
+    >>> parser = FilterProgressParser()
+    >>> parser.feed("<filter-start>\\n<filter-name>Resample</filter-name>\\n")
+    >>> parser.feed("<filter-comment> warping </filter-comment>\\n</filter-start>\\n")
+    >>> parser.feed("<filter-progress>0.5</filter-progress>\\n")
+    >>> parser.state
+    ProgressState(stage='Resample', progress=0.500, finished_stages=0)
+    >>> parser.feed("<filter-end><filter-name>Resample</filter-name>")
+    >>> parser.feed("<filter-time>2.5</filter-time></filter-end>")
+    >>> parser.state.finished_stages
+    [('Resample', 2.5)]
+    """
+
+    def __init__(self, state=None, callback=None):
+        self.state = state if state is not None else ProgressState()
+        self.callback = callback
+        # text not parsed yet: the body of the fragment being read, whose
+        # closing tag is searched from _searched on, or a truncated tag
+        self._pending = ""
+        self._kind = None
+        self._searched = 0
+
+    def feed(self, text):
+        buffer = self._pending + text
+        # start of the text left to parse
+        pos = 0
+        updated = False
+        while True:
+            if self._kind is None:
+                match = _open_re.search(buffer, pos)
+                if match is None:
+                    break
+                self._kind = match.group(1)
+                pos = self._searched = match.end()
+            close = f"</filter-{self._kind}>"
+            end = buffer.find(close, self._searched)
+            if end < 0:
+                # the text already searched is not searched again
+                self._searched = max(pos, len(buffer) - len(close) + 1)
+                break
+            if self._kind in ("progress", "stage-progress"):
+                self._on_progress(self._kind, buffer[pos:end])
+            else:
+                self._on_block(self._kind, buffer[pos:end])
+            updated = True
+            pos = end + len(close)
+            self._kind = None
+        if self._kind is not None and len(buffer) - pos <= _max_pending:
+            self._pending = buffer[pos:]
+            self._searched -= pos
+        else:
+            # a fragment too long to be one is dropped
+            self._kind = None
+            rest = buffer[pos:]
+            # keep a possibly truncated opening tag
+            lt = rest.rfind("<")
+            self._pending = rest[lt:] if lt >= 0 and len(rest) - lt < 32 else ""
+        if updated:
+            self.state.updated = self.state._clock()
+            if self.callback is not None:
+                self.callback(self.state)
+
+    def _on_progress(self, kind, value):
+        fraction = _to_float(value)
+        if fraction is None:
+            return
+        if kind == "progress":
+            self.state.progress = fraction
+        else:
+            self.state.stage_progress = fraction
+
+    def _on_block(self, kind, body):
+        fields = {key: value.strip() for key, value in _field_re.findall(body)}
+        state = self.state
+        if kind == "start":
+            state.stage = fields.get("name")
+            state.comment = fields.get("comment")
+            state.stage_started = state._clock()
+            state.progress = 0.0
+            state.stage_progress = None
+        else:
+            name = fields.get("name", state.stage)
+            seconds = _to_float(fields.get("time", ""))
+            if seconds is None and state.stage_started is not None:
+                seconds = state._clock() - state.stage_started
+            state.finished_stages.append((name, seconds))
+            state.progress = 1.0
+
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+def register_progress(key, state):
+    with _active_lock:
+        _active[key] = state
+
+
+def unregister_progress(key):
+    with _active_lock:
+        _active.pop(key, None)
+
+
+def active_progress():
+    """Return ``{task name/checksum: ProgressState}`` of the running SEM tasks"""
+    with _active_lock:
+        return dict(_active)
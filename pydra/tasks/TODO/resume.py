@@ -0,0 +1,135 @@
+"""
+Persistent index of completed SEM tasks for fast resumption.
+
+Finding out that a task already ran normally requires its pydra checksum,
+which hashes the content of every File input. :class:`ResumeIndex` maps a
+cheap pre-key, computed from the parameter values and the stat signature
+(path, size, mtime) of the inputs typed as files or directories, to the
+directory of the completed
+result, so resuming a huge mapped workflow neither hashes inputs nor probes
+cache directories for the work already done.
+"""
+import hashlib
+import json
+import os
+import typing
+from pathlib import Path
+
+import attr
+import cloudpickle as cp
+
+from .locking import SqliteStore
+
+
+#: nipype and pydra types of the fields holding files or directories
+path_type_names = {
+    "File",
+    "Directory",
+    "MultiInputFile",
+    "MultiOutputFile",
+    "InputMultiPath",
+    "OutputMultiPath",
+}
+
+
+def path_fields(spec_class):
+    """Names of the fields of the attrs class ``spec_class`` typed as paths
+
+    >>> from pydra.engine.specs import File
+    >>> path_fields(attr.make_class("Inputs", {"volume": attr.ib(type=File),
+    ...                                       "label": attr.ib(type=str)}))
+    {'volume'}
+    """
+    return {
+        field.name
+        for field in attr.fields(spec_class)
+        if any(
+            getattr(type_, "__name__", None) in path_type_names
+            for type_ in (field.type,) + typing.get_args(field.type)
+        )
+    }
+
+
+def _signature(value, path=False):
+    if isinstance(value, (list, tuple)):
+        return [_signature(item, path) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _signature(item, path) for key, item in sorted(value.items())}
+    if path and isinstance(value, (str, os.PathLike)) and os.path.exists(value):
+        st = os.stat(value)
+        return ["file", os.path.realpath(value), st.st_size, st.st_mtime_ns]
+    return repr(value)
+
+
+def prekey(task_type, inputs, outputs=None, paths=()):
+    """Key of a task run from its type, input values and requested ``outputs``
+
+    The existing files and directories of the inputs named in ``paths``
+    contribute their stat signature rather than their content; other
+    values, strings naming files included, and outputs only contribute
+    their value.
+
+    >>> prekey("BRAINSFit", {"numberOfIterations": 1500}) == prekey(
+    ...     "BRAINSFit", {"numberOfIterations": 1500})
+    True
+    >>> prekey("BRAINSFit", {"numberOfIterations": 1500}) == prekey(
+    ...     "BRAINSFit", {"numberOfIterations": 1000})
+    False
+    """
+    outputs = {name: repr(value) for name, value in (outputs or {}).items()}
+    inputs = {name: _signature(value, name in paths) for name, value in inputs.items()}
+    signature = json.dumps([task_type, inputs, outputs], sort_keys=True)
+    return hashlib.sha256(signature.encode()).hexdigest()
+
+
+def load_result_dir(task_dir):
+    """Result saved by pydra in ``task_dir``, None when there is none"""
+    result_file = Path(task_dir) / "_result.pklz"
+    if result_file.exists() and result_file.stat().st_size > 0:
+        return cp.loads(result_file.read_bytes())
+    return None
+
+
+class ResumeIndex(SqliteStore):
+    """sqlite index ``path`` of ``pre-key -> completed result directory``"""
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS results (prekey TEXT PRIMARY KEY, task_dir TEXT)"
+    ]
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = str(path)
+
+    def add(self, key, task_dir):
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?)", (key, str(task_dir))
+            )
+
+    def lookup(self, key):
+        """Directory of the completed result of ``key``, or None"""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT task_dir FROM results WHERE prekey = ?", (key,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def load(self, key):
+        """``(task_dir, result)`` of ``key`` if it succeeded and is still cached
+
+        ``(None, None)`` otherwise.
+        """
+        task_dir = self.lookup(key)
+        if task_dir is None:
+            return None, None
+        result = load_result_dir(task_dir)
+        if result is None or result.errored:
+            # evicted or failed since it was indexed
+            self.discard(key)
+            return None, None
+        return task_dir, result
+
+    def discard(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM results WHERE prekey = ?", (key,))
@@ -0,0 +1,292 @@
+"""
+Run policy of the generated SEM tasks.
+
+A :class:`RunPolicy` gathers how a :class:`~.task.SEMShellCommandTask` runs
+its tool, apart from the inputs of the tool. The tasks use the package-level
+policy unless they are given their own, so that a workflow sets it once for
+the thousands of tasks it builds.
+
+The stores are given as instances, or as the path (or dict of keyword
+arguments) of one, opened where the task runs: node-local stores then live
+on the node of the worker rather than of the submitter.
+"""
+import contextlib
+from pathlib import Path
+
+from .affinity import CoreAllocator
+from .blobstore import BlobStore
+from .cachemanager import CacheManager
+from .compressedstore import CompressedStore
+from .failures import FailureCache
+from .history import RuntimeHistory
+from .leases import LeaseRegistry
+from .limits import ResourceLimits
+from .memory import MemoryBudget
+from .nodecache import NodeCache
+from .resume import ResumeIndex
+from .staging import ScratchStager
+
+
+def _open(value, cls, **defaults):
+    """``value`` as a ``cls``: an instance, None, a dict of keyword arguments or a path
+
+    >>> from argparse import Namespace
+    >>> _open({"level": 6}, Namespace, level=3, threads=1)
+    Namespace(level=6, threads=1)
+    >>> _open(None, Namespace) is None
+    True
+    """
+    if value is None or isinstance(value, cls):
+        return value
+    if isinstance(value, dict):
+        return cls(**{**defaults, **value})
+    return cls(value)
+
+
+class RunPolicy:
+    """How the SEM tasks run their tool
+
+    tail_bytes: number of bytes of stdout/stderr kept in memory, the
+        ``stdout``/``stderr`` outputs of the task hold only this tail.
+    max_log_bytes: size at which ``stdout.log``/``stderr.log`` are rotated,
+        None to never rotate.
+    log_backups: number of rotated log files kept per stream.
+    progress_callback: called with the :class:`~.progress.ProgressState` of the
+        run every time the tool reports progress.
+    runtime_history: a :class:`~.history.RuntimeHistory`, or the path of one,
+        where the duration of every successful run is recorded.
+    speculate_percentile: when set (e.g. 95), a duplicate of the run is
+        launched once it lasts longer than this percentile of the tool's
+        runtime history; the first attempt to succeed is kept and the other
+        one is killed. Each attempt writes its outputs in its own
+        ``attempt-<n>`` directory, only the kept ones are moved in place.
+    speculate_min_samples: number of recorded runs needed before speculating.
+    scratch_dir: node-local directory where the input files are staged (once
+        per node and file version) and the tool runs; its outputs are moved
+        back to the task output directory afterwards, in the background
+        once the tool released its cores and memory. A
+        :class:`~.staging.ScratchStager` to set its sidecars or eviction
+        budgets.
+    node_cache_dir: root of a :class:`~.nodecache.NodeCache`; when set the
+        ``constant_inputs`` of the tasks are read from there, materialised
+        once per node.
+    parallel_gzip: True (all) or names of the ``.nii.gz`` outputs that the
+        tool writes uncompressed and that are then compressed on
+        ``gzip_threads`` threads (all the CPUs available by default) at
+        ``gzip_level``.
+    cache_manager: a :class:`~.cachemanager.CacheManager` of the task
+        ``cache_dir``, or a dict of its keyword arguments. Every run and cache
+        hit is registered with it (see :meth:`~.cachemanager.CacheManager.register`)
+        and the cache is evicted down to its budgets once exceeded;
+        directories holding the ``terminal_outputs`` of a task are pinned.
+    compressed_store: a :class:`~.compressedstore.CompressedStore`, or a dict
+        of its keyword arguments, compacting the idle directories of the
+        ``cache_dir`` (see :meth:`~.compressedstore.CompressedStore.compact_due`);
+        outputs of cache hits are decompressed before the result is returned.
+    blob_store: a :class:`~.blobstore.BlobStore`, or a dict of its keyword
+        arguments (``root`` defaults to ``<cache_dir>/.sem_blobs``); the
+        outputs of every run are deduplicated against it.
+    resume_index: a :class:`~.resume.ResumeIndex`, or the path of one. Every
+        successful run is indexed by a pre-key computed from the input
+        values and file stat signatures, so later runs with the same inputs
+        are served from the index without computing the task checksum.
+    inflight_leases: a :class:`~.leases.LeaseRegistry`, or the path of one,
+        shared by the workflows that may submit identical runs; a run
+        identical to one in flight waits for it and reuses its result, even
+        when it lives in another ``cache_dir``.
+    failure_cache: a :class:`~.failures.FailureCache`, or the path of one,
+        where deterministic failures (unreadable input, missing landmark,
+        invalid arguments) are recorded; a task that already failed that way
+        with the same checksum and executable file raises
+        :class:`~.failures.KnownFailureError` without running the tool again,
+        until the entry is cleared.
+    memory_mb: memory the tool needs, in MB; by default estimated from the
+        peak memory recorded in the ``runtime_history``.
+    memory_budget: a :class:`~.memory.MemoryBudget`, or the path of a
+        node-local one, in which the run reserves ``memory_mb`` before
+        starting the tool.
+    oom_retries: number of times a run killed out of memory is retried, each
+        time reserving ``oom_escalation`` times the memory it was killed at,
+        so that fewer tasks run next to it; a run whose memory is unknown
+        fails instead. Kills are told from the ``memory.events`` of the
+        cgroup of the run when there is one (see ``enforce_limits``), from a
+        SIGKILL otherwise. The kills are recorded in the ``runtime_history``
+        to raise the estimates of the next runs.
+    cpus: number of CPUs the tool may use.
+    enforce_limits: run the tool under the limits of
+        :class:`~.limits.ResourceLimits`: ``RLIMIT_CPU`` of
+        ``cpu_time_limit`` seconds and, when ``cgroup_parent`` is a delegated
+        cgroup v2 directory, ``memory.max`` (``memory_mb``) and ``cpu.max``
+        (``cpus``) of a cgroup created for the run. Without a cgroup, the
+        memory is bounded by ``memory_rlimit`` (``"RLIMIT_DATA"`` or
+        ``"RLIMIT_AS"``) set to ``memory_headroom`` times ``memory_mb``, when
+        given.
+    cores: CPUs the tool is pinned to.
+    core_allocator: a :class:`~.affinity.CoreAllocator`, or the path of a
+        node-local one, handing out ``cpus`` cores (1 by default) to the run
+        when ``cores`` is not given.
+    trace_file: path of a Chrome trace (see :mod:`~.tracing`) to which the
+        phases of the runs are appended: time queued, hashing, staging,
+        tool runs, output collection and compression. The Python overhead
+        around the tool is broken down by :mod:`~.profiling`.
+
+    The tool runs with ``ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS`` and
+    ``OMP_NUM_THREADS`` set to the number of its cores (or to ``cpus``), as
+    is its ``numberOfThreads`` parameter when it has one and it is not set.
+
+    >>> policy = RunPolicy(cpus=2, memory_mb=2048)
+    >>> policy.memory_estimate("BRAINSABC")
+    2048
+    >>> with policy.allocate_cores() as cores:
+    ...     print(cores)
+    None
+    """
+
+    def __init__(
+        self,
+        tail_bytes=64 * 1024,
+        max_log_bytes=None,
+        log_backups=3,
+        progress_callback=None,
+        runtime_history=None,
+        speculate_percentile=None,
+        speculate_min_samples=10,
+        scratch_dir=None,
+        node_cache_dir=None,
+        parallel_gzip=False,
+        gzip_threads=None,
+        gzip_level=6,
+        cache_manager=None,
+        compressed_store=None,
+        blob_store=None,
+        resume_index=None,
+        inflight_leases=None,
+        failure_cache=None,
+        memory_mb=None,
+        memory_budget=None,
+        oom_retries=0,
+        oom_escalation=1.5,
+        cpus=None,
+        enforce_limits=False,
+        cpu_time_limit=None,
+        cgroup_parent=None,
+        memory_rlimit=None,
+        memory_headroom=4.0,
+        cores=None,
+        core_allocator=None,
+        trace_file=None,
+    ):
+        self.tail_bytes = tail_bytes
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.progress_callback = progress_callback
+        self.runtime_history = runtime_history
+        self.speculate_percentile = speculate_percentile
+        self.speculate_min_samples = speculate_min_samples
+        self.scratch_dir = scratch_dir
+        self.node_cache_dir = node_cache_dir
+        self.parallel_gzip = parallel_gzip
+        self.gzip_threads = gzip_threads
+        self.gzip_level = gzip_level
+        self.cache_manager = cache_manager
+        self.compressed_store = compressed_store
+        self.blob_store = blob_store
+        self.resume_index = resume_index
+        self.inflight_leases = inflight_leases
+        self.failure_cache = failure_cache
+        self.memory_mb = memory_mb
+        self.memory_budget = memory_budget
+        self.oom_retries = oom_retries
+        self.oom_escalation = oom_escalation
+        self.cpus = cpus
+        self.enforce_limits = enforce_limits
+        self.cpu_time_limit = cpu_time_limit
+        self.cgroup_parent = cgroup_parent
+        self.memory_rlimit = memory_rlimit
+        self.memory_headroom = memory_headroom
+        self.cores = list(cores) if cores is not None else None
+        self.core_allocator = core_allocator
+        self.trace_file = trace_file
+
+    def open_history(self):
+        return _open(self.runtime_history, RuntimeHistory)
+
+    def open_stager(self):
+        return _open(self.scratch_dir, ScratchStager)
+
+    def open_node_cache(self):
+        return _open(self.node_cache_dir, NodeCache)
+
+    def open_cache_manager(self, cache_dir):
+        return _open(self.cache_manager, CacheManager, cache_dir=cache_dir)
+
+    def open_compressed_store(self):
+        return _open(self.compressed_store, CompressedStore)
+
+    def open_blob_store(self, cache_dir):
+        return _open(self.blob_store, BlobStore, root=Path(cache_dir) / ".sem_blobs")
+
+    def open_resume_index(self):
+        return _open(self.resume_index, ResumeIndex)
+
+    def open_lease_registry(self):
+        return _open(self.inflight_leases, LeaseRegistry)
+
+    def open_failure_cache(self):
+        return _open(self.failure_cache, FailureCache)
+
+    def open_memory_budget(self):
+        return _open(self.memory_budget, MemoryBudget)
+
+    def open_core_allocator(self):
+        return _open(self.core_allocator, CoreAllocator)
+
+    def speculation_threshold(self, tool):
+        """Duration after which a duplicate run of ``tool`` is launched, or None"""
+        history = self.open_history()
+        if history is None or self.speculate_percentile is None:
+            return None
+        return history.threshold(
+            tool, self.speculate_percentile, self.speculate_min_samples
+        )
+
+    def memory_estimate(self, tool):
+        """Memory (MB) to reserve for a run of ``tool``, None when unknown"""
+        history = self.open_history()
+        if self.memory_mb is None and history is not None:
+            return history.memory_estimate(tool)
+        return self.memory_mb
+
+    def allocate_cores(self):
+        """Context manager of the cores of a run, None when not pinned"""
+        allocator = self.open_core_allocator()
+        if self.cores is None and allocator is not None:
+            return allocator.allocate(self.cpus or 1)
+        return contextlib.nullcontext(self.cores)
+
+    def resource_limits(self, memory_mb):
+        """:class:`~.limits.ResourceLimits` of a run reserving ``memory_mb``, or None"""
+        if not self.enforce_limits:
+            return None
+        return ResourceLimits(
+            memory_mb=memory_mb,
+            cpus=self.cpus,
+            cpu_seconds=self.cpu_time_limit,
+            cgroup_parent=self.cgroup_parent,
+            memory_rlimit=self.memory_rlimit,
+            memory_headroom=self.memory_headroom,
+        )
+
+
+_policy = RunPolicy()
+
+
+def get_run_policy():
+    return _policy
+
+
+def set_run_policy(policy):
+    """Set the package-level policy, returns the previous one"""
+    global _policy
+    previous, _policy = _policy, policy
+    return previous
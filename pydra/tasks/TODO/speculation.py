@@ -0,0 +1,82 @@
+"""
+Speculative re-execution of straggler SEM tool runs.
+
+A run lasting much longer than the usual runtime of its tool is often stuck
+on a slow node or filesystem. :func:`race` launches a duplicate of such a run
+and keeps the first attempt to succeed; every attempt writes its outputs in
+its own directory (see :func:`attempt_outputs`), so that only the ones of the
+attempt kept are moved in place.
+"""
+import os
+import time
+
+
+def attempt_outputs(outputs, attempt_dir):
+    """``outputs`` written in ``attempt_dir`` and the moves to their final paths
+
+    Every output field gets its own directory, so outputs with the same
+    file name do not collide.
+
+    >>> import tempfile
+    >>> attempt_dir = tempfile.mkdtemp()
+    >>> values, moves = attempt_outputs(
+    ...     {"outputVolume": "/data/a/out.nii", "outputTransform": "/data/b/out.nii"},
+    ...     attempt_dir,
+    ... )
+    >>> [os.path.relpath(path, attempt_dir) for path in values.values()]
+    ['outputVolume/out.nii', 'outputTransform/out.nii']
+    >>> [final for _, final in moves]
+    ['/data/a/out.nii', '/data/b/out.nii']
+    """
+    values, moves = {}, []
+    for name, value in outputs.items():
+        is_list = isinstance(value, (list, tuple))
+        paths = []
+        for i, item in enumerate(value if is_list else [value]):
+            directory = os.path.join(attempt_dir, name, str(i) if is_list else "")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, os.path.basename(str(item)))
+            paths.append(path)
+            # the tool runs in the output directory, relative outputs end up there
+            moves.append((path, os.path.abspath(item)))
+        values[name] = paths if is_list else paths[0]
+    return values, moves
+
+
+def race(attempts, launch, threshold=None, poll=0.2):
+    """Wait for the first of the ``attempts`` started by ``launch()`` to succeed
+
+    ``launch()`` starts an attempt and returns its process, which is
+    appended to ``attempts``; a duplicate is launched once the first attempt
+    ran for ``threshold`` seconds. Returns the first attempt to succeed, the
+    first to fail when all failed. The attempts still running are left to
+    the caller.
+
+    >>> import subprocess
+    >>> attempts = []
+    >>> winner = race(
+    ...     attempts,
+    ...     lambda: subprocess.Popen(["true"] if attempts else ["sleep", "60"]),
+    ...     threshold=0.1,
+    ... )
+    >>> winner is attempts[1], winner.returncode
+    (True, 0)
+    >>> attempts[0].kill()
+    """
+    start = time.monotonic()
+    attempts.append(launch())
+    while True:
+        finished = [proc for proc in attempts if proc.poll() is not None]
+        succeeded = [proc for proc in finished if proc.returncode == 0]
+        if succeeded:
+            return succeeded[0]
+        if len(finished) == len(attempts):
+            return finished[0]
+        if (
+            threshold is not None
+            and len(attempts) == 1
+            and time.monotonic() - start > threshold
+        ):
+            attempts.append(launch())
+        else:
+            time.sleep(poll)
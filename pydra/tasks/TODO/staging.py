@@ -0,0 +1,379 @@
+"""
+Staging of SEM task files on node-local scratch.
+
+ITK readers do many small reads, which are slow against NFS/Lustre. With a
+scratch directory, input files are materialised once per node under
+``<scratch>/inputs`` (hard-linked or reflinked when the filesystem allows
+it, copied otherwise) together with their sidecar files, shared by every
+task reading them, and the outputs are written locally and moved back
+afterwards. Staged inputs unused for longest are evicted beyond a size or
+age budget.
+"""
+import concurrent.futures
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+
+from .cachemanager import directory_size
+from .locking import hold_lock
+
+# FICLONE from linux/fs.h
+_FICLONE = 0x40049409
+
+#: files staged with the inputs, ``{input suffix: [sidecar suffixes]}``: the
+#: voxel data of detached headers, the gradients and BIDS metadata of
+#: diffusion volumes. A sidecar replaces the suffix of the input.
+default_sidecars = {
+    ".nhdr": [".raw", ".raw.gz"],
+    ".hdr": [".img", ".img.gz"],
+    ".mhd": [".raw", ".zraw"],
+    ".nii.gz": [".bval", ".bvec", ".json"],
+    ".nii": [".bval", ".bvec", ".json"],
+}
+
+# detached headers, only staged when their data file is one of their sidecars:
+# ``{suffix: (separator, keys of the data file field)}``
+_data_file_fields = {
+    ".nhdr": (":", ("data file", "datafile")),
+    ".mhd": ("=", ("elementdatafile",)),
+}
+
+
+def reflink(src, dst):
+    """Create ``dst`` as a copy-on-write clone of ``src`` (btrfs, xfs, ...)"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst, hardlink=True):
+    """Materialise ``src`` at ``dst`` as cheaply as possible
+
+    Returns how the file was materialised: "hardlink", "reflink" or "copy".
+    A hard link shares later in-place changes of ``src``, pass
+    ``hardlink=False`` when ``dst`` must stay a snapshot.
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    try:
+        reflink(src, dst)
+        return "reflink"
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _stat_key(path):
+    """Identify a file version by path, size and modification time"""
+    st = os.stat(path)
+    key = f"{os.path.realpath(path)}\0{st.st_size}\0{st.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _data_file(path, separator, keys):
+    """Name of the data file the detached header ``path`` refers to
+
+    Returns "" for data stored in the header, None when the header cannot
+    be read or refers to several files.
+    """
+    try:
+        with open(path, errors="replace") as header:
+            for line in header:
+                name, _, value = line.partition(separator)
+                if name.strip().lower() in keys:
+                    value = value.strip()
+                    if value == "LOCAL":
+                        return ""
+                    return value if len(value.split()) == 1 else None
+    except OSError:
+        return None
+    return ""
+
+
+def stage_files(path, sidecars=None):
+    """Files to stage for the input ``path``: itself then its sidecars
+
+    Returns None when ``path`` cannot be staged: not a file, or a detached
+    header whose data file is not one of its sidecars.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> for name in ["dwi.nii.gz", "dwi.bval", "dwi.bvec", "t1.nhdr", "t1.raw.gz"]:
+    ...     open(os.path.join(directory, name), "w").close()
+    >>> [os.path.basename(f) for f in stage_files(os.path.join(directory, "dwi.nii.gz"))]
+    ['dwi.nii.gz', 'dwi.bval', 'dwi.bvec']
+    >>> with open(os.path.join(directory, "t1.nhdr"), "w") as f:
+    ...     _ = f.write("NRRD0004\\ndata file: t1.raw.gz\\n")
+    >>> [os.path.basename(f) for f in stage_files(os.path.join(directory, "t1.nhdr"))]
+    ['t1.nhdr', 't1.raw.gz']
+    >>> with open(os.path.join(directory, "t1.nhdr"), "w") as f:
+    ...     _ = f.write("NRRD0004\\ndata file: ../t1.raw.gz\\n")
+    >>> stage_files(os.path.join(directory, "t1.nhdr")) is None
+    True
+    """
+    path = str(path)
+    if not os.path.isfile(path):
+        return None
+    sidecars = default_sidecars if sidecars is None else sidecars
+    # the longest suffix, ".nii.gz" rather than ".gz"
+    suffixes = sorted((s for s in sidecars if path.endswith(s)), key=len, reverse=True)
+    files = [path]
+    if suffixes:
+        stem = path[: -len(suffixes[0])]
+        files += [
+            stem + suffix
+            for suffix in sidecars[suffixes[0]]
+            if os.path.isfile(stem + suffix)
+        ]
+    header = next((s for s in _data_file_fields if path.endswith(s)), None)
+    if header is not None:
+        data = _data_file(path, *_data_file_fields[header])
+        names = [os.path.basename(f) for f in files[1:]]
+        if data is None or (data and data not in names):
+            return None
+    elif path.endswith(".hdr") and len(files) == 1:
+        return None
+    return files
+
+
+class ScratchStager:
+    """Node-local staging area rooted at ``scratch_dir``
+
+    ``sidecars`` maps suffixes of inputs to the suffixes of the files staged
+    with them (:data:`default_sidecars` by default). The tasks using a
+    staged input hold a shared lock on it until :meth:`release`, the
+    stager is also a context manager releasing them on exit. Beyond
+    ``max_bytes`` of staged inputs, or for inputs unused for ``max_age``
+    seconds, :meth:`evict` removes the inputs no task is using; staging
+    runs it at most every ``evict_interval`` seconds per scratch directory.
+
+    >>> import tempfile
+    >>> source = os.path.join(tempfile.mkdtemp(), "t1.nii")
+    >>> with open(source, "wb") as f:
+    ...     _ = f.write(bytes(100))
+    >>> with ScratchStager(tempfile.mkdtemp(), max_bytes=0) as stager:
+    ...     staged = stager.stage_inputs([source])[source]
+    ...     stager.evict()
+    []
+    >>> stager.evict() == [os.path.dirname(staged)]
+    True
+    """
+
+    def __init__(
+        self,
+        scratch_dir,
+        max_workers=4,
+        sidecars=None,
+        max_bytes=None,
+        max_age=None,
+        evict_interval=600,
+    ):
+        self.scratch_dir = str(scratch_dir)
+        self.max_workers = max_workers
+        self.sidecars = default_sidecars if sidecars is None else sidecars
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._held = []
+        os.makedirs(os.path.join(self.scratch_dir, "inputs"), exist_ok=True)
+        os.makedirs(os.path.join(self.scratch_dir, "tasks"), exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stage_in(self, path):
+        """Return the local copy of ``path``, staging it on first use
+
+        Concurrent tasks staging the same file wait for each other, so every
+        version of a file is staged once per node. The staged copy is kept
+        from eviction until :meth:`release`.
+        """
+        files = stage_files(path, self.sidecars)
+        key = hashlib.sha256("\0".join(map(_stat_key, files)).encode()).hexdigest()
+        stage_dir = os.path.join(self.scratch_dir, "inputs", key)
+        staged = os.path.join(stage_dir, os.path.basename(path))
+        while True:
+            # a shared lock held while the copy exists keeps it from eviction
+            lock = hold_lock(f"{stage_dir}.lock", shared=True)
+            if os.path.exists(staged):
+                break
+            # flock converts locks non-atomically: stage under a lock of its
+            # own, then check again under a new shared one
+            lock.close()
+            with hold_lock(f"{stage_dir}.lock"):
+                if not os.path.exists(staged):
+                    os.makedirs(stage_dir, exist_ok=True)
+                    # the input last, its presence tells the sidecars are there
+                    for source in files[1:] + files[:1]:
+                        dest = os.path.join(stage_dir, os.path.basename(source))
+                        tmp = f"{dest}.{os.getpid()}.tmp"
+                        link_or_copy(source, tmp)
+                        os.replace(tmp, dest)
+        try:
+            # the age of an entry is the time since its last use
+            os.utime(stage_dir)
+        except BaseException:
+            lock.close()
+            raise
+        self._held.append(lock)
+        return staged
+
+    def stage_inputs(self, paths):
+        """Stage ``paths`` concurrently, returns ``{path: staged path}``
+
+        The paths that cannot be staged are left out.
+        """
+        paths = [
+            path
+            for path in dict.fromkeys(paths)
+            if stage_files(path, self.sidecars) is not None
+        ]
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            staged = dict(zip(paths, pool.map(self.stage_in, paths)))
+        if self.max_bytes is not None or self.max_age is not None:
+            self._evict_due()
+        return staged
+
+    def release(self):
+        """Let the inputs staged by this stager be evicted"""
+        while self._held:
+            self._held.pop().close()
+
+    def _evict_due(self):
+        """Evict when no process did for ``evict_interval`` seconds"""
+        stamp = os.path.join(self.scratch_dir, "inputs.evicted")
+        try:
+            if time.time() - os.stat(stamp).st_mtime < self.evict_interval:
+                return
+        except FileNotFoundError:
+            pass
+        with open(stamp, "a"):
+            os.utime(stamp)
+        self.evict()
+
+    def evict(self):
+        """Remove the staged inputs beyond the budgets, least recently used first
+
+        Inputs in use by a task are skipped. Returns the directories
+        removed.
+        """
+        inputs_dir = os.path.join(self.scratch_dir, "inputs")
+        entries = []
+        for name in os.listdir(inputs_dir):
+            path = os.path.join(inputs_dir, name)
+            try:
+                if os.path.isdir(path):
+                    entries.append((os.stat(path).st_mtime, directory_size(path), path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed = []
+        for mtime, size, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                continue
+            try:
+                lock = hold_lock(f"{path}.lock", blocking=False)
+            except BlockingIOError:
+                continue
+            with lock:
+                shutil.rmtree(path, ignore_errors=True)
+                # a process waiting for it takes the lock on a new file
+                os.unlink(f"{path}.lock")
+            total -= size
+            removed.append(path)
+        return removed
+
+    def stage_values(self, values):
+        """``values``, ``{field: path or list of paths}``, read from staged copies
+
+        Only the fields with a staged path are returned.
+        """
+        staged = self.stage_inputs(
+            str(item)
+            for value in values.values()
+            for item in (value if isinstance(value, (list, tuple)) else [value])
+        )
+        replaced = {}
+        for name, value in values.items():
+            if isinstance(value, (list, tuple)):
+                if any(str(item) in staged for item in value):
+                    replaced[name] = [staged.get(str(item), item) for item in value]
+            elif str(value) in staged:
+                replaced[name] = staged[str(value)]
+        return replaced
+
+    def work_dir(self, name, cache_dir=None):
+        """Fresh local working directory for the task ``name`` of ``cache_dir``
+
+        Tasks with the same checksum in different cache directories get
+        different working directories.
+        """
+        if cache_dir is not None:
+            digest = hashlib.sha256(os.path.realpath(cache_dir).encode()).hexdigest()
+            name = f"{digest[:16]}-{name}"
+        path = os.path.join(self.scratch_dir, "tasks", name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+
+def move_files(pairs, max_workers=4):
+    """Move ``(src, dst)`` pairs concurrently, skipping missing sources"""
+
+    def move(pair):
+        src, dst = pair
+        if os.path.exists(src):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.move(src, dst)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        list(pool.map(move, pairs))
+
+
+def _move_and_remove(pairs, remove, max_workers):
+    try:
+        move_files(pairs, max_workers)
+    finally:
+        for path in remove:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def move_files_async(pairs, remove=(), max_workers=4):
+    """Move ``(src, dst)`` pairs in the background, then remove the directories ``remove``
+
+    Returns a :class:`concurrent.futures.Future` of the moves: the tool
+    hands its cores and memory back while its outputs are moved off
+    scratch, the result must only be saved once the future is done.
+
+    >>> import tempfile
+    >>> src, dst = tempfile.mkdtemp(), tempfile.mkdtemp()
+    >>> open(os.path.join(src, "out.nii"), "w").close()
+    >>> moved = move_files_async(
+    ...     [(os.path.join(src, "out.nii"), os.path.join(dst, "out.nii"))], [src]
+    ... )
+    >>> moved.result()
+    >>> os.listdir(dst), os.path.exists(src)
+    (['out.nii'], False)
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    future = executor.submit(_move_and_remove, list(pairs), list(remove), max_workers)
+    executor.shutdown(wait=False)
+    return future
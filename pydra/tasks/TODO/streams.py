@@ -0,0 +1,263 @@
+"""
+Streaming capture of the output of SEM executables.
+
+Tools like BRAINSABC or gtractFiberTracking print a lot of progress output.
+Instead of buffering all of it in memory, every stream is written to a
+rotating log file and only a bounded tail is kept for error reporting.
+"""
+import collections
+import logging
+import os
+import re
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+#: size of the reads of the child streams
+chunk_size = 64 * 1024
+#: longest line passed to ``on_stdout_line``, longer ones are passed in pieces
+max_line_bytes = 64 * 1024
+
+
+class BoundedTail:
+    """Keep only the last ``max_bytes`` bytes written to it
+
+    >>> tail = BoundedTail(8)
+    >>> tail.write(b"hello ")
+    >>> tail.write(b"world")
+    >>> tail.getvalue()
+    b'lo world'
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def write(self, data):
+        if not data or self.max_bytes <= 0:
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size - len(self._chunks[0]) >= self.max_bytes:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self):
+        return b"".join(self._chunks)[-self.max_bytes :] if self.max_bytes > 0 else b""
+
+
+class RotatingLog:
+    """Append-only log file rolled over to ``<path>.1`` ... ``<path>.<backups>``
+
+    ``max_bytes=None`` disables the rotation.
+    """
+
+    def __init__(self, path, max_bytes=None, backups=3):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    def write(self, data):
+        if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+            self._rollover()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rollover(self):
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+
+class StreamedProcess:
+    """Child process whose stdout/stderr are streamed to disk as they arrive
+
+    Each stream is copied to ``<log_dir>/stdout.log`` and ``<log_dir>/stderr.log``
+    (when ``log_dir`` is given) and the last ``tail_bytes`` of each are kept in
+    memory. ``on_stdout_line`` is called with every decoded line of stdout
+    (in pieces of at most :data:`max_line_bytes`); an exception it raises is
+    logged and it is not called again, the output is still consumed.
+    On Linux the peak resident memory of the child is sampled every
+    ``memory_poll`` seconds into ``peak_rss_mb``.
+
+    >>> proc = StreamedProcess(["python", "-c", "print('a'); print('b')"])
+    >>> proc.wait()
+    0
+    >>> proc.stdout
+    'a\\nb\\n'
+    """
+
+    def __init__(
+        self,
+        args,
+        log_dir=None,
+        tail_bytes=64 * 1024,
+        max_log_bytes=None,
+        log_backups=3,
+        on_stdout_line=None,
+        cwd=None,
+        env=None,
+        memory_poll=1.0,
+    ):
+        self.args = list(args)
+        self.log_dir = log_dir
+        self._tails = {
+            "stdout": BoundedTail(tail_bytes),
+            "stderr": BoundedTail(tail_bytes),
+        }
+        self._process = subprocess.Popen(
+            self.args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env
+        )
+        self.pid = self._process.pid
+        self._readers = []
+        for stream_name, callback in [("stdout", on_stdout_line), ("stderr", None)]:
+            log = None
+            if log_dir is not None:
+                log = RotatingLog(
+                    os.path.join(log_dir, f"{stream_name}.log"),
+                    max_bytes=max_log_bytes,
+                    backups=log_backups,
+                )
+            reader = threading.Thread(
+                target=self._pump,
+                args=(
+                    getattr(self._process, stream_name),
+                    self._tails[stream_name],
+                    log,
+                    callback,
+                ),
+                daemon=True,
+            )
+            reader.start()
+            self._readers.append(reader)
+        self.peak_rss_mb = None
+        self._exited = threading.Event()
+        if memory_poll and os.path.exists(f"/proc/{self.pid}/status"):
+            threading.Thread(
+                target=self._sample_memory, args=(memory_poll,), daemon=True
+            ).start()
+
+    def _sample_memory(self, interval):
+        while True:
+            try:
+                with open(f"/proc/{self.pid}/status") as f:
+                    status = f.read()
+            except OSError:
+                return
+            # VmHWM is the high-water mark, gone once the child is a zombie
+            match = re.search(r"^VmHWM:\s+(\d+) kB", status, re.MULTILINE)
+            if match is None:
+                return
+            self.peak_rss_mb = int(match.group(1)) / 1024
+            if self._exited.wait(interval):
+                return
+
+    @staticmethod
+    def _pump(stream, tail, log, callback):
+        pending = b""
+        try:
+            while True:
+                # at most one read of the pipe, whatever the length of the lines
+                chunk = stream.read1(chunk_size)
+                if not chunk:
+                    break
+                tail.write(chunk)
+                if log is not None:
+                    log.write(chunk)
+                if callback is None:
+                    continue
+                pieces, pending = _lines(pending + chunk, max_line_bytes)
+                for piece in pieces:
+                    if not _call(callback, piece):
+                        callback = None
+                        break
+            if pending and callback is not None:
+                _call(callback, pending)
+        finally:
+            stream.close()
+            if log is not None:
+                log.close()
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def poll(self):
+        return self._process.poll()
+
+    def wait(self, timeout=None):
+        returncode = self._process.wait(timeout=timeout)
+        self._exited.set()
+        for reader in self._readers:
+            reader.join()
+        return returncode
+
+    def kill(self):
+        if self._process.poll() is None:
+            self._process.kill()
+
+    @property
+    def stdout(self):
+        return self._tails["stdout"].getvalue().decode("utf-8", errors="replace")
+
+    @property
+    def stderr(self):
+        return self._tails["stderr"].getvalue().decode("utf-8", errors="replace")
+
+
+def _lines(data, limit):
+    """Complete lines of ``data``, in pieces of at most ``limit`` bytes, and the rest
+
+    The rest is only kept while it is shorter than ``limit``.
+
+    >>> _lines(b"a\\nbcdef\\ng", 3)
+    ([b'a\\n', b'bcd', b'ef\\n'], b'g')
+    >>> _lines(b"abcd", 3)
+    ([b'abc', b'd'], b'')
+    """
+    end = data.rfind(b"\n") + 1
+    if len(data) - end > limit:
+        end = len(data)
+    pieces = [
+        line[start : start + limit]
+        for line in data[:end].splitlines(keepends=True)
+        for start in range(0, len(line), limit)
+    ]
+    return pieces, data[end:]
+
+
+def _call(callback, data):
+    """Call ``callback`` with the decoded ``data``, returns False if it failed"""
+    try:
+        callback(data.decode("utf-8", errors="replace"))
+    except Exception:
+        # the child must keep being read, or it blocks on a full pipe
+        logger.exception("output callback %r failed, it is no longer called", callback)
+        return False
+    return True
+
+
+def run_streaming(args, **kwargs):
+    """Run ``args`` to completion, returning ``(return_code, stdout, stderr)``
+
+    The returned stdout/stderr are the bounded tails of the streams, see
+    :class:`StreamedProcess` for the keyword arguments.
+
+    >>> run_streaming(["python", "-c", "import sys; sys.exit(3)"])
+    (3, '', '')
+    """
+    proc = StreamedProcess(args, **kwargs)
+    returncode = proc.wait()
+    return returncode, proc.stdout, proc.stderr
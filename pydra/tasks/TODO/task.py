@@ -0,0 +1,607 @@
+"""
+Execution of the generated SEM tasks.
+
+The classes written by ``tools/generate_tasks.py`` build a
+:class:`SEMShellCommandTask`, a ``ShellCommandTask`` whose child output is
+streamed to log files in the task output directory instead of being held in
+memory.
+"""
+import contextlib
+import copy
+import os
+import shutil
+import time
+from pathlib import Path
+
+import attr
+from pydra import ShellCommandTask
+from pydra.engine.helpers import make_klass
+
+from .affinity import thread_environment
+from .compression import compress_outputs, uncompressed_outputs
+from .failures import failure_key
+from .leases import record_result_dir, recorded_result_dir
+from .memory import killed_at
+from .progress import FilterProgressParser, register_progress, unregister_progress
+from .resume import load_result_dir, path_fields, prekey
+from .runpolicy import RunPolicy, get_run_policy
+from .speculation import attempt_outputs, race
+from .staging import move_files_async
+from .streams import StreamedProcess
+from .tracing import chrome_trace, notify, phase
+
+
+def _paths(value):
+    """The paths of ``value``, a path or a list of paths"""
+    return [
+        str(item) for item in (value if isinstance(value, (list, tuple)) else [value])
+    ]
+
+
+class SEMShellCommandTask(ShellCommandTask):
+    """ShellCommandTask for Slicer Execution Model executables
+
+    Extra keyword arguments (all others are passed on to ``ShellCommandTask``):
+
+    policy: the :class:`~.runpolicy.RunPolicy` of the task, or a dict of its
+        keyword arguments; the package-level one (see
+        :func:`~.runpolicy.set_run_policy`) by default.
+    constant_inputs: names of the inputs that are identical for every subject
+        (models, atlases), declared per tool by the generator; read from the
+        node cache of the policy (``node_cache_dir``) when it has one.
+    terminal_outputs: names of the outputs that are final results of the
+        workflow rather than intermediates; their task directories are pinned
+        in the cache manager of the policy.
+    spec_ref: reference to the specs of the tool, set by the generated
+        classes (:class:`~.xmlspec.GeneratedSpecs`) and the ones of
+        :func:`~.xmlspec.load_sem_task` (:class:`~.xmlspec.LoadedSpecs`).
+        The task is then pickled with it in place of its input and output
+        specs, which are rebuilt when it is unpickled (e.g. by a worker).
+
+    While the tool runs, ``task.progress`` holds its
+    :class:`~.progress.ProgressState` (stage, fraction, ETA), which is also
+    listed by :func:`~.progress.active_progress`.
+    """
+
+    def __init__(
+        self,
+        policy=None,
+        constant_inputs=(),
+        terminal_outputs=(),
+        spec_ref=None,
+        **kwargs,
+    ):
+        if policy is None:
+            policy = get_run_policy()
+        elif isinstance(policy, dict):
+            policy = RunPolicy(**policy)
+        self.policy = policy
+        self.progress = None
+        self.constant_inputs = list(constant_inputs)
+        self.terminal_outputs = list(terminal_outputs)
+        self.reserved_memory_mb = None
+        self.assigned_cores = None
+        self.spec_ref = spec_ref
+        self._executed = False
+        self._prekey_value = None
+        self._materialized = set()
+        self._created = time.time()
+        self._marks = {}
+        super().__init__(**kwargs)
+        if self.policy.trace_file is not None:
+            chrome_trace(self.policy.trace_file)
+
+    def __getstate__(self):
+        if self.spec_ref is None:
+            return super().__getstate__()
+        state = self.__dict__.copy()
+        del state["input_spec"], state["output_spec"]
+        state["inputs"] = {
+            name[1:] if name.startswith("_") else name: value
+            for name, value in attr.asdict(state["inputs"]).items()
+        }
+        return state
+
+    def __setstate__(self, state):
+        if "input_spec" in state:
+            return super().__setstate__(state)
+        state["input_spec"], state["output_spec"] = state["spec_ref"].load()
+        # the values were validated and converted when the task was built,
+        # set them as they are: the spec __setattr__ inspects the call stack
+        # for every field, the bulk of the unpickling time otherwise
+        klass = make_klass(state["input_spec"])
+        inputs = klass.__new__(klass)
+        for field in attr.fields(klass):
+            name = field.name[1:] if field.name.startswith("_") else field.name
+            object.__setattr__(inputs, field.name, state["inputs"][name])
+        inputs.__attrs_post_init__()
+        state["inputs"] = inputs
+        self.__dict__.update(state)
+
+    @property
+    def tool(self):
+        """Name of the SEM executable run by this task"""
+        return os.path.basename(str(self.inputs.executable).split()[-1])
+
+    @property
+    def threads(self):
+        """Number of threads the tool should use, None to leave it alone"""
+        if self.assigned_cores:
+            return len(self.assigned_cores)
+        return self.policy.cpus
+
+    def _thread_args(self, args):
+        """``args`` with the number of threads, when the tool takes it"""
+        field = attr.fields_dict(type(self.inputs)).get("numberOfThreads")
+        value = getattr(self.inputs, "numberOfThreads", None)
+        if self.threads is None or field is None or value not in (None, attr.NOTHING):
+            return args
+        return args + [field.metadata["argstr"].strip(), str(self.threads)]
+
+    def _args(self, overrides=None):
+        """Command line of the tool, with the values ``overrides`` of some inputs
+
+        The inputs are replaced field by field (staged or cached inputs,
+        outputs of an attempt, ...), never by matching values on the
+        command line.
+        """
+        inputs = self.inputs
+        if overrides:
+            # the values are paths derived from validated ones
+            self.inputs = copy.copy(inputs)
+            for name, value in overrides.items():
+                object.__setattr__(self.inputs, name, value)
+        try:
+            args = self.command_args
+        finally:
+            self.inputs = inputs
+        # removing empty strings
+        return self._thread_args([str(el) for el in args if el not in ["", " "]])
+
+    def _prekey(self):
+        """Pre-key of the task in the resume index, no file content is read
+
+        Computed once per task instance, and again when it runs.
+        """
+        if self._prekey_value is None:
+            outputs = {field[0] for field in self.output_spec.fields}
+            values = attr.asdict(self.inputs, recurse=False)
+            self._prekey_value = prekey(
+                self.tool,
+                {name: value for name, value in values.items() if name not in outputs},
+                {name: value for name, value in values.items() if name in outputs},
+                paths=path_fields(type(self.inputs)),
+            )
+        return self._prekey_value
+
+    def _path_values(self, names=None, exclude=(), outputs=False):
+        """``{field: value}`` of the inputs (or outputs) given as paths to the tool
+
+        Only the fields ``names`` (all by default) not in ``exclude``.
+        """
+        output_names = {field[0] for field in self.output_spec.fields}
+        values = {}
+        for field in attr.fields(type(self.inputs)):
+            if (field.name in output_names) != outputs:
+                continue
+            if field.name in ["executable", "args"] or field.name in exclude:
+                continue
+            if names is not None and field.name not in names:
+                continue
+            value = getattr(self.inputs, field.name)
+            if value is attr.NOTHING or value is None or isinstance(value, bool):
+                continue
+            items = value if isinstance(value, (list, tuple)) else [value]
+            if items and all(isinstance(item, (str, os.PathLike)) for item in items):
+                values[field.name] = value
+        return values
+
+    def _output_paths(self, names=None):
+        """Paths of the output files requested from the tool"""
+        values = self._path_values(names, outputs=True).values()
+        return [path for value in values for path in _paths(value)]
+
+    def _input_paths(self, names=None, exclude=()):
+        """Paths given as inputs ``names`` (all by default) to the tool, outputs excluded"""
+        values = self._path_values(names, exclude).values()
+        return [path for value in values for path in _paths(value)]
+
+    def _spawn(self, args, log_dir=None, cwd=None):
+        parser = FilterProgressParser(callback=self.policy.progress_callback)
+        cores = self.assigned_cores
+        limits = self.policy.resource_limits(self.reserved_memory_mb)
+        if limits is not None:
+            limits.create()
+        started = time.time()
+        try:
+            proc = StreamedProcess(
+                args,
+                log_dir=log_dir or self.output_dir,
+                tail_bytes=self.policy.tail_bytes,
+                max_log_bytes=self.policy.max_log_bytes,
+                log_backups=self.policy.log_backups,
+                on_stdout_line=parser.feed,
+                cwd=cwd,
+                env=thread_environment(self.threads) if self.threads else None,
+            )
+        except BaseException:
+            if limits is not None:
+                limits.release()
+            raise
+        try:
+            # from here rather than between fork and exec, where a threaded
+            # parent may only run async-signal-safe code
+            if cores:
+                os.sched_setaffinity(proc.pid, cores)
+            if limits is not None:
+                limits.apply(proc.pid)
+        except ProcessLookupError:
+            # the tool already exited
+            pass
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            if limits is not None:
+                limits.release()
+            raise
+        proc.progress = parser.state
+        proc.limits = limits
+        proc.started = started
+        proc.moved = None
+        return proc
+
+    def _notify_exit(self, proc, **args):
+        notify(
+            self,
+            "running",
+            proc.started,
+            time.time() - proc.started,
+            pid=proc.pid,
+            return_code=proc.returncode,
+            **args,
+        )
+
+    def _run_once(self, overrides, progress_key):
+        proc = self._spawn(self._args(overrides))
+        self.progress = proc.progress
+        register_progress(progress_key, proc.progress)
+        try:
+            proc.wait()
+        finally:
+            self._notify_exit(proc)
+            unregister_progress(progress_key)
+            if proc.limits is not None:
+                proc.limits.release()
+        return proc
+
+    def _run_isolated(
+        self, overrides, outputs, progress_key, threshold=None, work_root=None
+    ):
+        """Run the tool in attempt directories under ``work_root``
+
+        ``overrides`` are the inputs replaced on the command line and
+        ``outputs`` the ``{field: value}`` of the outputs as given to the tool,
+        written in the attempt directory instead. When ``threshold`` is given
+        and the first attempt runs longer than that, a duplicate is launched.
+        The outputs are moved in place in the background, and ``work_root``
+        removed, until the ``moved`` future of the returned process is done.
+        """
+        remove = [work_root] if work_root is not None else None
+        work_root = Path(work_root or self.output_dir)
+        attempts = []
+
+        def launch():
+            attempt_dir = work_root / f"attempt-{len(attempts)}"
+            attempt_dir.mkdir()
+            values, moves = attempt_outputs(outputs, attempt_dir)
+            proc = self._spawn(
+                self._args({**overrides, **values}),
+                log_dir=attempt_dir,
+                cwd=attempt_dir,
+            )
+            proc.attempt_dir = attempt_dir
+            proc.moves = moves
+            proc.progress_key = (
+                f"{progress_key}#{len(attempts)}" if attempts else progress_key
+            )
+            register_progress(proc.progress_key, proc.progress)
+            if not attempts:
+                self.progress = proc.progress
+            return proc
+
+        try:
+            winner = race(attempts, launch, threshold)
+        finally:
+            for proc in attempts:
+                proc.kill()
+                proc.wait()
+                self._notify_exit(proc, attempt=proc.attempt_dir.name)
+                unregister_progress(proc.progress_key)
+                if proc.limits is not None:
+                    proc.limits.release()
+        self.progress = winner.progress
+        moves = [
+            (str(winner.attempt_dir / name), str(self.output_dir / name))
+            for name in os.listdir(winner.attempt_dir)
+            if name.startswith(("stdout.log", "stderr.log"))
+        ]
+        if winner.returncode == 0:
+            moves += winner.moves
+        if remove is None:
+            remove = [proc.attempt_dir for proc in attempts]
+        winner.moved = move_files_async(moves, remove)
+        return winner
+
+    def _prepare_inputs(self):
+        """Inputs replaced for the node cache and the parallel compression
+
+        Returns the ``{field: value}`` of the inputs replaced, of the outputs
+        as given to the tool and the ``{uncompressed: compressed}`` outputs to
+        gzip.
+        """
+        overrides = {}
+        cache = self.policy.open_node_cache() if self.constant_inputs else None
+        if cache is not None:
+            constants = self._path_values(self.constant_inputs)
+            overrides.update(cache.materialize_values(constants))
+        outputs = self._path_values(outputs=True)
+        compressed = {}
+        gzipped = self.policy.parallel_gzip
+        if gzipped:
+            names = None if gzipped is True else gzipped
+            plain, compressed = uncompressed_outputs(
+                self._path_values(names, outputs=True)
+            )
+            outputs.update(plain)
+            overrides.update(plain)
+        return overrides, outputs, compressed
+
+    def _stage_inputs(self, stager, overrides):
+        """``overrides`` with the inputs read from their staged copies"""
+        exclude = self.constant_inputs if self.policy.node_cache_dir is not None else ()
+        values = self._path_values(exclude=exclude)
+        with phase(self, "staging", fields=len(values)):
+            return {**overrides, **stager.stage_values(values)}
+
+    def _execute(self, overrides, outputs):
+        """Run the tool, staged and/or speculatively when configured"""
+        progress_key = f"{self.name}/{self.checksum}"
+        history = self.policy.open_history()
+        threshold = self.policy.speculation_threshold(self.tool)
+        with contextlib.ExitStack() as staged_inputs:
+            stager = self.policy.open_stager()
+            if stager is not None:
+                # the staged inputs are not evicted while the tool runs
+                staged_inputs.callback(stager.release)
+                overrides = self._stage_inputs(stager, overrides)
+            memory = self.policy.memory_estimate(self.tool)
+            for attempt in range(self.policy.oom_retries + 1):
+                work_root = None
+                if stager is not None:
+                    work_root = stager.work_dir(self.checksum, self.cache_dir)
+                try:
+                    start = time.monotonic()
+                    proc = self._run_reserved(
+                        memory, overrides, outputs, progress_key, threshold, work_root
+                    )
+                except BaseException:
+                    if work_root is not None:
+                        shutil.rmtree(work_root, ignore_errors=True)
+                    raise
+                events = proc.limits.events if proc.limits is not None else None
+                killed = killed_at(
+                    proc.returncode, memory, proc.peak_rss_mb, events, proc.stderr
+                )
+                if history is not None:
+                    if proc.returncode == 0:
+                        history.record(self.tool, time.monotonic() - start)
+                        if proc.peak_rss_mb is not None:
+                            history.record_memory(self.tool, proc.peak_rss_mb)
+                    elif killed:
+                        history.record_memory(self.tool, killed, oom=True)
+                # without a memory to escalate, the retry would run the same way
+                if not killed or attempt == self.policy.oom_retries:
+                    return proc
+                if proc.moved is not None:
+                    # its logs, and the working directory taken again
+                    proc.moved.result()
+                memory = self.policy.oom_escalation * killed
+                notify(self, "oom", time.time(), attempt=attempt, memory_mb=memory)
+
+    def _run_reserved(
+        self, memory, overrides, outputs, progress_key, threshold, work_root
+    ):
+        """Run the tool once ``memory`` (MB) is reserved in the memory budget"""
+        self.reserved_memory_mb = memory
+        budget = self.policy.open_memory_budget()
+        with contextlib.ExitStack() as reserved:
+            if budget is not None and memory:
+                with phase(self, "reserving", memory_mb=memory):
+                    reserved.enter_context(budget.reserve(memory))
+            if threshold is None and work_root is None:
+                return self._run_once(overrides, progress_key)
+            return self._run_isolated(
+                overrides, outputs, progress_key, threshold, work_root
+            )
+
+    def _indexed_result(self):
+        """``(task_dir, result)`` from the resume index, ``(None, None)`` if absent"""
+        index = self.policy.open_resume_index()
+        if index is None or self.state is not None:
+            return None, None
+        return index.load(self._prekey())
+
+    def result(self, state_index=None, return_inputs=False):
+        task_dir, result = None, None
+        if not return_inputs:
+            task_dir, result = self._indexed_result()
+        if result is None:
+            result = super().result(
+                state_index=state_index, return_inputs=return_inputs
+            )
+        if result is None and self.state is None:
+            # computed by the run in flight this one waited for
+            task_dir = recorded_result_dir(self.output_dir)
+            if task_dir is not None:
+                result = load_result_dir(task_dir)
+        store = self.policy.open_compressed_store()
+        if store is not None and result is not None:
+            if task_dir is not None:
+                task_dirs = [task_dir]
+            elif self.state is None:
+                task_dirs = [self.output_dir]
+            elif state_index is None:
+                task_dirs = self.output_dir
+            else:
+                task_dirs = [self.cache_dir / self.checksum_states(state_index)]
+            results = result if isinstance(result, list) else [result]
+            for task_dir, task_result in zip(task_dirs, results):
+                if return_inputs:
+                    task_result = task_result[1]
+                # only the outputs returned
+                if task_result is not None and not task_result.errored:
+                    self._materialize(store, task_dir)
+        return result
+
+    def _materialize(self, store, task_dir):
+        """Decompress the outputs of ``task_dir`` from ``store``, once per task"""
+        if str(task_dir) in self._materialized:
+            return
+        self._materialized.add(str(task_dir))
+        if store.materialize(task_dir):
+            manager = self.policy.open_cache_manager(self.cache_dir)
+            if manager is not None:
+                manager.refresh_size(task_dir)
+
+    def _run_leased(self, rerun=False):
+        """Run the task unless an identical run is in flight, returns ``(task_dir, result)``"""
+        registry = self.policy.open_lease_registry()
+        if registry is None or self.state is not None or rerun or self.task_rerun:
+            result = self._run_pydra(rerun=rerun)
+            return self.output_dir, result
+        while True:
+            lease = registry.acquire(self.checksum, self.output_dir)
+            if lease is not None:
+                break
+            with phase(self, "waiting"):
+                task_dir = registry.wait(self.checksum)
+            if task_dir is not None:
+                result = load_result_dir(task_dir)
+                if result is not None and not result.errored:
+                    # for result(), the output directory here stays empty
+                    record_result_dir(self.output_dir, task_dir)
+                    return task_dir, result
+            # the other run failed or died, try to run it here
+        with lease:
+            result = self._run_pydra(rerun=rerun)
+        return self.output_dir, result
+
+    def _run_pydra(self, rerun=False):
+        """``ShellCommandTask._run`` reporting its preparation and result saving"""
+        self._marks = {"prepare": time.time()}
+        try:
+            return super()._run(rerun=rerun)
+        finally:
+            if "collected" in self._marks:
+                # hooks, audit and pickling of the result
+                start = self._marks["collected"]
+                notify(self, "saving", start, time.time() - start)
+
+    def _collect_outputs(self, output_dir):
+        with phase(self, "collecting"):
+            outputs = super()._collect_outputs(output_dir)
+        self._marks["collected"] = time.time()
+        return outputs
+
+    def _run(self, rerun=False, **kwargs):
+        if self.policy.trace_file is not None:
+            chrome_trace(self.policy.trace_file)
+        notify(self, "queued", self._created, time.time() - self._created)
+        with phase(self, "task") as event:
+            result = self._run_managed(rerun=rerun, **kwargs)
+            event.update(executed=self._executed, errored=result.errored)
+        return result
+
+    def _run_managed(self, rerun=False, **kwargs):
+        self._executed = False
+        self.inputs = attr.evolve(self.inputs, **kwargs)
+        self._prekey_value = None
+        index = self.policy.open_resume_index()
+        task_dir = None
+        if index is not None and self.state is None and not (rerun or self.task_rerun):
+            task_dir, result = index.load(self._prekey())
+        if task_dir is None:
+            with phase(self, "hashing") as hashing:
+                self.checksum
+                hashing["bytes"] = sum(
+                    os.path.getsize(path)
+                    for path in self._input_paths()
+                    if os.path.isfile(path)
+                )
+            task_dir, result = self._run_leased(rerun=rerun)
+        compressed = self.policy.open_compressed_store()
+        if compressed is not None and not self._executed and not result.errored:
+            self._materialize(compressed, task_dir)
+        blobs = self.policy.open_blob_store(self.cache_dir)
+        if blobs is not None and self._executed and not result.errored:
+            blobs.dedupe_dir(task_dir)
+        if index is not None and self.state is None and not result.errored:
+            index.add(self._prekey(), task_dir)
+        manager = self.policy.open_cache_manager(self.cache_dir)
+        if manager is not None and not result.errored:
+            manager.register(
+                task_dir,
+                executed=self._executed,
+                pinned=bool(self._output_paths(names=self.terminal_outputs)),
+            )
+        if compressed is not None:
+            compressed.compact_due(self.cache_dir, manager, keep=[task_dir])
+        return result
+
+    def _run_task(self):
+        if "prepare" in self._marks:
+            # lock, cache lookup, output directory and audit set up by pydra
+            start = self._marks.pop("prepare")
+            notify(self, "preparing", start, time.time() - start)
+        failures = self.policy.open_failure_cache()
+        if failures is not None:
+            key = failure_key(self.checksum, str(self.inputs.executable).split()[-1])
+            failures.check(key, self.tool)
+        self._executed = True
+        self.output_ = None
+        with phase(self, "formatting"):
+            args = self.command_args
+        if args:
+            # removing empty strings
+            args = [str(el) for el in args if el not in ["", " "]]
+            overrides, outputs, compressed = self._prepare_inputs()
+            with contextlib.ExitStack() as allocated:
+                with phase(self, "reserving", cores=self.policy.cpus or 1):
+                    cores = allocated.enter_context(self.policy.allocate_cores())
+                self.assigned_cores = cores
+                proc = self._execute(overrides, outputs)
+            if proc.moved is not None:
+                # the cores and memory were handed back meanwhile
+                with phase(self, "moving"):
+                    proc.moved.result()
+            return_code = proc.returncode
+            if return_code == 0:
+                with phase(self, "compressing", files=len(compressed)):
+                    compress_outputs(
+                        compressed,
+                        threads=self.policy.gzip_threads,
+                        compresslevel=self.policy.gzip_level,
+                    )
+            self.output_ = {
+                "return_code": return_code,
+                "stdout": proc.stdout.strip() if self.strip else proc.stdout,
+                "stderr": proc.stderr,
+            }
+            if return_code:
+                if failures is not None:
+                    failures.record(key, self.tool, return_code, proc.stderr)
+                msg = f"{args[0]} exited with code {return_code}, logs in {self.output_dir}"
+                tail = proc.stderr or proc.stdout
+                if tail:
+                    msg += f":\n{tail}"
+                raise RuntimeError(msg)
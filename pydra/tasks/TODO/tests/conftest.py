@@ -0,0 +1,115 @@
+import json
+import shlex
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+tools_dir = Path(__file__).resolve().parents[4] / "tools"
+
+
+@pytest.fixture(scope="session")
+def generated(tmp_path_factory):
+    """Tasks generated from ``tools/xmls`` with stand-in executables
+
+    The task packages are importable while the fixture is alive; returns
+    the directories of the tasks and of the stand-ins.
+    """
+    if not (tools_dir / "generate_tasks.py").exists():
+        pytest.skip("the generator is not in this tree")
+    root = tmp_path_factory.mktemp("generated")
+    tasks_dir, fake_bin = root / "tasks", root / "bin"
+    subprocess.run(
+        [
+            sys.executable,
+            str(tools_dir / "generate_tasks.py"),
+            str(tasks_dir),
+            str(tools_dir / "xmls"),
+            f"--fake-bin={fake_bin}",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    sys.path.insert(0, str(tasks_dir))
+    yield tasks_dir, fake_bin
+    sys.path.remove(str(tasks_dir))
+    packages = {path.name for path in tasks_dir.iterdir() if path.is_dir()}
+    for name in list(sys.modules):
+        if name.split(".")[0] in packages:
+            del sys.modules[name]
+
+
+class Tool:
+    """Stand-in of ``name`` behind a shell script logging its runs
+
+    ``prelude`` is shell code run before the stand-in, ``$runs`` is the
+    number of the run (1 for the first one).
+    """
+
+    def __init__(self, directory, fake_bin, name, prelude=""):
+        self.directory = directory
+        self.path = directory / "bin" / name
+        self.log = directory / f"{name}.runs"
+        self.path.parent.mkdir(exist_ok=True)
+        self.path.write_text(
+            "#!/bin/sh\n"
+            f'echo "$*" >> {shlex.quote(str(self.log))}\n'
+            f"runs=$(wc -l < {shlex.quote(str(self.log))})\n"
+            f"{prelude}\n"
+            f'exec {shlex.quote(str(fake_bin / name))} "$@"\n'
+        )
+        self.path.chmod(0o755)
+
+    def runs(self):
+        """Command lines of the runs so far"""
+        if not self.log.exists():
+            return []
+        return [line.split() for line in self.log.read_text().splitlines()]
+
+
+@pytest.fixture
+def make_tool(generated, tmp_path):
+    """Factory of :class:`Tool` stand-ins"""
+    _, fake_bin = generated
+    return lambda name, prelude="": Tool(tmp_path, fake_bin, name, prelude)
+
+
+@pytest.fixture
+def input_volume(tmp_path):
+    path = tmp_path / "t1.nii"
+    path.write_bytes(bytes(1024))
+    return str(path)
+
+
+@pytest.fixture
+def resample(generated, make_tool, input_volume, tmp_path):
+    """``resample(policy=None, tool=None, cache_dir=None, **inputs)``, a BRAINSResample task
+
+    The task runs the :class:`Tool` ``tool``, ``resample.tool`` by default.
+    """
+    from registration.brainsresample import BRAINSResample
+
+    def build(policy=None, tool=None, cache_dir=None, **inputs):
+        inputs.setdefault("inputVolume", input_volume)
+        inputs.setdefault("outputVolume", str(tmp_path / "resampled.nii"))
+        return BRAINSResample(
+            executable=str((tool or build.tool).path),
+            cache_dir=cache_dir or str(tmp_path / "cache"),
+            policy=policy,
+        ).get_task(**inputs)
+
+    build.tool = make_tool("BRAINSResample")
+    return build
+
+
+@pytest.fixture
+def cost_model(tmp_path, monkeypatch):
+    """``cost_model(**costs)`` sets the default cost model of the stand-ins"""
+
+    def set_costs(**costs):
+        path = tmp_path / "cost.json"
+        path.write_text(json.dumps({"default": costs}))
+        monkeypatch.setenv("SEM_FAKE_COST", str(path))
+
+    return set_costs
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from pydra.tasks.TODO.affinity import CoreAllocator
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="no CPU affinity on this platform"
+)
+
+# the affinity is set from the parent once the tool started
+report = (
+    "sleep 1; "
+    'echo "cores=$(grep Cpus_allowed_list /proc/self/status | cut -f2) '
+    'threads=$ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS" >> "$0.report"'
+)
+
+
+def _report(tool):
+    with open(f"{tool.path}.report") as f:
+        return dict(item.split("=") for item in f.read().split())
+
+
+def test_cores(resample, make_tool):
+    core = min(os.sched_getaffinity(0))
+    tool = make_tool("BRAINSResample", prelude=report)
+    task = resample(RunPolicy(cores=[core]), tool=tool)
+    assert task().output.return_code == 0
+    assert _report(tool) == {"cores": str(core), "threads": "1"}
+    (args,) = tool.runs()
+    assert args[args.index("--numberOfThreads") + 1] == "1"
+
+
+def test_core_allocator(resample, make_tool, tmp_path):
+    tool = make_tool("BRAINSResample", prelude=report)
+    allocator = CoreAllocator(tmp_path / "cores.sqlite")
+    task = resample(RunPolicy(core_allocator=allocator, cpus=1), tool=tool)
+    assert task().output.return_code == 0
+    reported = _report(tool)
+    assert int(reported["cores"]) in os.sched_getaffinity(0)
+    assert reported["threads"] == "1"
+    # the core is handed back once the tool exited
+    with allocator.allocate(len(os.sched_getaffinity(0))) as cores:
+        assert len(cores) == len(os.sched_getaffinity(0))
@@ -0,0 +1,29 @@
+import os
+
+from pydra.tasks.TODO.blobstore import BlobStore
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_dedupe_and_gc(tmp_path):
+    store = BlobStore(tmp_path / "blobs", min_size=1)
+    outputs = []
+    for name in ["a", "b"]:
+        (tmp_path / name).mkdir()
+        outputs.append(tmp_path / name / "labels.nii")
+        outputs[-1].write_bytes(b"labels" * 100)
+        assert store.dedupe_dir(tmp_path / name) == ["labels.nii"]
+    assert os.path.samefile(*outputs)
+    for path in outputs:
+        os.unlink(path)
+    assert store.gc() == 1
+
+
+def test_task_outputs(resample, cost_model, tmp_path):
+    cost_model(output_bytes=4096, output_content="random")
+    policy = RunPolicy(blob_store={"min_size": 1})
+    task = resample(policy, outputVolume="resampled.nii")
+    assert task().output.return_code == 0
+    output = task.output_dir / "resampled.nii"
+    blobs = tmp_path / "cache" / ".sem_blobs" / "blobs"
+    assert os.stat(output).st_nlink == 2
+    assert any(os.path.samefile(output, path) for path in blobs.glob("*/*"))
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from filelock import SoftFileLock
+
+from pydra.tasks.TODO.cachemanager import CacheManager
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def _entries(cache_dir, *names):
+    for name in names:
+        os.mkdir(cache_dir / name)
+        (cache_dir / name / "out.nii").write_bytes(bytes(100))
+
+
+def _inputs(tmp_path, name):
+    path = tmp_path / f"{name}.nii"
+    path.write_bytes(name.encode())
+    return {"inputVolume": str(path), "outputVolume": f"{name}_resampled.nii"}
+
+
+@pytest.mark.parametrize("pinned", [False, True])
+def test_eviction(resample, generated, tmp_path, pinned):
+    from registration.brainsresample import BRAINSResample
+
+    policy = RunPolicy(cache_manager={"max_bytes": 0, "evict_interval": 0})
+    first = BRAINSResample(
+        executable=str(resample.tool.path),
+        cache_dir=str(tmp_path / "cache"),
+        terminal_outputs=["outputVolume"] if pinned else (),
+        policy=policy,
+    ).get_task(**_inputs(tmp_path, "first"))
+    assert first().output.return_code == 0
+    second = resample(policy, **_inputs(tmp_path, "second"))
+    assert second().output.return_code == 0
+    # over budget, the least recently used directory goes unless it is pinned
+    assert first.output_dir.exists() == pinned
+    assert second.output_dir.exists()
+
+
+def test_lfu(tmp_path):
+    _entries(tmp_path, "a", "b", "c")
+    manager = CacheManager(tmp_path, max_bytes=100, policy="lfu")
+    for name in ["a", "b", "c"]:
+        manager.record(name)
+    manager.touch("a")
+    manager.touch("a")
+    manager.touch("b")
+    assert manager.evict() == ["c", "b"]
+
+
+def test_locked_entries_are_kept(tmp_path):
+    _entries(tmp_path, "a", "b")
+    manager = CacheManager(tmp_path, max_bytes=0)
+    manager.record("a")
+    manager.record("b")
+    # pydra holds this lock while the task runs in the directory
+    with SoftFileLock(str(tmp_path / "a.lock")):
+        assert manager.evict() == ["b"]
+    assert manager.evict() == ["a"]
+
+
+def test_register(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    _entries(cache_dir, "a")
+    manager = CacheManager(cache_dir, max_bytes=1000)
+    manager.register(cache_dir / "a", pinned=True)
+    assert manager.total_size() == 100
+    # a result reused from another cache is not managed here
+    _entries(tmp_path, "b")
+    assert manager.register(tmp_path / "b", executed=False) == []
+    assert manager.total_size() == 100
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from pydra.tasks.TODO.cachemanager import CacheManager
+from pydra.tasks.TODO.compressedstore import CompressedStore
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+pytest.importorskip("zstandard")
+
+
+def _task_dir(cache_dir, name):
+    task_dir = cache_dir / name
+    task_dir.mkdir()
+    (task_dir / "_result.pklz").write_bytes(b"result")
+    (task_dir / "labels.nii").write_bytes(bytes(100000))
+    return task_dir
+
+
+def test_compact(tmp_path):
+    for name in ["a", "b"]:
+        _task_dir(tmp_path, name)
+    manager = CacheManager(tmp_path)
+    manager.scan()
+    store = CompressedStore(min_size=1024, idle=0)
+    assert store.compact(tmp_path, idle=3600) == []
+    assert store.compact(tmp_path, manager=manager, keep=["b"]) == ["a"]
+    assert not (tmp_path / "a" / "labels.nii").exists()
+    # the size of the compressed directory is updated
+    assert manager.total_size() < 110000
+    assert store.materialize(tmp_path / "a") == ["labels.nii"]
+    assert (tmp_path / "a" / "labels.nii").read_bytes() == bytes(100000)
+
+
+def test_compact_due(tmp_path):
+    _task_dir(tmp_path, "a")
+    store = CompressedStore(min_size=1024, idle=0, compact_interval=3600)
+    assert store.compact_due(tmp_path) == ["a"]
+    _task_dir(tmp_path, "b")
+    # compacted a moment ago
+    assert store.compact_due(tmp_path) == []
+    assert CompressedStore(compact_interval=None).compact_due(tmp_path) == []
+
+
+def test_task_cache_hit(resample, cost_model, tmp_path):
+    cost_model(output_bytes=100000, output_content="zeros")
+    policy = RunPolicy(
+        cache_manager={},
+        compressed_store={"min_size": 1024, "idle": 0, "compact_interval": 0},
+    )
+    first = resample(policy, outputVolume="resampled.nii")
+    output = Path(first().output.outputVolume)
+    assert output.exists()
+    other = tmp_path / "other.nii"
+    other.write_bytes(b"other")
+    # the next task compacts the idle directory of the first one
+    assert resample(policy, inputVolume=str(other))().output.return_code == 0
+    assert not output.exists()
+    manager = CacheManager(tmp_path / "cache")
+    compacted = manager.total_size()
+    # served from the cache, the outputs are decompressed
+    again = resample(policy, outputVolume="resampled.nii")
+    assert Path(again().output.outputVolume) == output
+    assert not again._executed
+    assert output.read_bytes() == bytes(100000)
+    assert manager.total_size() > compacted + 90000
+    assert len(resample.tool.runs()) == 2
+    assert os.path.exists(tmp_path / "cache" / ".sem_compacted")
@@ -0,0 +1,39 @@
+import gzip
+import os
+
+import pytest
+
+from pydra.tasks.TODO.compression import parallel_gzip, uncompressed_outputs
+
+
+@pytest.mark.parametrize("size", [0, 1, 99999, 100000, 250001])
+def test_parallel_gzip(tmp_path, size):
+    src = tmp_path / "volume.nii"
+    data = os.urandom(size // 2) + bytes(size - size // 2)
+    src.write_bytes(data)
+    dst = parallel_gzip(src, tmp_path / "volume.nii.gz", threads=3, block_size=100000)
+    with gzip.open(dst) as f:
+        assert f.read() == data
+
+
+def test_uncompressed_outputs():
+    values, compressed = uncompressed_outputs(
+        {"outputVolumes": ["a.nii.gz", "b.nrrd"], "outputVolume": "c.nii.gz"}
+    )
+    assert values == {"outputVolumes": ["a.nii", "b.nrrd"], "outputVolume": "c.nii"}
+    assert compressed == {"a.nii": "a.nii.gz", "c.nii": "c.nii.gz"}
+
+
+def test_task_parallel_gzip(resample, cost_model, tmp_path):
+    cost_model(output_bytes=300000, output_content="zeros")
+    output = tmp_path / "resampled.nii.gz"
+    task = resample(
+        policy={"parallel_gzip": True, "gzip_threads": 2}, outputVolume=str(output)
+    )
+    assert task().output.return_code == 0
+    (args,) = resample.tool.runs()
+    # the tool writes the volume uncompressed, the task compresses it
+    assert args[args.index("--outputVolume") + 1] == str(tmp_path / "resampled.nii")
+    assert not (tmp_path / "resampled.nii").exists()
+    with gzip.open(output) as f:
+        assert f.read() == bytes(300000)
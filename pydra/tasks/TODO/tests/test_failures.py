@@ -0,0 +1,27 @@
+import pytest
+
+from pydra.tasks.TODO.failures import FailureCache, KnownFailureError
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_known_failure(resample, tmp_path):
+    policy = RunPolicy(failure_cache=tmp_path / "failures.sqlite")
+    with pytest.raises(RuntimeError, match="PARSE ERROR"):
+        resample(policy, args="--noSuchFlag")()
+    with pytest.raises(KnownFailureError, match="usage"):
+        resample(policy, cache_dir=str(tmp_path / "other"), args="--noSuchFlag")()
+    assert len(resample.tool.runs()) == 1
+    # once cleared, the tool runs again
+    assert FailureCache(tmp_path / "failures.sqlite").clear(tool="BRAINSResample") == 1
+    with pytest.raises(RuntimeError, match="PARSE ERROR"):
+        resample(policy, cache_dir=str(tmp_path / "third"), args="--noSuchFlag")()
+    assert len(resample.tool.runs()) == 2
+
+
+def test_transient_failure_not_cached(resample, make_tool, tmp_path):
+    tool = make_tool("BRAINSResample", prelude="kill -9 $$")
+    policy = RunPolicy(failure_cache=tmp_path / "failures.sqlite")
+    for cache_dir in ["a", "b"]:
+        with pytest.raises(RuntimeError, match="exited with code -9"):
+            resample(policy, tool=tool, cache_dir=str(tmp_path / cache_dir))()
+    assert len(tool.runs()) == 2
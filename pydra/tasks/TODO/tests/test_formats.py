@@ -0,0 +1,19 @@
+from pydra.tasks.TODO.formats import OutputPolicy, set_output_policy
+
+
+def test_output_policy(generated, tmp_path):
+    from registration.brainsresample import BRAINSResample
+
+    def output(**options):
+        task = BRAINSResample(cache_dir=str(tmp_path), **options).get_task(
+            inputVolume="t1.nii", outputVolume=True
+        )
+        return task.inputs.outputVolume
+
+    assert output().endswith(".nii")
+    assert output(terminal_outputs=["outputVolume"]).endswith(".nii.gz")
+    previous = set_output_policy(OutputPolicy(compress_intermediate=True))
+    try:
+        assert output().endswith(".nii.gz")
+    finally:
+        set_output_policy(previous)
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+from .conftest import tools_dir
+
+
+def _executable(path, body):
+    path.write_text(f"#!/bin/sh\n{body}\n")
+    path.chmod(0o755)
+
+
+def test_discover(generated, tmp_path):
+    _, fake_bin = generated
+    others = tmp_path / "bin"
+    others.mkdir()
+    # neither answers a SEM description in time
+    _executable(others / "BRAINSRogue", "echo '<executable>'")
+    _executable(others / "BRAINSRhang", "exec sleep 60")
+    output_dir = tmp_path / "tasks"
+    subprocess.run(
+        [
+            sys.executable,
+            str(tools_dir / "generate_tasks.py"),
+            str(output_dir),
+            "--discover",
+            str(fake_bin),
+            str(others),
+            "--match",
+            "BRAINSR*",
+            "--probe-timeout",
+            "2",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    generated_modules = sorted(
+        name
+        for _, _, files in os.walk(output_dir)
+        for name in files
+        if name.startswith("brains")
+    )
+    assert generated_modules == ["brainsresample.py", "brainsroiauto.py"]
+
+
+def test_per_tool_modules(generated):
+    tasks_dir, _ = generated
+    assert (tasks_dir / "registration" / "brainsresample.py").exists()
+    # in a fresh interpreter: the tool modules are imported on first access
+    check = (
+        "import sys, segmentation\n"
+        "assert 'BRAINSROIAuto' in dir(segmentation.specialized)\n"
+        "assert 'segmentation.specialized.brainsroiauto' not in sys.modules\n"
+        "from segmentation.specialized.brainsroiauto import BRAINSROIAuto\n"
+        "assert segmentation.specialized.BRAINSROIAuto is BRAINSROIAuto\n"
+        "assert not hasattr(segmentation, 'Missing')\n"
+    )
+    path = os.pathsep.join([str(tasks_dir), str(tools_dir.parent)])
+    subprocess.run(
+        [sys.executable, "-c", check],
+        env={**os.environ, "PYTHONPATH": path},
+        check=True,
+    )
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from pydra.tasks.TODO.leases import LeaseRegistry
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_owner_per_lease(tmp_path):
+    registry = LeaseRegistry(tmp_path / "leases.sqlite", ttl=0.1)
+    lease = registry.acquire("8589cfe6", "/cache/a/task")
+    assert registry.acquire("8589cfe6", "/cache/b/task") is None
+    time.sleep(0.2)
+    # expired, taken over by another task of the same process
+    takeover = registry.acquire("8589cfe6", "/cache/b/task")
+    assert takeover is not None
+    lease.release()
+    assert registry.holder("8589cfe6") == "/cache/b/task"
+    takeover.release()
+    assert registry.holder("8589cfe6") is None
+
+
+def test_inflight_leases(resample, cost_model, tmp_path):
+    cost_model(seconds=2)
+    policy = RunPolicy(inflight_leases=tmp_path / "leases.sqlite")
+    outputs = {"outputVolume": str(tmp_path / "resampled.nii")}
+    results = {}
+    first = resample(policy, cache_dir=str(tmp_path / "a"), **outputs)
+    running = threading.Thread(target=lambda: results.update(first=first()))
+    running.start()
+    while not resample.tool.runs():
+        time.sleep(0.05)
+    # identical to the run in flight, in another cache_dir, run by a worker
+    second = resample(policy, cache_dir=str(tmp_path / "b"), **outputs)
+    results["second"] = second(plugin="cf")
+    running.join()
+    assert len(resample.tool.runs()) == 1
+    assert [result.output.return_code for result in results.values()] == [0, 0]
+    # the waiting task finds the result it reused
+    assert not second.output_dir.exists()
+    result = second.result()
+    assert result.output.return_code == 0
+    assert result.output.outputVolume == first.result().output.outputVolume
+    # a new instance as well, e.g. in the submitter of a worker pool
+    assert resample(policy, cache_dir=str(tmp_path / "b"), **outputs).result()
@@ -0,0 +1,45 @@
+import logging
+
+from pydra.tasks.TODO.limits import ResourceLimits
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_cpu_time_limit(resample, make_tool):
+    # the limits are applied from the parent once the tool started
+    tool = make_tool("BRAINSResample", prelude='sleep 1; ulimit -t > "$0.report"')
+    task = resample(RunPolicy(enforce_limits=True, cpu_time_limit=30), tool=tool)
+    assert task().output.return_code == 0
+    with open(f"{tool.path}.report") as f:
+        assert f.read().strip() == "30"
+
+
+def test_memory_rlimit(resample, make_tool, cost_model):
+    # the stand-in allocates more than the data segment it is allowed
+    cost_model(memory_mb=1024)
+    policy = RunPolicy(
+        enforce_limits=True,
+        memory_mb=256,
+        memory_rlimit="RLIMIT_DATA",
+        memory_headroom=1,
+        oom_retries=1,
+        oom_escalation=8,
+    )
+    tool = make_tool("BRAINSResample", prelude="sleep 1")
+    task = resample(policy, tool=tool)
+    # the failed allocation is taken for an OOM kill, retried with more memory
+    assert task().output.return_code == 0
+    assert len(tool.runs()) == 2
+    assert task.reserved_memory_mb == 8 * 256
+
+
+def test_memory_not_enforced(caplog):
+    limits = ResourceLimits(memory_mb=1024)
+    with caplog.at_level(logging.WARNING):
+        limits.create()
+    assert "memory_mb=1024 is not enforced" in caplog.text
+    caplog.clear()
+    limits = ResourceLimits(memory_mb=1024, memory_rlimit="RLIMIT_AS")
+    with caplog.at_level(logging.WARNING):
+        limits.create()
+    assert not caplog.text
+    assert limits.rlimits() == {"RLIMIT_AS": 4 * 1024 * 2 ** 20}
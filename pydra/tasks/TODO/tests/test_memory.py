@@ -0,0 +1,36 @@
+import pytest
+
+from pydra.tasks.TODO.history import RuntimeHistory
+from pydra.tasks.TODO.memory import MemoryBudget
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_oom_retry(resample, make_tool, tmp_path):
+    tool = make_tool("BRAINSResample", prelude='[ "$runs" -eq 1 ] && kill -9 $$')
+    history = RuntimeHistory(tmp_path / "history.json")
+    task = resample(
+        RunPolicy(runtime_history=history, memory_mb=100, oom_retries=1), tool=tool
+    )
+    assert task().output.return_code == 0
+    assert len(tool.runs()) == 2
+    # the retry reserves more than the memory the run was killed at
+    assert task.reserved_memory_mb == 1.5 * 100
+    # the kill raises the estimate of the next runs
+    assert history.memory_estimate("BRAINSResample") >= 1.2 * 100
+
+
+def test_oom_no_retry(resample, make_tool):
+    tool = make_tool("BRAINSResample", prelude="kill -9 $$")
+    task = resample(RunPolicy(memory_mb=100), tool=tool)
+    with pytest.raises(RuntimeError, match="exited with code -9"):
+        task()
+    assert len(tool.runs()) == 1
+
+
+def test_memory_budget(resample, tmp_path):
+    budget = MemoryBudget(tmp_path / "memory.sqlite", total_mb=1000)
+    task = resample(policy={"memory_budget": budget, "memory_mb": 600})
+    assert task().output.return_code == 0
+    assert task.reserved_memory_mb == 600
+    # released once the tool exited
+    assert budget.reserved() == 0
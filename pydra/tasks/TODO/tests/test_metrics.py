@@ -0,0 +1,35 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pydra.tasks.TODO.metrics import serve
+from pydra.tasks.TODO.tracing import remove_observer
+
+
+@pytest.fixture
+def server():
+    server = serve(port=0)
+    yield server
+    remove_observer(server.registry)
+    server.shutdown()
+    server.server_close()
+
+
+def _get(server, path="/metrics"):
+    host, port = server.server_address[:2]
+    with urllib.request.urlopen(f"http://{host}:{port}{path}") as response:
+        return response.read().decode()
+
+
+def test_serve(server, resample):
+    assert resample()().output.return_code == 0
+    # identical, served from the cache
+    assert resample()().output.return_code == 0
+    lines = _get(server).splitlines()
+    assert 'sem_tasks_total{tool="BRAINSResample",outcome="executed"} 1' in lines
+    assert 'sem_tasks_total{tool="BRAINSResample",outcome="cached"} 1' in lines
+    assert 'sem_phase_in_progress{tool="BRAINSResample",phase="task"} 0' in lines
+    assert 'sem_phase_seconds_count{tool="BRAINSResample",phase="running"} 1' in lines
+    with pytest.raises(urllib.error.HTTPError, match="404"):
+        _get(server, "/other")
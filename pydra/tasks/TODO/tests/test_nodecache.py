@@ -0,0 +1,58 @@
+import os
+
+from pydra.tasks.TODO.nodecache import NodeCache
+
+
+def test_constant_inputs(generated):
+    from registration.brainsresample import BRAINSResample
+    from utilities.brains.brainslandmarkinitializer import BRAINSLandmarkInitializer
+
+    assert BRAINSLandmarkInitializer.constant_inputs == [
+        "inputFixedLandmarkFilename",
+        "inputWeightFilename",
+    ]
+    assert BRAINSResample.constant_inputs == []
+
+
+def test_materialize_once(tmp_path):
+    atlas = tmp_path / "atlas.nii"
+    atlas.write_bytes(b"atlas")
+    cache = NodeCache(tmp_path / "node")
+    cached = cache.materialize(str(atlas))
+    assert cache.materialize(str(atlas)) == cached
+    assert open(cached, "rb").read() == b"atlas"
+    # a snapshot, read-only
+    assert not os.stat(cached).st_mode & 0o222
+    assert not os.path.samefile(cached, atlas)
+    values = cache.materialize_values({"atlas": str(atlas), "models": [str(atlas)]})
+    assert values == {"atlas": cached, "models": [cached]}
+
+
+def test_node_cache(make_tool, tmp_path):
+    from utilities.brains.brainslandmarkinitializer import BRAINSLandmarkInitializer
+
+    tool = make_tool("BRAINSLandmarkInitializer")
+    landmarks = {}
+    for name in ["fixed", "moving", "weights"]:
+        landmarks[name] = tmp_path / f"{name}.fcsv"
+        landmarks[name].write_text(name)
+    task = BRAINSLandmarkInitializer(
+        executable=str(tool.path),
+        cache_dir=str(tmp_path / "cache"),
+        policy={"node_cache_dir": tmp_path / "node"},
+    ).get_task(
+        inputFixedLandmarkFilename=str(landmarks["fixed"]),
+        inputMovingLandmarkFilename=str(landmarks["moving"]),
+        inputWeightFilename=str(landmarks["weights"]),
+        outputTransformFilename=str(tmp_path / "transform.h5"),
+    )
+    assert task().output.return_code == 0
+    (args,) = tool.runs()
+
+    def value(flag):
+        return args[args.index(flag) + 1]
+
+    # the atlas landmarks and weights are constant inputs, not the subject's
+    assert value("--inputFixedLandmarkFilename").startswith(str(tmp_path / "node"))
+    assert value("--inputWeightFilename").startswith(str(tmp_path / "node"))
+    assert value("--inputMovingLandmarkFilename") == str(landmarks["moving"])
@@ -0,0 +1,35 @@
+import pickle
+
+import attr
+
+from pydra.tasks.TODO.history import RuntimeHistory
+from pydra.tasks.TODO.runpolicy import RunPolicy
+from pydra.tasks.TODO.task import SEMShellCommandTask
+from pydra.tasks.TODO.xmlspec import load_sem_task
+
+
+def _check_clone(task):
+    state = task.__getstate__()
+    # the specs are rebuilt from their reference
+    assert "input_spec" not in state and "output_spec" not in state
+    clone = pickle.loads(pickle.dumps(task))
+    assert isinstance(clone, SEMShellCommandTask)
+    assert attr.asdict(clone.inputs) == attr.asdict(task.inputs)
+    assert clone.checksum == task.checksum
+    return clone
+
+
+def test_generated(resample, tmp_path):
+    policy = RunPolicy(runtime_history=RuntimeHistory(tmp_path / "history.json"))
+    clone = _check_clone(resample(policy))
+    assert clone.policy.open_history().path == policy.runtime_history.path
+    assert clone().output.return_code == 0
+    assert policy.runtime_history.durations("BRAINSResample")
+
+
+def test_loaded(make_tool, input_volume, tmp_path):
+    cls = load_sem_task(make_tool("BRAINSResample").path)
+    task = cls(cache_dir=str(tmp_path / "cache")).get_task(
+        inputVolume=input_volume, outputVolume=str(tmp_path / "resampled.nii")
+    )
+    assert _check_clone(task)().output.return_code == 0
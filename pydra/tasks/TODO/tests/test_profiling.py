@@ -0,0 +1,28 @@
+import pytest
+
+from pydra.tasks.TODO.profiling import OverheadProfiler, python_phases
+from pydra.tasks.TODO.tracing import observers
+
+
+def test_overhead(resample):
+    task = resample()
+    with OverheadProfiler() as profiler:
+        assert task().output.return_code == 0
+    assert profiler not in observers()
+    summary = profiler.summary()
+    assert list(summary) == ["BRAINSResample"]
+    means = summary["BRAINSResample"]
+    assert {"hashing", "formatting", "collecting", "running"} <= set(means)
+    assert means["overhead"] == pytest.approx(
+        sum(means.get(name, 0.0) for name in python_phases)
+    )
+    assert len(profiler.durations["BRAINSResample"]["running"]) == 1
+    assert profiler.report().splitlines()[1].startswith("BRAINSResample")
+    with pytest.raises(RuntimeError, match="cprofile=True"):
+        profiler.stats()
+
+
+def test_cprofile(resample):
+    with OverheadProfiler(cprofile=True) as profiler:
+        assert resample()().output.return_code == 0
+    assert "_run_task" in profiler.stats(limit=None)
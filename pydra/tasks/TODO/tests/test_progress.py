@@ -0,0 +1,26 @@
+from pydra.tasks.TODO.progress import FilterProgressParser, active_progress
+
+fragments = (
+    "<filter-start>\n<filter-name>Resample</filter-name>\n</filter-start>\n"
+    "<filter-progress>0.5</filter-progress>\n"
+    "<filter-end>\n<filter-name>Resample</filter-name>\n"
+    "<filter-time>2.5</filter-time>\n</filter-end>\n"
+)
+
+
+def test_fragments_split_anywhere():
+    parser = FilterProgressParser()
+    for char in fragments:
+        parser.feed(char)
+    assert parser.state.finished_stages == [("Resample", 2.5)]
+
+
+def test_task_progress(resample):
+    states = []
+    task = resample(policy={"progress_callback": states.append})
+    assert task().output.return_code == 0
+    assert states
+    assert task.progress.finished_stages
+    assert task.progress.progress == 1.0
+    # only the runs in flight are listed
+    assert active_progress() == {}
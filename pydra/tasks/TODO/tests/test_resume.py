@@ -0,0 +1,37 @@
+import os
+
+from pydra.tasks.TODO.resume import prekey
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_prekey_stat_signature(tmp_path):
+    volume = tmp_path / "t1.nii"
+    volume.write_bytes(b"t1")
+    key = prekey("BRAINSResample", {"inputVolume": str(volume)}, paths={"inputVolume"})
+    assert key == prekey(
+        "BRAINSResample", {"inputVolume": str(volume)}, paths={"inputVolume"}
+    )
+    os.utime(volume, ns=(0, 0))
+    assert key != prekey(
+        "BRAINSResample", {"inputVolume": str(volume)}, paths={"inputVolume"}
+    )
+    # strings not typed as paths only contribute their value
+    assert prekey("BRAINSResample", {"label": str(volume)}) == prekey(
+        "BRAINSResample", {"label": str(volume)}
+    )
+
+
+def test_resume(resample, tmp_path):
+    policy = RunPolicy(resume_index=tmp_path / "resume.sqlite")
+    assert resample(policy)().output.return_code == 0
+    # served from the index, even from another cache_dir
+    task = resample(policy, cache_dir=str(tmp_path / "other"))
+    assert task().output.return_code == 0
+    assert not task._executed
+    assert task.result().output.return_code == 0
+    assert len(resample.tool.runs()) == 1
+    # a changed input file changes the pre-key
+    with open(task.inputs.inputVolume, "ab") as f:
+        f.write(b"changed")
+    assert resample(policy, cache_dir=str(tmp_path / "third"))().output.return_code == 0
+    assert len(resample.tool.runs()) == 2
@@ -0,0 +1,48 @@
+import subprocess
+import xml.dom.minidom
+
+from .conftest import tools_dir
+
+
+def test_stand_in_xml(generated):
+    _, fake_bin = generated
+    output = subprocess.run(
+        [str(fake_bin / "BRAINSResample"), "--xml"],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+    expected = xml.dom.minidom.parse(str(tools_dir / "xmls" / "BRAINSResample.xml"))
+    assert xml.dom.minidom.parseString(output).toxml() == expected.toxml()
+
+
+def test_stand_in_outputs(generated, input_volume, cost_model, tmp_path):
+    from segmentation.specialized.brainsroiauto import BRAINSROIAuto
+
+    cost_model(output_bytes=4096, output_content="zeros")
+    _, fake_bin = generated
+    task = BRAINSROIAuto(
+        executable=str(fake_bin / "BRAINSROIAuto"), cache_dir=str(tmp_path / "cache")
+    ).get_task(inputVolume=input_volume, outputROIMaskVolume=str(tmp_path / "mask.nii"))
+    assert task().output.return_code == 0
+    with open(tmp_path / "mask.nii", "rb") as f:
+        assert f.read() == bytes(4096)
+
+
+def test_stand_in_usage_error(generated):
+    _, fake_bin = generated
+    proc = subprocess.run(
+        [str(fake_bin / "BRAINSResample"), "--interpolationMode", "Cubic"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert proc.returncode == 1
+    assert proc.stderr.startswith("PARSE ERROR")
+
+
+def test_run(resample, tmp_path):
+    result = resample()()
+    assert result.output.return_code == 0
+    assert (tmp_path / "resampled.nii").exists()
+    assert "<filter-end>" in result.output.stdout
+    assert len(resample.tool.runs()) == 1
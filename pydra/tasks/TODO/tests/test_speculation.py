@@ -0,0 +1,35 @@
+import os
+import time
+
+from pydra.tasks.TODO.history import RuntimeHistory
+from pydra.tasks.TODO.runpolicy import RunPolicy
+
+
+def test_speculation(resample, make_tool, tmp_path):
+    # the first attempt hangs, its duplicate runs as usual
+    tool = make_tool("BRAINSResample", prelude='[ "$runs" -eq 1 ] && exec sleep 60')
+    history = RuntimeHistory(tmp_path / "history.json")
+    for _ in range(10):
+        history.record("BRAINSResample", 0.1)
+    task = resample(
+        RunPolicy(runtime_history=history, speculate_percentile=95), tool=tool
+    )
+    start = time.monotonic()
+    result = task()
+    assert time.monotonic() - start < 30
+    assert result.output.return_code == 0
+    assert len(tool.runs()) == 2
+    assert os.path.exists(tmp_path / "resampled.nii")
+    assert not [name for name in os.listdir(task.output_dir) if "attempt" in name]
+
+
+def test_no_speculation_without_history(resample, tmp_path):
+    policy = RunPolicy(runtime_history=tmp_path / "history.json")
+    assert policy.speculation_threshold("BRAINSResample") is None
+    policy.speculate_percentile = 95
+    assert policy.speculation_threshold("BRAINSResample") is None
+    assert resample(policy)().output.return_code == 0
+    # the run is recorded for the next ones
+    assert (
+        len(RuntimeHistory(tmp_path / "history.json").durations("BRAINSResample")) == 1
+    )
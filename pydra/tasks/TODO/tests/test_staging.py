@@ -0,0 +1,49 @@
+import os
+import threading
+
+from pydra.tasks.TODO.staging import ScratchStager
+
+
+def test_staging(resample, input_volume, tmp_path):
+    stager = ScratchStager(tmp_path / "scratch", max_bytes=0, evict_interval=0)
+    result = resample(policy={"scratch_dir": stager})()
+    assert result.output.return_code == 0
+    (args,) = resample.tool.runs()
+    staged = args[args.index("--inputVolume") + 1]
+    assert staged.startswith(str(tmp_path / "scratch" / "inputs"))
+    assert staged != input_volume
+    # the outputs are moved back and the working directory is removed
+    assert (tmp_path / "resampled.nii").exists()
+    assert os.listdir(tmp_path / "scratch" / "tasks") == []
+    # released once the tool ran, the staged input can be evicted
+    assert stager.evict() == [os.path.dirname(staged)]
+
+
+def test_work_dir_per_cache_dir(tmp_path):
+    stager = ScratchStager(tmp_path / "scratch")
+    first = stager.work_dir("8589cfe6", tmp_path / "a")
+    assert stager.work_dir("8589cfe6", tmp_path / "b") != first
+    assert os.path.isdir(first)
+
+
+def test_eviction_while_staging(input_volume, tmp_path):
+    # a stager evicting everything it can, next to stagers staging the input
+    scratch = tmp_path / "scratch"
+    evictor = ScratchStager(scratch, max_bytes=0)
+    stop = threading.Event()
+
+    def evict():
+        while not stop.is_set():
+            evictor.evict()
+
+    thread = threading.Thread(target=evict)
+    thread.start()
+    try:
+        for _ in range(200):
+            with ScratchStager(scratch) as stager:
+                staged = stager.stage_in(input_volume)
+                # held, the copy cannot be evicted
+                assert os.path.exists(staged)
+    finally:
+        stop.set()
+        thread.join()
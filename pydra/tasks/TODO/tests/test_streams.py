@@ -0,0 +1,73 @@
+import os
+import sys
+
+from pydra.tasks.TODO.runpolicy import RunPolicy, get_run_policy
+from pydra.tasks.TODO.streams import StreamedProcess
+from pydra.tasks.TODO.task import SEMShellCommandTask
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_bounded_tail(tmp_path):
+    proc = StreamedProcess(
+        python("for i in range(100000): print(i)"), log_dir=tmp_path, tail_bytes=16
+    )
+    assert proc.wait() == 0
+    log = (tmp_path / "stdout.log").read_text()
+    assert log.splitlines() == [str(i) for i in range(100000)]
+    assert proc.stdout == log[-16:]
+
+
+def test_rotation(tmp_path):
+    proc = StreamedProcess(
+        python("import sys\nfor i in range(1000): print('x' * 99, file=sys.stderr)"),
+        log_dir=tmp_path,
+        max_log_bytes=10000,
+        log_backups=2,
+    )
+    assert proc.wait() == 0
+    assert sorted(os.listdir(tmp_path)) == [
+        "stderr.log",
+        "stderr.log.1",
+        "stderr.log.2",
+        "stdout.log",
+    ]
+    # the oldest output was dropped
+    assert (
+        sum(
+            os.path.getsize(tmp_path / name)
+            for name in os.listdir(tmp_path)
+            if name.startswith("stderr")
+        )
+        < 1000 * 100
+    )
+
+
+def test_failing_callback(tmp_path):
+    lines = []
+
+    def callback(line):
+        lines.append(line)
+        raise ValueError(line)
+
+    # the child is still read to the end once the callback failed
+    proc = StreamedProcess(
+        python("for i in range(100000): print(i)"), on_stdout_line=callback
+    )
+    assert proc.wait(timeout=60) == 0
+    assert lines == ["0\n"]
+
+
+def test_task_policy(tmp_path):
+    task = SEMShellCommandTask(
+        executable=python("print('x' * 100000)"),
+        cache_dir=tmp_path,
+        policy={"tail_bytes": 10},
+    )
+    assert isinstance(task.policy, RunPolicy)
+    result = task()
+    assert result.output.stdout == "x" * 9 + "\n"
+    assert os.path.getsize(task.output_dir / "stdout.log") == 100001
+    assert SEMShellCommandTask(executable="true").policy is get_run_policy()
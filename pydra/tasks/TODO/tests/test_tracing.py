@@ -0,0 +1,22 @@
+from pydra.tasks.TODO.tracing import chrome_trace, load_trace, remove_observer
+
+
+def test_chrome_trace(resample, tmp_path):
+    path = tmp_path / "trace.json"
+    task = resample(policy={"trace_file": path})
+    try:
+        assert task().output.return_code == 0
+    finally:
+        remove_observer(chrome_trace(path))
+    events = load_trace(path)
+    assert events[0]["ph"] == "M"
+    phases = [event for event in events if event["ph"] == "X"]
+    names = {event["name"] for event in phases}
+    assert {"queued", "hashing", "running", "collecting", "task"} <= names
+    assert {event["cat"] for event in phases} == {"BRAINSResample"}
+    (running,) = [event for event in phases if event["name"] == "running"]
+    assert running["args"]["return_code"] == 0
+    # the run of the tool lies within the one of the task
+    (whole,) = [event for event in phases if event["name"] == "task"]
+    assert whole["ts"] <= running["ts"]
+    assert running["ts"] + running["dur"] <= whole["ts"] + whole["dur"]
@@ -0,0 +1,27 @@
+import os
+import warnings
+
+import pytest
+
+from pydra.tasks.TODO._forkserver_path import path_variable
+from pydra.tasks.TODO.workers import ForkserverSubmitter, ForkserverWorker
+
+
+def test_forkserver(resample, tmp_path):
+    task = resample()
+    # the generated modules are found through our sys.path only
+    with ForkserverSubmitter(n_procs=2, preload=["registration.brainsresample"]) as sub:
+        sub(task)
+    assert task.result().output.return_code == 0
+    assert os.path.exists(tmp_path / "resampled.nii")
+    # passed to the server while it started only
+    assert path_variable not in os.environ
+
+
+def test_preload_ignored():
+    with warnings.catch_warnings():
+        # the server may run with the preload of another test
+        warnings.simplefilter("ignore")
+        ForkserverWorker(n_procs=1).close()
+    with pytest.warns(RuntimeWarning, match="already running"):
+        ForkserverWorker(n_procs=1, preload=["json"]).close()
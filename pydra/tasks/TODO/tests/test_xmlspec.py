@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from pydra.tasks.TODO import xmlspec
+from pydra.tasks.TODO.xmlspec import clear_cache, load_sem_task
+
+from .conftest import tools_dir
+
+
+@pytest.fixture(autouse=True)
+def cleared():
+    clear_cache()
+    yield
+    clear_cache()
+
+
+def test_lru(monkeypatch):
+    monkeypatch.setattr(xmlspec, "cache_size", 2)
+    names = ["BRAINSResample", "BRAINSROIAuto", "BRAINSFit"]
+    paths = [tools_dir / "xmls" / f"{name}.xml" for name in names]
+    first, second = load_sem_task(paths[0]), load_sem_task(paths[1])
+    # used again, the first class is kept over the second one
+    assert load_sem_task(paths[0]) is first
+    third = load_sem_task(paths[2])
+    assert load_sem_task(paths[2]) is third
+    assert load_sem_task(paths[0]) is first
+    assert load_sem_task(paths[1]) is not second
+    assert len(xmlspec._classes) == 2
+
+
+def test_executable(make_tool, tmp_path):
+    tool = make_tool("BRAINSResample")
+    cls = load_sem_task(tool.path)
+    assert cls.__name__ == "BRAINSResample"
+    assert load_sem_task(tool.path) is cls
+    # the XML is probed once per version of the executable
+    assert tool.runs() == [["--xml"]]
+    stat = os.stat(tool.path)
+    os.utime(tool.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_sem_task(tool.path) is cls
+    assert len(tool.runs()) == 2
+    clear_cache()
+    assert load_sem_task(tool.path) is not cls
+    assert len(tool.runs()) == 3
+
+
+def test_task(make_tool, input_volume, tmp_path):
+    tool = make_tool("BRAINSResample")
+    cls = load_sem_task(tool.path)
+    task = cls(cache_dir=str(tmp_path / "cache")).get_task(
+        inputVolume=input_volume, outputVolume=str(tmp_path / "resampled.nii")
+    )
+    assert task().output.return_code == 0
+    assert os.path.exists(tmp_path / "resampled.nii")
@@ -0,0 +1,182 @@
+"""
+Execution events of SEM tasks and their export as a Chrome trace.
+
+:class:`~.task.SEMShellCommandTask` reports the phases of every run (time
+queued, input hashing, staging, tool runs, output collection, ...) as
+:class:`TaskEvent` to the observers registered in the process with
+:func:`add_observer`. :class:`ChromeTrace` is such an observer, appending
+the events to a trace file that ``chrome://tracing`` and
+https://ui.perfetto.dev open directly, one track per worker thread.
+"""
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+
+#: a phase of the run of a task, ``start`` (epoch) and ``duration`` in seconds
+TaskEvent = collections.namedtuple(
+    "TaskEvent", "name task tool start duration pid tid args"
+)
+
+_observers = []
+_lock = threading.Lock()
+
+
+def add_observer(observer):
+    """Call ``observer`` with every :class:`TaskEvent` of this process
+
+    Observers with a ``phase_started`` method are also called with the
+    event, its ``duration`` None, when a phase reported by :func:`phase`
+    starts, and the ones with a ``queue_changed`` method with the depths
+    reported by :func:`notify_queue`.
+    """
+    with _lock:
+        if observer not in _observers:
+            _observers.append(observer)
+
+
+def remove_observer(observer):
+    with _lock:
+        if observer in _observers:
+            _observers.remove(observer)
+
+
+def observers():
+    with _lock:
+        return list(_observers)
+
+
+def notify(task, name, start, duration=0.0, **args):
+    """Report the phase ``name`` of ``task`` to the observers"""
+    _dispatch(task, name, start, duration, args, "__call__")
+
+
+def notify_queue(queue, depth):
+    """Report that ``depth`` tasks wait for a process in the worker ``queue``"""
+    for observer in observers():
+        if hasattr(observer, "queue_changed"):
+            observer.queue_changed(queue, depth)
+
+
+def _dispatch(task, name, start, duration, args, method):
+    current = [
+        getattr(observer, method)
+        for observer in observers()
+        if hasattr(observer, method)
+    ]
+    if not current:
+        return
+    event = TaskEvent(
+        name,
+        task.name,
+        getattr(task, "tool", task.name),
+        start,
+        duration,
+        os.getpid(),
+        threading.get_ident(),
+        args,
+    )
+    for observer in current:
+        observer(event)
+
+
+@contextlib.contextmanager
+def phase(task, name, **args):
+    """Report the phase ``name`` of ``task`` lasting for the ``with`` block
+
+    The dict yielded can be completed with arguments of the event.
+
+    >>> events = []
+    >>> add_observer(events.append)
+    >>> class Task:
+    ...     name = "resample"
+    >>> with phase(Task(), "hashing") as args:
+    ...     args["files"] = 2
+    >>> remove_observer(events.append)
+    >>> events[0].name, events[0].task, events[0].args
+    ('hashing', 'resample', {'files': 2})
+    """
+    start = time.time()
+    _dispatch(task, name, start, None, dict(args), "phase_started")
+    try:
+        yield args
+    except BaseException:
+        args["error"] = True
+        raise
+    finally:
+        notify(task, name, start, time.time() - start, **args)
+
+
+class ChromeTrace:
+    """Observer appending the events to the Chrome trace file ``path``
+
+    The file uses the JSON array format without its closing bracket, which
+    the trace viewers accept, so that the processes of a workflow can all
+    append to the same file as their tasks progress.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._named = False
+
+    def _append(self, records):
+        lines = "".join(json.dumps(record) + ",\n" for record in records)
+        with open(self.path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if f.tell() == 0:
+                    f.write("[\n")
+                f.write(lines)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __call__(self, event):
+        records = []
+        if not self._named:
+            records.append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": event.pid,
+                    "args": {"name": f"{socket.gethostname()}:{event.pid}"},
+                }
+            )
+            self._named = True
+        records.append(
+            {
+                "name": event.name,
+                "cat": event.tool,
+                "ph": "X",
+                "ts": event.start * 1e6,
+                "dur": event.duration * 1e6,
+                "pid": event.pid,
+                "tid": event.tid,
+                "args": dict(event.args, task=event.task),
+            }
+        )
+        self._append(records)
+
+
+def chrome_trace(path):
+    """The :class:`ChromeTrace` observer of ``path``, registered once per process"""
+    path = os.path.abspath(str(path))
+    with _lock:
+        for observer in _observers:
+            if isinstance(observer, ChromeTrace) and observer.path == path:
+                return observer
+        observer = ChromeTrace(path)
+        _observers.append(observer)
+        return observer
+
+
+def load_trace(path):
+    """Events of the Chrome trace file ``path``"""
+    with open(path) as f:
+        text = f.read().rstrip().rstrip(",")
+    if not text.endswith("]"):
+        text += "]"
+    return json.loads(text)
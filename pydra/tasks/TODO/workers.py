@@ -0,0 +1,144 @@
+"""
+Worker pool of SEM tasks forked from a preloaded server.
+
+pydra's ``cf`` worker starts its processes with the default start method of
+the platform: ``spawn`` processes import pydra, attrs, nipype and the
+generated modules again before running their first task, and ``fork``
+copies the whole submitting process, threads (event loop, lease renewers,
+metrics server) included. :class:`ForkserverWorker` forks its processes
+from a ``forkserver`` that imports these modules once, when the worker is
+created, so that new workers start warm and single-threaded.
+"""
+import concurrent.futures
+import importlib
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import sys
+import threading
+import warnings
+
+from pydra import Submitter
+from pydra.engine.helpers import get_available_cpus, get_open_loop
+from pydra.engine.workers import ConcurrentFuturesWorker, Worker
+
+from ._forkserver_path import path_variable
+from .tracing import notify_queue
+
+#: modules imported by the fork server of every :class:`ForkserverWorker`
+default_preload = [
+    "attr",
+    "cloudpickle",
+    "pydra",
+    "pydra.engine.core",
+    "pydra.engine.specs",
+    "nipype.interfaces.base",
+    "pydra.tasks.TODO.task",
+    "pydra.tasks.TODO.xmlspec",
+]
+
+
+_server_lock = threading.Lock()
+
+
+def start_forkserver(preload):
+    """Start the fork server of this process, preloading the modules ``preload``
+
+    The server imports them with the ``sys.path`` of this process, passed in
+    :data:`~._forkserver_path.path_variable` while it starts only. A server
+    already running keeps its preload: a warning is issued when ``preload``
+    differs from it.
+    """
+    preload = [f"{__package__}._forkserver_path"] + list(preload)
+    server = multiprocessing.forkserver._forkserver
+    with _server_lock:
+        if server._forkserver_pid is not None:
+            if server._preload_modules != preload:
+                warnings.warn(
+                    "the fork server of this process is already running, "
+                    f"the preload {preload[1:]} is ignored",
+                    RuntimeWarning,
+                    stacklevel=3,
+                )
+            server.ensure_running()
+            return
+        server.set_forkserver_preload(preload)
+        # the server imports its preload with the default sys.path, the first
+        # module extends it with ours: the generated modules are often found
+        # through it only
+        previous = os.environ.get(path_variable)
+        os.environ[path_variable] = os.pathsep.join(path for path in sys.path if path)
+        try:
+            server.ensure_running()
+        finally:
+            if previous is None:
+                del os.environ[path_variable]
+            else:
+                os.environ[path_variable] = previous
+
+
+def tool_modules(package):
+    """Modules of the tools of a generated category package, to preload
+
+    >>> tool_modules("registration")  # doctest: +SKIP
+    ['registration.brainsfit', 'registration.brainsresample', ...]
+    """
+    category = importlib.import_module(package)
+    return [f"{package}.{module}" for module in sorted(category._tools.values())]
+
+
+class ForkserverWorker(ConcurrentFuturesWorker):
+    """``cf`` worker whose processes fork from a preloaded ``forkserver``
+
+    ``preload`` names the modules imported by the server in addition to
+    :data:`default_preload`, typically the generated modules of the tools
+    run (see :func:`tool_modules`); unpickling tasks of other tools imports
+    their module in every worker. The server is shared by the process: its
+    preload is set by the first worker created (see :func:`start_forkserver`,
+    the later ones warn when theirs differs), and the server starts
+    importing right away rather than when the first task is submitted. This
+    package must be installed, the generated modules may be found through
+    the ``sys.path`` of this process only.
+    The number of tasks waiting for a free process is reported to the
+    observers (see :func:`~.tracing.notify_queue`) as the depth of the queue
+    ``queue_name``.
+    """
+
+    def __init__(self, n_procs=None, preload=(), queue_name="forkserver"):
+        # the cf worker would create a pool of the default start method
+        Worker.__init__(self)
+        self.n_procs = get_available_cpus() if n_procs is None else n_procs
+        self.queue_name = queue_name
+        self.outstanding = 0
+        start_forkserver(default_preload + list(preload))
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.n_procs, mp_context=multiprocessing.get_context("forkserver")
+        )
+
+    async def exec_as_coro(self, runnable, rerun=False):
+        # the event loop submits and collects the tasks, one at a time
+        self.outstanding += 1
+        notify_queue(self.queue_name, max(0, self.outstanding - self.n_procs))
+        try:
+            return await super().exec_as_coro(runnable, rerun=rerun)
+        finally:
+            self.outstanding -= 1
+            notify_queue(self.queue_name, max(0, self.outstanding - self.n_procs))
+
+
+class ForkserverSubmitter(Submitter):
+    """Submitter running the tasks on a :class:`ForkserverWorker`
+
+    >>> with ForkserverSubmitter(n_procs=4, preload=["registration.brainsresample"]) as sub:  # doctest: +SKIP
+    ...     sub(task)
+    """
+
+    def __init__(self, n_procs=None, preload=()):
+        # what Submitter.__init__ sets up, with this worker rather than the
+        # one of a plugin
+        self.loop = get_open_loop()
+        self._own_loop = not self.loop.is_running()
+        # a cf worker to workflows asking for the cf plugin
+        self.plugin = "cf"
+        self.worker = ForkserverWorker(n_procs=n_procs, preload=preload)
+        self.worker.loop = self.loop
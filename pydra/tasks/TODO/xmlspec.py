@@ -0,0 +1,597 @@
+"""
+Input and output specs of SEM tools from their XML description.
+
+``tools/generate_tasks.py`` writes the fields mapped here into the modules it
+generates; :func:`load_sem_task` builds the same task classes at runtime,
+from an XML file or from ``<executable> --xml``, so that a new or updated
+tool is usable without generating, formatting and installing its module.
+The classes are memoized per digest of the XML.
+
+The tasks of both kinds of classes hold a reference to their specs
+(:class:`GeneratedSpecs`, :class:`LoadedSpecs`) and are pickled with it
+rather than with their specs, which workers rebuild when unpickling them.
+"""
+import collections
+import hashlib
+import importlib
+import json
+import keyword
+import os
+import shutil
+import subprocess
+import threading
+import time
+import xml.dom.minidom
+
+from .formats import resolve_output_filenames
+from .tracing import notify
+
+#: version of the mapping of XML parameters to fields, written to the
+#: generated modules; bump it whenever the generated specs change
+generator_version = 2
+
+#: number of task classes kept by :func:`load_sem_task`
+cache_size = 128
+
+_classes = collections.OrderedDict()
+_executable_xmls = {}
+_lock = threading.Lock()
+
+# Inputs that are the same for every subject (models, atlases, atlas landmarks),
+# generated tasks can read them from a node-local cache instead of per task.
+# They are given by the <name> of their XML parameter, see constant_input_fields.
+# BRAINSABC's atlasDefinition is not listed: the images it refers to may be
+# given relative to it, so it cannot be moved on its own.
+constant_inputs = {
+    "BRAINSConstellationDetector": [
+        "inputTemplateModel",
+        "llsModel",
+        "atlasVolume",
+        "atlasLandmarks",
+        "atlasLandmarkWeights",
+    ],
+    "BRAINSLandmarkInitializer": ["inputFixedLandmarkFilename", "inputWeightFilename"],
+}
+
+
+def force_to_valid_python_variable_name(old_name):
+    """Valid c++ names are not always valid in python, so
+    provide alternate naming
+
+    >>> force_to_valid_python_variable_name('lambda')
+    'opt_lambda'
+    >>> force_to_valid_python_variable_name('inputVolume')
+    'inputVolume'
+    """
+    new_name = old_name.strip()
+    if new_name in keyword.kwlist:
+        return f"opt_{new_name}"
+    else:
+        return new_name
+
+
+def gen_filename_from_param(param, base):
+    """Default filename of an output, whether it is compressed is left to
+    the output policy of the package when the task is created
+    """
+    fileExtensions = param.getAttribute("fileExtensions")
+    if fileExtensions:
+        # It is possible that multiple file extensions can be specified in a
+        # comma separated list,  This will extract just the first extension
+        firstFileExtension = fileExtensions.split(",")[0]
+        ext = firstFileExtension
+    else:
+        ext = {
+            "image": ".nii",
+            "transform": ".mat",
+            "file": "",
+            "directory": "",
+            "geometry": ".vtk",
+        }[param.nodeName]
+    return base + ext
+
+
+def field_name(param):
+    """Name of the field of the XML parameter ``param``
+
+    Its longflag when it has one (as SEM, without the leading dashes),
+    its name otherwise.
+    """
+    longFlagNode = param.getElementsByTagName("longflag")
+    if longFlagNode:
+        name = longFlagNode[0].firstChild.nodeValue.lstrip(" -").rstrip(" ")
+    else:
+        name = param.getElementsByTagName("name")[0].firstChild.nodeValue
+    return force_to_valid_python_variable_name(name)
+
+
+def constant_input_fields(dom, names):
+    """Fields of the input parameters of ``dom`` named ``names`` (their ``<name>``)
+
+    >>> dom = xml.dom.minidom.parseString(
+    ...     "<executable><parameters><file><name>llsModel</name>"
+    ...     "<longflag>LLSModel</longflag><channel>input</channel></file>"
+    ...     "</parameters></executable>"
+    ... )
+    >>> constant_input_fields(dom, ["llsModel"])
+    ['LLSModel']
+    >>> constant_input_fields(dom, ["LLSModel"])
+    Traceback (most recent call last):
+    ...
+    ValueError: constant inputs that are not input parameters of the tool: LLSModel
+    """
+    fields = {}
+    for paramGroup in dom.getElementsByTagName("parameters"):
+        for param in paramGroup.childNodes:
+            if param.nodeType != param.ELEMENT_NODE or param.nodeName in [
+                "label",
+                "description",
+            ]:
+                continue
+            channel = param.getElementsByTagName("channel")
+            if channel and channel[0].firstChild.nodeValue == "output":
+                continue
+            name = param.getElementsByTagName("name")[0].firstChild.nodeValue.strip()
+            fields[name] = field_name(param)
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ValueError(
+            "constant inputs that are not input parameters of the tool: "
+            + ", ".join(unknown)
+        )
+    return [fields[name] for name in names]
+
+
+def describe(dom):
+    """Docstring of the tool described by ``dom``, and its category"""
+    docstring = ""
+
+    for desc_str in [
+        "title",
+        "category",
+        "description",
+        "version",
+        "documentation-url",
+        "license",
+        "contributor",
+        "acknowledgements",
+    ]:
+        el = dom.getElementsByTagName(desc_str)
+        if el and el[0].firstChild and el[0].firstChild.nodeValue.strip():
+            docstring += "    {desc_str}: {el}\n".format(
+                desc_str=desc_str, el=el[0].firstChild.nodeValue.strip()
+            )
+        if desc_str == "category":
+            category = el[0].firstChild.nodeValue.strip()
+
+    return docstring, category
+
+
+#: a field of the specs of a tool: ``type`` is the dotted name of its type,
+#: as imported by the generated modules (see :func:`_namespace`)
+Field = collections.namedtuple("Field", "name type metadata")
+
+
+def parameter_fields(dom, mipav_hacks=False):
+    """Input fields, output fields and default output filenames of ``dom``
+
+    The :class:`Field` are turned into the ``(name, attr.ib(...))`` items of
+    the pydra specs by :func:`field_code`, for the generated modules, and
+    by :func:`build_fields` at runtime.
+
+    >>> dom = xml.dom.minidom.parseString(
+    ...     "<executable><parameters><image><name>outputVolume</name>"
+    ...     "<longflag>outputVolume</longflag><channel>output</channel>"
+    ...     "<description>Resampled image</description></image></parameters></executable>"
+    ... )
+    >>> inputs, outputs, filenames = parameter_fields(dom)
+    >>> inputs[0]
+    Field(name='outputVolume', type='File', metadata={'argstr': '--outputVolume ', 'help_string': 'Resampled image'})
+    >>> filenames
+    {'outputVolume': 'outputVolume.nii'}
+    """
+    inputTraits = []
+    outputTraits = []
+    outputs_filenames = {}
+
+    for paramGroup in dom.getElementsByTagName("parameters"):
+        indices = paramGroup.getElementsByTagName("index")
+        max_index = 0
+        for index in indices:
+            if int(index.firstChild.nodeValue) > max_index:
+                max_index = int(index.firstChild.nodeValue)
+        for param in paramGroup.childNodes:
+            if param.nodeName in ["label", "description", "#text", "#comment"]:
+                continue
+            traitsParams = {}
+
+            # Prefer to use longFlag as name if it is given, rather than the parameter name
+            name = field_name(param)
+            longFlagNode = param.getElementsByTagName("longflag")
+            if longFlagNode:
+                # SEM automatically strips prefixed "--" or "-" from from xml before processing
+                # we need to replicate that behavior here The following
+                # two nodes in xml have the same behavior in the program
+                # <longflag>--test</longflag>
+                # <longflag>test</longflag>
+                longFlagName = longFlagNode[0].firstChild.nodeValue
+                longFlagName = longFlagName.lstrip(" -").rstrip(" ")
+                traitsParams["argstr"] = f"--{longFlagName} "
+            else:
+                if param.getElementsByTagName("index"):
+                    traitsParams["argstr"] = ""
+                else:
+                    traitsParams["argstr"] = f"--{name} "
+
+            desc = param.getElementsByTagName("description")
+            if desc and desc[0].firstChild:
+                traitsParams["help_string"] = desc[0].firstChild.nodeValue.replace(
+                    "\n", ", "
+                )
+            else:
+                traitsParams["help_string"] = ""
+
+            index = param.getElementsByTagName("index")
+            if index:
+                traitsParams["position"] = int(index[0].firstChild.nodeValue) - (
+                    max_index + 1
+                )
+                traitsParams["help_string"] = desc[0].firstChild.nodeValue
+
+            typesDict = {
+                "integer": "traits.Int",
+                "double": "traits.Float",
+                "float": "traits.Float",
+                "image": "File",
+                "transform": "File",
+                "boolean": "traits.Bool",
+                "string": "traits.Str",
+                "file": "File",
+                "geometry": "File",
+                "directory": "Directory",
+                "table": "File",
+                "point": "traits.List",
+                "region": "traits.List",
+            }
+
+            if param.nodeName.endswith("-enumeration"):
+                type = "traits.Enum"
+            elif param.nodeName.endswith("-vector"):
+                type = "MultiInputObj"
+                if mipav_hacks is True:
+                    traitsParams["sep"] = ";"
+                else:
+                    traitsParams["sep"] = ","
+            elif (
+                param.getAttribute("multiple") == "true"
+                and "input" not in name
+                and "output" not in name
+            ):
+                type = "MultiInputFile"
+                traitsParams["sep"] = ","
+            else:
+                type = typesDict[param.nodeName]
+
+            # the metadata of the fields were always written as strings, with
+            # the double quotes of the descriptions replaced by single ones
+            traitsParams = {
+                key: str(value).replace('"', "'") for key, value in traitsParams.items()
+            }
+
+            if param.nodeName in [
+                "file",
+                "directory",
+                "image",
+                "geometry",
+                "transform",
+                "table",
+            ]:
+                if not param.getElementsByTagName("channel"):
+                    raise RuntimeError(
+                        "Insufficient XML specification: each element of type 'file', 'directory', 'image', 'geometry', 'transform',  or 'table' requires 'channel' field.\n{0}".format(
+                            traitsParams
+                        )
+                    )
+                elif (
+                    param.getElementsByTagName("channel")[0].firstChild.nodeValue
+                    == "output"
+                ):
+                    type = type.replace("Input", "Output")
+                    inputTraits.append(Field(name, type, dict(traitsParams)))
+                    traitsParams.pop("argstr")
+                    traitsParams["output_file_template"] = f"{{{name}}}"
+                    outputTraits.append(
+                        Field(name, f"pydra.specs.{type}", traitsParams)
+                    )
+
+                    outputs_filenames[name] = gen_filename_from_param(param, name)
+                elif (
+                    param.getElementsByTagName("channel")[0].firstChild.nodeValue
+                    == "input"
+                ):
+                    inputTraits.append(Field(name, type, traitsParams))
+                else:
+                    raise RuntimeError(
+                        "Insufficient XML specification: each element of type 'file', 'directory', 'image', 'geometry', 'transform',  or 'table' requires 'channel' field to be in ['input','output'].\n{0}".format(
+                            traitsParams
+                        )
+                    )
+            else:  # For all other parameter types, they are implicitly only input types
+                inputTraits.append(Field(name, type, traitsParams))
+
+    return inputTraits, outputTraits, outputs_filenames
+
+
+def field_code(field):
+    """Source of the ``(name, attr.ib(...))`` item of ``field`` in the specs
+
+    >>> print(field_code(Field("lower", "traits.Int", {"help_string": "C:\\\\temp\\\\"})))
+    ("lower", attr.ib(type=traits.Int, metadata={"help_string": "C:\\\\temp\\\\"}))
+    """
+    metadata = ", ".join(
+        f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}"
+        for key, value in field.metadata.items()
+    )
+    return f'("{field.name}", attr.ib(type={field.type}, metadata={{{metadata}}}))'
+
+
+def _namespace():
+    # names used by the fields, as imported by the generated modules
+    import pydra
+    from nipype.interfaces.base import (
+        Directory,
+        File,
+        InputMultiPath,
+        OutputMultiPath,
+        traits,
+    )
+    from pydra.engine.specs import MultiInputFile, MultiInputObj, MultiOutputFile
+
+    return {
+        "pydra": pydra,
+        "Directory": Directory,
+        "File": File,
+        "InputMultiPath": InputMultiPath,
+        "OutputMultiPath": OutputMultiPath,
+        "traits": traits,
+        "MultiInputFile": MultiInputFile,
+        "MultiInputObj": MultiInputObj,
+        "MultiOutputFile": MultiOutputFile,
+    }
+
+
+def build_fields(fields):
+    """The ``(name, attr.ib(...))`` items of the specs of ``fields``
+
+    Built anew at every call: pydra adds its validators to the attributes
+    of the specs it is given.
+    """
+    import attr
+
+    namespace = _namespace()
+    items = []
+    for field in fields:
+        first, *attributes = field.type.split(".")
+        try:
+            type = namespace[first]
+            for attribute in attributes:
+                type = getattr(type, attribute)
+        except (KeyError, AttributeError):
+            raise ValueError(f"unknown type {field.type} of the field {field.name}")
+        items.append((field.name, attr.ib(type=type, metadata=dict(field.metadata))))
+    return items
+
+
+class GeneratedSpecs(collections.namedtuple("GeneratedSpecs", "module name version")):
+    """Specs of the class ``name`` of the generated ``module``"""
+
+    def load(self):
+        cls = getattr(importlib.import_module(self.module), self.name)
+        if getattr(cls, "generator_version", None) != self.version:
+            raise RuntimeError(
+                f"{self.module}.{self.name} was generated by another version of the "
+                f"generator than the task ({self.version}), regenerate the tasks"
+            )
+        return cls.specs()
+
+
+class LoadedSpecs(
+    collections.namedtuple("LoadedSpecs", "source launcher digest version")
+):
+    """Specs of the tool loaded by :func:`load_sem_task` from ``source``"""
+
+    def load(self):
+        if self.version != generator_version:
+            raise RuntimeError(
+                f"the task of {self.source} was created by another version of the "
+                f"generator ({self.version}) than this one ({generator_version})"
+            )
+        cls = load_sem_task(self.source, self.launcher)
+        if cls.digest != self.digest:
+            raise RuntimeError(
+                f"the XML of {self.source} changed since the task was created"
+            )
+        return cls.specs()
+
+
+class SEMTask:
+    """Base of the task classes of :func:`load_sem_task`
+
+    Same interface as the generated classes: ``get_task(**inputs)`` returns
+    a :class:`~.task.SEMShellCommandTask`, the ``options`` are passed on to
+    it.
+    """
+
+    module = None
+    default_executable = None
+    constant_inputs = []
+    output_filenames = {}
+    source = None
+    launcher = ()
+    digest = None
+    generator_version = generator_version
+    _input_fields = []
+    _output_fields = []
+
+    def __init__(
+        self, name=None, executable=None, cache_dir=None, terminal_outputs=(), **options
+    ):
+        self.name = name or self.module
+        self.executable = executable or self.default_executable
+        self.cache_dir = cache_dir
+        self.terminal_outputs = terminal_outputs
+        self.options = options
+
+    @classmethod
+    def specs(cls):
+        """Input and output specs of the tool"""
+        from pydra.engine.specs import ShellOutSpec, ShellSpec, SpecInfo
+
+        input_spec = SpecInfo(
+            name="Input", fields=build_fields(cls._input_fields), bases=(ShellSpec,)
+        )
+        output_spec = SpecInfo(
+            name="Output",
+            fields=build_fields(cls._output_fields),
+            bases=(ShellOutSpec,),
+        )
+        return input_spec, output_spec
+
+    def get_task(self, **inputs):
+        from .task import SEMShellCommandTask
+
+        start = time.time()
+        input_spec, output_spec = self.specs()
+
+        task = SEMShellCommandTask(
+            name=self.name,
+            executable=self.executable,
+            input_spec=input_spec,
+            output_spec=output_spec,
+            cache_dir=self.cache_dir,
+            constant_inputs=self.constant_inputs,
+            terminal_outputs=self.terminal_outputs,
+            spec_ref=LoadedSpecs(
+                self.source, self.launcher, self.digest, self.generator_version
+            ),
+            **self.options,
+            **resolve_output_filenames(
+                inputs, self.output_filenames, self.terminal_outputs
+            ),
+        )
+        notify(task, "building", start, time.time() - start)
+        return task
+
+
+def task_class(
+    xml_text, module, executable=None, constant_inputs=(), source=None, launcher=()
+):
+    """Task class of the tool ``module`` described by ``xml_text``
+
+    ``constant_inputs`` are the ``<name>`` of the parameters that are
+    constant inputs (see :func:`constant_input_fields`). ``source`` and
+    ``launcher`` are the arguments of :func:`load_sem_task` giving back this
+    XML, used to rebuild the specs of unpickled tasks.
+    """
+    dom = xml.dom.minidom.parseString(xml_text.strip())
+    docstring, _ = describe(dom)
+    input_fields, output_fields, output_filenames = parameter_fields(dom)
+    return type(
+        module,
+        (SEMTask,),
+        {
+            "__doc__": docstring,
+            "module": module,
+            "default_executable": executable or module,
+            "constant_inputs": constant_input_fields(dom, constant_inputs),
+            "output_filenames": output_filenames,
+            "source": source,
+            "launcher": tuple(launcher),
+            "digest": hashlib.sha256(xml_text.encode()).hexdigest(),
+            "_input_fields": input_fields,
+            "_output_fields": output_fields,
+        },
+    )
+
+
+def executable_xml(executable, launcher=(), timeout=60):
+    """XML printed by ``executable --xml``, probed again once the file changes"""
+    path = shutil.which(executable)
+    if path is None:
+        raise FileNotFoundError(f"SEM executable not found: {executable}")
+    status = os.stat(path)
+    key = path, status.st_mtime_ns, status.st_size, tuple(launcher)
+    with _lock:
+        if key in _executable_xmls:
+            return _executable_xmls[key]
+    xml_text = subprocess.run(
+        list(launcher) + [path, "--xml"],
+        stdout=subprocess.PIPE,
+        check=True,
+        timeout=timeout,
+    ).stdout.decode()
+    with _lock:
+        _executable_xmls[key] = xml_text
+    return xml_text
+
+
+def load_sem_task(source, launcher=(), timeout=60):
+    """Task class of a SEM tool, from its XML file or its executable
+
+    ``source`` is the path of an ``<tool>.xml`` file, or the name or path of
+    an executable answering ``--xml`` (run through ``launcher`` if given,
+    within ``timeout`` seconds). The class is memoized per digest of the
+    XML (up to :data:`cache_size` classes), an updated tool gets a new one.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "ThresholdScalarVolume.xml")
+    >>> with open(path, "w") as f:
+    ...     _ = f.write("<executable><category>Filtering</category><parameters>"
+    ...                 "<integer><name>lower</name><longflag>lower</longflag>"
+    ...                 "<description>Lower threshold</description></integer>"
+    ...                 "</parameters></executable>")
+    >>> cls = load_sem_task(path)
+    >>> cls.__name__, cls().executable, load_sem_task(path) is cls
+    ('ThresholdScalarVolume', 'ThresholdScalarVolume', True)
+    """
+    source = str(source)
+    launcher = tuple(launcher)
+    if source.endswith(".xml"):
+        source = os.path.abspath(source)
+        module = os.path.basename(source)[: -len(".xml")]
+        executable = module
+        with open(source) as f:
+            xml_text = f.read()
+    else:
+        module = os.path.basename(source)
+        executable = source
+        xml_text = executable_xml(source, launcher, timeout)
+        if launcher:
+            executable = " ".join(list(launcher) + [source])
+    digest = hashlib.sha256(xml_text.encode()).hexdigest()
+    key = digest, module, executable
+    with _lock:
+        if key in _classes:
+            _classes.move_to_end(key)
+            return _classes[key]
+    cls = task_class(
+        xml_text,
+        module,
+        executable,
+        constant_inputs.get(module, []),
+        source=source,
+        launcher=launcher,
+    )
+    with _lock:
+        cls = _classes.setdefault(key, cls)
+        _classes.move_to_end(key)
+        while len(_classes) > cache_size:
+            _classes.popitem(last=False)
+    return cls
+
+
+def clear_cache():
+    """Forget the task classes and the XML of the executables loaded"""
+    with _lock:
+        _classes.clear()
+        _executable_xmls.clear()
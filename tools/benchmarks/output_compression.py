@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Wall-clock cost of writing SEM outputs as .nii.gz instead of .nii.
+
+Writes synthetic volumes shaped like the label and probability maps produced
+by BRAINSABC and BRAINSCreateLabelMapFromProbabilityMaps, uncompressed and
+gzip-compressed at the level used by the ITK NIfTI writer (6), and reports the
+time to write and read them back together with their size on disk.
+
+    pip install ".[benchmarks]"
+    python tools/benchmarks/output_compression.py [--size 128] [--repeat 3]
+"""
+import argparse
+import gzip
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+
+def nifti1_header(dim, datatype, bitpix):
+    """Minimal single-file NIfTI-1 header (348 bytes + empty extension)"""
+    header = bytearray(352)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, 3, dim, dim, dim, 1, 1, 1, 1)
+    struct.pack_into("<hh", header, 70, datatype, bitpix)
+    struct.pack_into("<8f", header, 76, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+    struct.pack_into("<f", header, 108, 352.0)
+    header[344:348] = b"n+1\0"
+    return bytes(header)
+
+
+def radius(dim):
+    """Distance of every voxel (x fastest) to the center of a ``dim``^3 volume"""
+    center = dim / 2.0
+    z, y, x = np.ogrid[:dim, :dim, :dim]
+    return np.sqrt((x - center) ** 2 + (y - center) ** 2 + (z - center) ** 2)
+
+
+def label_map(dim):
+    """uint8 volume of nested blobs, as compressible as a brain label map"""
+    labels = np.minimum(radius(dim) // (dim / 16.0), 15).astype("u1")
+    return nifti1_header(dim, 2, 8) + labels.tobytes()
+
+
+def probability_map(dim):
+    """float32 smooth posterior map, mostly zeros outside the brain"""
+    values = np.maximum(0.0, 1.0 - radius(dim) / (dim / 2.0)) ** 2
+    return nifti1_header(dim, 16, 32) + values.astype("<f4").tobytes()
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(name, data, workdir, repeat):
+    plain = os.path.join(workdir, f"{name}.nii")
+    compressed = os.path.join(workdir, f"{name}.nii.gz")
+
+    def write_plain():
+        with open(plain, "wb") as f:
+            f.write(data)
+
+    def write_compressed():
+        with gzip.open(compressed, "wb", compresslevel=6) as f:
+            f.write(data)
+
+    def read_plain():
+        with open(plain, "rb") as f:
+            f.read()
+
+    def read_compressed():
+        with gzip.open(compressed, "rb") as f:
+            f.read()
+
+    results = {
+        "write .nii": timed(write_plain, repeat),
+        "write .nii.gz": timed(write_compressed, repeat),
+        "read .nii": timed(read_plain, repeat),
+        "read .nii.gz": timed(read_compressed, repeat),
+    }
+    print(f"\n{name}: {len(data) / 2 ** 20:.1f} MiB")
+    print(f"  size .nii    {os.path.getsize(plain) / 2 ** 20:8.1f} MiB")
+    print(f"  size .nii.gz {os.path.getsize(compressed) / 2 ** 20:8.1f} MiB")
+    for label, seconds in results.items():
+        print(f"  {label:14s}{seconds:8.3f} s")
+    saved = (
+        results["write .nii.gz"]
+        + results["read .nii.gz"]
+        - results["write .nii"]
+        - results["read .nii"]
+    )
+    print(f"  saved per uncompressed intermediate (write + read): {saved:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=128, help="volume edge length")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(f"synthetic {args.size}^3 volumes, best of {args.repeat}")
+    with tempfile.TemporaryDirectory() as workdir:
+        bench("label_map", label_map(args.size), workdir, args.repeat)
+        bench("probability_map", probability_map(args.size), workdir, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Python overhead of the generated SEM tasks around their executable.
+
+Generates the task classes of every XML of ``tools/xmls`` in memory, runs
+each of them with a no-op stand-in executable and reports, per tool, the
+mean time spent building the task, hashing its inputs, preparing its output
+directory, formatting the command line, collecting the outputs and saving
+the result, next to the runtime of the (no-op) tool itself.
+
+    python tools/benchmarks/task_overhead.py [--repeat 5] [--tool BRAINSResample ...] [--cprofile]
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import stat
+import sys
+import tempfile
+
+tools_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, tools_dir)
+
+import generate_tasks  # noqa: E402
+
+from pydra.tasks.TODO.profiling import OverheadProfiler  # noqa: E402
+
+
+def generate_module(xml_dir, names, workdir):
+    """Module holding the task classes of the ``names`` tools, and the ones that failed"""
+    codes, failed = [], []
+    for name in names:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, code, _ = generate_tasks.generate_class(name, [], xml_dir=xml_dir)
+        except Exception:
+            failed.append(name)
+            continue
+        codes.append(code)
+    path = os.path.join(workdir, "sem_tasks.py")
+    with open(path, "w") as f:
+        f.write(generate_tasks.header)
+        f.write(generate_tasks.imports)
+        f.write("\n\n".join(codes))
+    # importable by name, as the specs of unpickled tasks are rebuilt from it
+    sys.path.insert(0, workdir)
+    importlib.invalidate_caches()
+    return importlib.import_module("sem_tasks"), failed
+
+
+def noop_executables(workdir, names):
+    """``{name: path}`` of no-op executables named after the tools"""
+    bin_dir = os.path.join(workdir, "bin")
+    os.mkdir(bin_dir)
+    noop = os.path.join(bin_dir, "noop")
+    with open(noop, "w") as f:
+        f.write("#!/bin/sh\nexit 0\n")
+    os.chmod(noop, os.stat(noop).st_mode | stat.S_IXUSR)
+    executables = {}
+    for name in names:
+        executables[name] = os.path.join(bin_dir, name)
+        os.symlink(noop, executables[name])
+    return executables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--xml-dir", default=os.path.join(tools_dir, "xmls"))
+    parser.add_argument("--tool", action="append", help="tool to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cprofile", action="store_true", help="print cProfile stats")
+    args = parser.parse_args()
+    names = args.tool or sorted(
+        name[: -len(".xml")]
+        for name in os.listdir(args.xml_dir)
+        if name.endswith(".xml")
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        module, failed = generate_module(args.xml_dir, names, workdir)
+        executables = noop_executables(workdir, names)
+        profiler = OverheadProfiler(cprofile=args.cprofile)
+        with profiler:
+            for name in names:
+                if name in failed:
+                    continue
+                factory = getattr(module, name)
+                for _ in range(args.repeat):
+                    task = factory(
+                        executable=executables[name],
+                        cache_dir=os.path.join(workdir, "cache"),
+                    ).get_task()
+                    task(rerun=True)
+    print(f"mean per task over {args.repeat} runs, ms")
+    print(profiler.report())
+    summary = profiler.summary().values()
+    if summary:
+        overhead = sum(means["overhead"] for means in summary) / len(summary)
+        running = sum(means.get("running", 0.0) for means in summary) / len(summary)
+        print(
+            f"\nall tools: {overhead * 1000:.2f} ms of Python overhead per task, "
+            f"{running * 1000:.2f} ms running the no-op executable"
+        )
+    if failed:
+        print(f"\nnot generated: {', '.join(failed)}")
+    if args.cprofile:
+        print(profiler.stats())
+
+
+if __name__ == "__main__":
+    main()
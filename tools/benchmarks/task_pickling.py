@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Size and round-trip time of the pickles of the generated SEM tasks.
+
+Pickles generated tasks, split over ``--states`` values as a mapped node is
+before its states are sent to the workers, the way pydra ships them: with
+``pickle`` to the processes of the ``cf`` worker and with ``cloudpickle`` to
+the jobs of the ``slurm`` worker. Tasks pickled by reference to their specs
+(the default) are compared with the same tasks pickled with their specs.
+
+    python tools/benchmarks/task_pickling.py [--tool BRAINSABC ...] [--states 1000] [--repeat 20]
+"""
+import argparse
+import copy
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import cloudpickle
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+
+from task_overhead import generate_module, tools_dir  # noqa: E402
+
+
+def round_trip(task, dumps, repeat):
+    """Size of the pickle of ``task``, mean seconds to dump it and to load it"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data = dumps(task)
+    dumped = time.perf_counter()
+    for _ in range(repeat):
+        pickle.loads(data)
+    loaded = time.perf_counter()
+    return len(data), (dumped - start) / repeat, (loaded - dumped) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--xml-dir", default=os.path.join(tools_dir, "xmls"))
+    parser.add_argument(
+        "--tool",
+        action="append",
+        help="tool to pickle (default: BRAINSABC, BRAINSFit, BRAINSResample)",
+    )
+    parser.add_argument("--states", type=int, default=1000, help="0 for no splitter")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    names = args.tool or ["BRAINSABC", "BRAINSFit", "BRAINSResample"]
+    with tempfile.TemporaryDirectory() as workdir:
+        module, failed = generate_module(args.xml_dir, names, workdir)
+        print(
+            f"{'tool':24s}{'pickler':>13s}{'specs':>11s}{'bytes':>11s}"
+            f"{'dump ms':>10s}{'load ms':>10s}"
+        )
+        for name in names:
+            if name in failed:
+                continue
+            task = getattr(module, name)(
+                cache_dir=os.path.join(workdir, "cache")
+            ).get_task()
+            if args.states:
+                task.split("args", args=[f"--state {i}" for i in range(args.states)])
+            with_specs = copy.copy(task)
+            with_specs.spec_ref = None
+            for pickler, dumps in [
+                ("pickle", pickle.dumps),
+                ("cloudpickle", cloudpickle.dumps),
+            ]:
+                for label, instance in [("reference", task), ("included", with_specs)]:
+                    size, dump, load = round_trip(instance, dumps, args.repeat)
+                    print(
+                        f"{name:24s}{pickler:>13s}{label:>11s}{size:11d}"
+                        f"{dump * 1000:10.2f}{load * 1000:10.2f}"
+                    )
+    if failed:
+        print(f"\nnot generated: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
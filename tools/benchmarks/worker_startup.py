@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Time to first task of worker pools started with each start method.
+
+Generates the task class of ``--tool``, then, in a fresh interpreter per
+measurement, starts a process pool (and its fork server, if any) and
+reports the time a new worker of the pool takes to return the result of its
+first task of the tool, run with a no-op stand-in executable the way
+pydra's ``cf`` worker does, and of its second one once it is warm. The
+pools compared are ``spawn``, ``fork``, a ``forkserver`` preloading
+nothing and a
+:class:`~pydra.tasks.TODO.workers.ForkserverWorker` preloading the SEM
+package and the tool module.
+
+    python tools/benchmarks/worker_startup.py [--tool BRAINSResample] [--repeat 5]
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+
+pools = ["spawn", "fork", "forkserver", "preloaded"]
+
+
+def make_context(kind):
+    if kind == "preloaded":
+        from pydra.tasks.TODO.workers import ForkserverWorker
+
+        ForkserverWorker(n_procs=1, preload=["sem_tasks"]).pool.shutdown()
+        return multiprocessing.get_context("forkserver")
+    context = multiprocessing.get_context(kind)
+    if kind == "forkserver":
+        context.set_forkserver_preload([])
+    return context
+
+
+def measure(kind, workdir, tool, executable):
+    """Seconds to start the pool, then to the first and second task of a new worker"""
+    sys.path.insert(0, workdir)
+    import sem_tasks
+
+    factory = getattr(sem_tasks, tool)
+    tasks = [
+        factory(
+            executable=executable, cache_dir=os.path.join(workdir, "cache")
+        ).get_task()
+        for _ in range(2)
+    ]
+    start = time.perf_counter()
+    context = make_context(kind)
+    # a first process starts the fork server, if any, and waits for its imports
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+        pool.submit(os.getpid).result()
+    started = time.perf_counter()
+    # then a new worker joins, as when the pool is scaled up
+    pool = concurrent.futures.ProcessPoolExecutor(1, mp_context=context)
+    pool.submit(tasks[0]._run, True).result()
+    first = time.perf_counter()
+    pool.submit(tasks[1]._run, True).result()
+    second = time.perf_counter()
+    pool.shutdown()
+    return started - start, first - started, second - first
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--xml-dir")
+    parser.add_argument("--tool", default="BRAINSResample")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--measure", choices=pools, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--executable", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(
+            json.dumps(measure(args.measure, args.workdir, args.tool, args.executable))
+        )
+        return
+
+    from task_overhead import generate_module, noop_executables, tools_dir
+
+    with tempfile.TemporaryDirectory() as workdir:
+        generate_module(
+            args.xml_dir or os.path.join(tools_dir, "xmls"), [args.tool], workdir
+        )
+        executable = noop_executables(workdir, [args.tool])[args.tool]
+        print(
+            f"{'pool':12s}{'pool start ms':>15s}{'first task ms':>15s}{'second task ms':>16s}"
+        )
+        for kind in pools:
+            results = []
+            for _ in range(args.repeat):
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        __file__,
+                        "--tool",
+                        args.tool,
+                        "--measure",
+                        kind,
+                        "--workdir",
+                        workdir,
+                        "--executable",
+                        executable,
+                    ],
+                    stdout=subprocess.PIPE,
+                    check=True,
+                ).stdout
+                results.append(json.loads(output.splitlines()[-1]))
+            started, first, second = (
+                sum(result[i] for result in results) / len(results) for i in range(3)
+            )
+            print(
+                f"{kind:12s}{started * 1000:15.1f}{first * 1000:15.1f}{second * 1000:16.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,38 @@
 """
-This script generates Slicer Interfaces based on the CLI modules XML. CLI
-modules are selected from the hardcoded list below and generated code is placed
-in the cli_modules.py file (and imported in __init__.py). For this to work
-correctly you must have your CLI executables in $PATH
+This script generates Slicer Interfaces based on the CLI modules XML. The CLI
+modules generated are the ones uncommented in ``modules_list``, at the bottom
+of this script, and the code of each one is placed in its own module, within a
+package per category whose __init__.py re-exports the classes of its tools,
+importing their module on first use. Their XML is read from ``xml_dir`` when
+given, e.g. tools/xmls; otherwise the CLI executables must be in $PATH and
+are run with --xml.
+
+With --discover, ``modules_list`` is ignored: the modules are all the
+executables of the given directories (or of $PATH) answering --xml with a SEM
+description.
 """
-import keyword
+import argparse
+import concurrent.futures
+import fnmatch
 import os
 import shutil
+import signal
+import stat
 import subprocess
 import sys
 import xml.dom.minidom
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pydra.tasks.TODO.xmlspec import (  # noqa: E402
+    constant_input_fields,
+    constant_inputs,
+    describe,
+    field_code,
+    generator_version,
+    parameter_fields,
+)
+
 header = """\
 \"""
 Autogenerated file - DO NOT EDIT
@@ -19,9 +41,13 @@ If you spot a bug, please report it on the mailing list and/or change the genera
 """
 
 imports = """\
+import time
 import attr
 from nipype.interfaces.base import Directory, File, InputMultiPath, OutputMultiPath, traits
-from pydra import ShellCommandTask
+from pydra.tasks.TODO.formats import resolve_output_filenames
+from pydra.tasks.TODO.task import SEMShellCommandTask
+from pydra.tasks.TODO.tracing import notify
+from pydra.tasks.TODO.xmlspec import GeneratedSpecs
 from pydra.engine.specs import SpecInfo, ShellSpec, MultiInputFile, MultiOutputFile, MultiInputObj
 import pydra\n\n
 """
@@ -41,51 +67,93 @@ if __name__ == "__main__":
     setup(**configuration(top_path="").todict())
 """
 
+# Category packages only re-export their tools, each tool module is imported
+# when its class is first used
+init_template = """\
+import importlib
+
+_tools = {tools}
+_subpackages = {subpackages}
+
+__all__ = {names}
+
+
+def __getattr__(name):
+    if name in _tools:
+        cls = getattr(importlib.import_module(f".{{_tools[name]}}", __name__), name)
+        globals()[name] = cls
+        return cls
+    if name in _subpackages:
+        return importlib.import_module(f".{{name}}", __name__)
+    raise AttributeError(f"module {{__name__!r}} has no attribute {{name!r}}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_tools) | set(_subpackages))
+"""
+
 # launcher_space = ""
 # if len({launcher})>0:
 #     launcher_space = " "
 
 template = """\
 class {module_name}():
-    def __init__(self, name="{module_name}", executable="{launcher}{module}", cache_dir=None):
+    constant_inputs = {constant_inputs}
+    output_filenames = {{{output_filenames}}}
+    generator_version = {generator_version}
+
+    def __init__(self, name="{module_name}", executable="{launcher}{module}", cache_dir=None, terminal_outputs=(), **options):
         self.name = name
         self.executable = executable
         self.cache_dir = cache_dir
+        self.terminal_outputs = terminal_outputs
+        self.options = options
     \"""
 {docstring}\
     \"""
-    def get_task(self):
+    @staticmethod
+    def specs():
         input_fields = [{input_fields}]
         output_fields = [{output_fields}]
 
         input_spec = SpecInfo(name="Input", fields=input_fields, bases=(ShellSpec,))
         output_spec = SpecInfo(name="Output", fields=output_fields, bases=(pydra.specs.ShellOutSpec,))
+        return input_spec, output_spec
+
+    def get_task(self, **inputs):
+        start = time.time()
+        input_spec, output_spec = self.specs()
 
-        task = ShellCommandTask(
+        task = SEMShellCommandTask(
             name=self.name,
             executable=self.executable,
             input_spec=input_spec,
             output_spec=output_spec,
-            cache_dir=self.cache_dir
+            cache_dir=self.cache_dir,
+            constant_inputs=self.constant_inputs,
+            terminal_outputs=self.terminal_outputs,
+            spec_ref=GeneratedSpecs(__name__, "{module_name}", self.generator_version),
+            **self.options,
+            **resolve_output_filenames(inputs, self.output_filenames, self.terminal_outputs)
         )
+        notify(task, "building", start, time.time() - start)
         return task
 """
 
+fake_template = """\
+#!/usr/bin/env python3
+# Autogenerated stand-in for {module}, see sem_fake.py
+import os
+import sys
 
-def force_to_valid_python_variable_name(old_name):
-    """Valid c++ names are not always valid in python, so
-    provide alternate naming
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sem_fake import main
 
-    >>> force_to_valid_python_variable_name('lambda')
-    'opt_lambda'
-    >>> force_to_valid_python_variable_name('inputVolume')
-    'inputVolume'
-    """
-    new_name = old_name.strip()
-    if new_name in keyword.kwlist:
-        return f"opt_{new_name}"
-    else:
-        return new_name
+xml = {xml!r}
+
+if __name__ == "__main__":
+    main("{module}", xml)
+"""
 
 
 def add_class_to_package(class_codes, class_names, module_name, package_dir):
@@ -101,54 +169,53 @@ def add_class_to_package(class_codes, class_names, module_name, package_dir):
         f.write("\n\n".join(class_codes))
 
 
+def add_init_to_package(tools, subpackages, package_dir):
+    with open(os.path.join(package_dir, "__init__.py"), mode="w") as f:
+        f.write(header)
+        f.write(
+            init_template.format(
+                tools=tools, subpackages=subpackages, names=sorted(tools)
+            )
+        )
+
+
 def crawl_code_struct(code_struct, package_dir):
+    """Write a module per tool of code_struct and a package per category
+
+    Returns the {class name: module name} of the tools written to package_dir.
+    """
+    tools = {}
     subpackages = []
     for k, v in code_struct.items():
         if isinstance(v, (str, bytes)):
             module_name = k.lower()
-            class_name = k
-            class_code = v
-            add_class_to_package([class_code], [class_name], module_name, package_dir)
+            add_class_to_package([v], [k], module_name, package_dir)
+            tools[k] = module_name
         else:
-            l1 = {}
-            l2 = {}
-            for key in list(v.keys()):
-                if isinstance(v[key], (str, bytes)):
-                    l1[key] = v[key]
-                else:
-                    l2[key] = v[key]
-            if l2:
-                v = l2
-                subpackages.append(k.lower())
-                # with open(os.path.join(package_dir, "__init__.py"), mode="a+") as f:
-                #     f.write(f"from {k.lower()} import *\n")
-                new_pkg_dir = os.path.join(package_dir, k.lower())
-                if os.path.exists(new_pkg_dir):
-                    shutil.rmtree(new_pkg_dir)
-                os.mkdir(new_pkg_dir)
-                crawl_code_struct(v, new_pkg_dir)
-                if l1:
-                    for ik, iv in l1.items():
-                        crawl_code_struct({ik: {ik: iv}}, new_pkg_dir)
-            elif l1:
-                v = l1
-                module_name = k.lower()
-                add_class_to_package(
-                    list(v.values()), list(v.keys()), module_name, package_dir
-                )
-        if subpackages:
-            with open(os.path.join(package_dir, "setup.py"), mode="w") as f:
-                f.write(
-                    setup.format(
-                        pkg_name=package_dir.split("/")[-1],
-                        sub_pks="\n    ".join(
-                            [
-                                f'config.add_data_dir("{sub_pkg}")'
-                                for sub_pkg in subpackages
-                            ]
-                        ),
-                    )
+            subpackages.append(k.lower())
+            new_pkg_dir = os.path.join(package_dir, k.lower())
+            if os.path.exists(new_pkg_dir):
+                shutil.rmtree(new_pkg_dir)
+            # category module written by previous versions of this script
+            if os.path.exists(f"{new_pkg_dir}.py"):
+                os.unlink(f"{new_pkg_dir}.py")
+            os.mkdir(new_pkg_dir)
+            add_init_to_package(
+                crawl_code_struct(v, new_pkg_dir),
+                [key.lower() for key, value in v.items() if isinstance(value, dict)],
+                new_pkg_dir,
+            )
+    if subpackages:
+        with open(os.path.join(package_dir, "setup.py"), mode="w") as f:
+            f.write(
+                setup.format(
+                    pkg_name=package_dir.split("/")[-1],
+                    sub_pks="\n    ".join(
+                        [f'config.add_data_dir("{sub_pkg}")' for sub_pkg in subpackages]
+                    ),
                 )
+            )
+    return tools
 
 
 def generate_all_classes(
@@ -158,23 +225,41 @@ def generate_all_classes(
     mipav_hacks=False,
     xml_dir=None,
     output_dir=None,
+    fake_bin_dir=None,
+    doms=None,
+    skip_failures=False,
 ):
-    """modules_list contains all the SEM compliant tools that should have wrappers created for them.
+    """modules_list contains all the SEM compliant tools that should have wrappers created for
+    them, the modules_list of the script or the executables found with --discover.
     launcher contains the command line prefix wrapper arguments needed to prepare
     a proper environment for each of the modules.
+    With xml_dir, the XML of each module is read from <xml_dir>/<module>.xml rather than
+    by running it with --xml.
+    With fake_bin_dir, a stand-in executable of each module is written there as well.
+    doms maps modules to their XML already read (e.g. by discover_executables).
+    With skip_failures, modules whose XML cannot be mapped are reported and skipped.
     """
+    doms = doms or {}
     all_code = {}
     for module in modules_list:
         print("=" * 80)
         print(f"Generating Definition for module {module}")
         print("^" * 80)
-        package, code, module = generate_class(
-            module,
-            launcher,
-            redirect_x=redirect_x,
-            mipav_hacks=mipav_hacks,
-            xml_dir=xml_dir,
-        )
+        try:
+            package, code, module = generate_class(
+                module,
+                launcher,
+                redirect_x=redirect_x,
+                mipav_hacks=mipav_hacks,
+                xml_dir=xml_dir,
+                fake_bin_dir=fake_bin_dir,
+                dom=doms.get(module),
+            )
+        except Exception as e:
+            if not skip_failures:
+                raise
+            print(f"Skipping module {module}: {e!r}")
+            continue
         cur_package = all_code
         module_name = package.strip().split(" ")[0].split(".")[-1]
         for package in package.strip().split(" ")[0].split(".")[:-1]:
@@ -200,270 +285,33 @@ def generate_class(
     redirect_x=False,
     mipav_hacks=False,
     xml_dir=None,
+    fake_bin_dir=None,
+    dom=None,
 ):
-    if xml_dir:
+    if dom is None and xml_dir:
         dom = dom_from_xml(module, xml_dir)
-    else:
+    elif dom is None:
         dom = dom_from_binary(module, launcher, mipav_hacks=mipav_hacks)
     if strip_module_name_prefix:
         module_name = module.split(".")[-1]
     else:
         module_name = module
-    inputTraits = []
-    outputTraits = []
-    outputs_filenames = {}
-
-    # self._outputs_nodes = []
-
-    docstring = ""
-
-    for desc_str in [
-        "title",
-        "category",
-        "description",
-        "version",
-        "documentation-url",
-        "license",
-        "contributor",
-        "acknowledgements",
-    ]:
-        el = dom.getElementsByTagName(desc_str)
-        if el and el[0].firstChild and el[0].firstChild.nodeValue.strip():
-            docstring += "    {desc_str}: {el}\n".format(
-                desc_str=desc_str, el=el[0].firstChild.nodeValue.strip()
-            )
-        if desc_str == "category":
-            category = el[0].firstChild.nodeValue.strip()
-
-    for paramGroup in dom.getElementsByTagName("parameters"):
-        indices = paramGroup.getElementsByTagName("index")
-        max_index = 0
-        for index in indices:
-            if int(index.firstChild.nodeValue) > max_index:
-                max_index = int(index.firstChild.nodeValue)
-        for param in paramGroup.childNodes:
-            if param.nodeName in ["label", "description", "#text", "#comment"]:
-                continue
-            traitsParams = {}
-
-            longFlagNode = param.getElementsByTagName("longflag")
-            if longFlagNode:
-                # Prefer to use longFlag as name if it is given, rather than the parameter name
-                longFlagName = longFlagNode[0].firstChild.nodeValue
-                # SEM automatically strips prefixed "--" or "-" from from xml before processing
-                # we need to replicate that behavior here The following
-                # two nodes in xml have the same behavior in the program
-                # <longflag>--test</longflag>
-                # <longflag>test</longflag>
-                longFlagName = longFlagName.lstrip(" -").rstrip(" ")
-                name = longFlagName
-                name = force_to_valid_python_variable_name(name)
-                traitsParams["argstr"] = f"--{longFlagName} "
-            else:
-                name = param.getElementsByTagName("name")[0].firstChild.nodeValue
-                name = force_to_valid_python_variable_name(name)
-                if param.getElementsByTagName("index"):
-                    traitsParams["argstr"] = ""
-                else:
-                    traitsParams["argstr"] = f"--{name} "
-
-            if (
-                param.getElementsByTagName("description")
-                and param.getElementsByTagName("description")[0].firstChild
-            ):
-                traitsParams["help_string"] = (
-                    param.getElementsByTagName("description")[0]
-                    .firstChild.nodeValue.replace('"', '\\"')
-                    .replace("\n", ", ")
-                )
-            else:
-                traitsParams["help_string"] = ""
-
-            # argsDict = {
-            #     "directory": "%s",
-            #     "file": "%s",
-            #     "integer": "%d",
-            #     "double": "%f",
-            #     "float": "%f",
-            #     "image": "%s",
-            #     "transform": "%s",
-            #     "boolean": "",
-            #     "string-enumeration": "%s",
-            #     "string": "%s",
-            #     "integer-enumeration": "%s",
-            #     "table": "%s",
-            #     "point": "%s",
-            #     "region": "%s",
-            #     "geometry": "%s",
-            # }
-
-            # if param.nodeName.endswith("-vector"):
-            #     traitsParams["argstr"] += "%s"
-            # else:
-            #     traitsParams["argstr"] += argsDict[param.nodeName]
-
-            index = param.getElementsByTagName("index")
-            if index:
-                traitsParams["position"] = int(index[0].firstChild.nodeValue) - (
-                    max_index + 1
-                )
-
-            desc = param.getElementsByTagName("description")
-            if index:
-                traitsParams["help_string"] = desc[0].firstChild.nodeValue
-
-            typesDict = {
-                "integer": "traits.Int",
-                "double": "traits.Float",
-                "float": "traits.Float",
-                "image": "File",
-                "transform": "File",
-                "boolean": "traits.Bool",
-                "string": "traits.Str",
-                "file": "File",
-                "geometry": "File",
-                "directory": "Directory",
-                "table": "File",
-                "point": "traits.List",
-                "region": "traits.List",
-            }
-
-            if param.nodeName.endswith("-enumeration"):
-                type = "traits.Enum"
-                values = [
-                    '"{value}"'.format(
-                        value=str(el.firstChild.nodeValue).replace('"', "")
-                    )
-                    for el in param.getElementsByTagName("element")
-                ]
-            elif param.nodeName.endswith("-vector"):
-                type = "MultiInputObj"
-                if param.nodeName in [
-                    "file",
-                    "directory",
-                    "image",
-                    "geometry",
-                    "transform",
-                    "table",
-                ]:
-                    values = [
-                        "{type}(exists=True)".format(
-                            type=typesDict[param.nodeName.replace("-vector", "")]
-                        )
-                    ]
-                else:
-                    values = [typesDict[param.nodeName.replace("-vector", "")]]
-                if mipav_hacks is True:
-                    traitsParams["sep"] = ";"
-                else:
-                    traitsParams["sep"] = ","
-            elif (
-                param.getAttribute("multiple") == "true"
-                and "input" not in name
-                and "output" not in name
-            ):
-                type = "MultiInputFile"
-                # type = "File"
-                if param.nodeName in [
-                    "file",
-                    "directory",
-                    "image",
-                    "geometry",
-                    "transform",
-                    "table",
-                ]:
-                    values = [
-                        "{type}(exists=True)".format(type=typesDict[param.nodeName])
-                    ]
-                elif param.nodeName in ["point", "region"]:
-                    values = [
-                        "{type}(traits.Float(), minlen=3, maxlen=3)".format(
-                            type=typesDict[param.nodeName]
-                        )
-                    ]
-                else:
-                    values = [typesDict[param.nodeName]]
-                traitsParams["sep"] = ","
-                # traitsParams["argstr"] += "..."
-            else:
-                values = []
-                type = typesDict[param.nodeName]
-
-            if param.nodeName in [
-                "file",
-                "directory",
-                "image",
-                "geometry",
-                "transform",
-                "table",
-            ]:
-                if not param.getElementsByTagName("channel"):
-                    raise RuntimeError(
-                        "Insufficient XML specification: each element of type 'file', 'directory', 'image', 'geometry', 'transform',  or 'table' requires 'channel' field.\n{0}".format(
-                            traitsParams
-                        )
-                    )
-                elif (
-                    param.getElementsByTagName("channel")[0].firstChild.nodeValue
-                    == "output"
-                ):
-                    type = type.replace("Input", "Output")
-                    # traitsParams["hash_files"] = False
-                    inputTraits.append(
-                        '("{name}", attr.ib(type={type}, metadata={{{params}}}))'.format(
-                            name=name, type=type, params=parse_params(traitsParams)
-                        )
-                    )
-                    # traitsParams["exists"] = True
-                    traitsParams.pop("argstr")
-                    traitsParams["output_file_template"] = f"{{{name}}}"
-                    # traitsParams.pop("hash_files")
-                    outputTraits.append(
-                        '("{name}", attr.ib(type={type}, metadata={{{params}}}))'.format(
-                            name=name,
-                            type=f"pydra.specs.{type}",
-                            params=parse_params(traitsParams),
-                        )
-                    )
-
-                    outputs_filenames[name] = gen_filename_from_param(param, name)
-                elif (
-                    param.getElementsByTagName("channel")[0].firstChild.nodeValue
-                    == "input"
-                ):
-                    # if param.nodeName in [
-                    #     "file",
-                    #     "directory",
-                    #     "image",
-                    #     "geometry",
-                    #     "transform",
-                    #     "table",
-                    # ] and type not in ["InputMultiPath", "traits.List"]:
-                    # traitsParams["exists"] = True
-                    inputTraits.append(
-                        '("{name}", attr.ib(type={type}, metadata={{{params}}}))'.format(
-                            name=name, type=type, params=parse_params(traitsParams)
-                        )
-                    )
-                else:
-                    raise RuntimeError(
-                        "Insufficient XML specification: each element of type 'file', 'directory', 'image', 'geometry', 'transform',  or 'table' requires 'channel' field to be in ['input','output'].\n{0}".format(
-                            traitsParams
-                        )
-                    )
-            else:  # For all other parameter types, they are implicitly only input types
-                inputTraits.append(
-                    '("{name}", attr.ib(type={type}, metadata={{{params}}}))'.format(
-                        name=name, type=type, params=parse_params(traitsParams)
-                    )
-                )
+    if fake_bin_dir:
+        write_fake_executable(module, dom, fake_bin_dir)
+    docstring, category = describe(dom)
+    inputTraits, outputTraits, outputs_filenames = parameter_fields(
+        dom, mipav_hacks=mipav_hacks
+    )
 
     if mipav_hacks:
         blacklisted_inputs = ["maxMemoryUsage"]
         inputTraits = [
-            trait for trait in inputTraits if trait.split()[0] not in blacklisted_inputs
+            field for field in inputTraits if field.name not in blacklisted_inputs
         ]
+    inputTraits = [field_code(field) for field in inputTraits]
+    outputTraits = [field_code(field) for field in outputTraits]
 
+    if mipav_hacks:
         compulsory_inputs = [
             'xDefaultMem = traits.Int(help_string="Set default maximum heap size", argstr="-xDefaultMem %d")',
             'xMaxProcess = traits.Int(1, help_string="Set default maximum number of processes.", argstr="-xMaxProcess %d", usedefault=True)',
@@ -489,11 +337,35 @@ def generate_class(
         output_fields=output_fields,
         launcher=" ".join(launcher),
         module=module,
+        constant_inputs=constant_input_fields(
+            dom, constant_inputs.get(module_name, [])
+        ),
+        output_filenames=output_filenames,
+        generator_version=generator_version,
     )
 
     return category, main_class, module_name
 
 
+def write_fake_executable(module, dom, bin_dir):
+    """Write a stand-in executable of module to bin_dir, see sem_fake.py
+
+    The stand-in parses the same arguments as the tool, answers --xml and
+    writes its outputs, so that workflows and the task runtime can be run
+    and profiled without the tools installed.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    shutil.copy(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "sem_fake.py"),
+        os.path.join(bin_dir, "sem_fake.py"),
+    )
+    path = os.path.join(bin_dir, module)
+    with open(path, mode="w") as f:
+        f.write(fake_template.format(module=module, xml=dom.toxml()))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
 def dom_from_binary(module, launcher, mipav_hacks=False):
     #        cmd = CommandLine(command = "Slicer3", args="--launch %s --xml"%module)
     #        ret = cmd.run()
@@ -540,6 +412,97 @@ def dom_from_binary(module, launcher, mipav_hacks=False):
 #            raise Exception(cmd.cmdline + " failed:\n%s"%ret.runtime.stderr)
 
 
+def probe_executable(path, launcher=[], timeout=10):
+    """XML printed by path --xml, None when it is not a SEM executable
+
+    Executables still running after timeout seconds are killed together with
+    the processes they started.
+    """
+    try:
+        proc = subprocess.Popen(
+            launcher + [path, "--xml"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        return None
+    try:
+        stdout, _ = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.communicate()
+        return None
+    start = stdout.find(b"<?xml")
+    if start < 0:
+        start = stdout.find(b"<executable")
+    if start < 0:
+        return None
+    try:
+        dom = xml.dom.minidom.parseString(stdout[start:].strip())
+    except Exception:
+        return None
+    if dom.documentElement.tagName != "executable" or not dom.getElementsByTagName(
+        "parameters"
+    ):
+        return None
+    return dom
+
+
+def find_executables(directories=None, patterns=("*",)):
+    """Executables of directories ($PATH by default) matching patterns, by name
+
+    As for $PATH, an executable found in an earlier directory hides the ones
+    of the same name found later.
+    """
+    if directories is None:
+        directories = os.environ.get("PATH", "").split(os.pathsep)
+    executables = {}
+    for directory in directories:
+        try:
+            entries = sorted(os.scandir(directory or "."), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name in executables or not any(
+                fnmatch.fnmatch(entry.name, pattern) for pattern in patterns
+            ):
+                continue
+            try:
+                if entry.is_file() and os.access(entry.path, os.X_OK):
+                    executables[entry.name] = entry.path
+            except OSError:
+                continue
+    return executables
+
+
+def discover_executables(
+    directories=None, patterns=("*",), launcher=[], jobs=16, timeout=10
+):
+    """SEM executables of directories ($PATH by default) and their XML
+
+    All the executables matching patterns are probed with --xml, jobs at a
+    time; returns {name: dom} of the ones answering a SEM description.
+    """
+    executables = find_executables(directories, patterns)
+    doms = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(probe_executable, path, launcher, timeout): name
+            for name, path in executables.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            dom = future.result()
+            if dom is not None:
+                doms[futures[future]] = dom
+    print(f"Found {len(doms)} SEM executables among {len(executables)} probed")
+    return dict(sorted(doms.items()))
+
+
 def dom_from_xml(module, xml_dir):
     try:
         dom = xml.dom.minidom.parse(os.path.join(xml_dir, f"{module}.xml"))
@@ -549,19 +512,6 @@ def dom_from_xml(module, xml_dir):
     return dom
 
 
-def parse_params(params):
-    list = []
-    for key, value in params.items():
-        if isinstance(value, (str, bytes)):
-            list.append(
-                '"{key}": "{value}"'.format(key=key, value=value.replace('"', "'"))
-            )
-        else:
-            list.append(f'"{key}": "{value}"')
-
-    return ", ".join(list)
-
-
 def parse_values(values):
     values = [f"{value}" for value in values]
     if len(values) > 0:
@@ -570,24 +520,6 @@ def parse_values(values):
         return ""
 
 
-def gen_filename_from_param(param, base):
-    fileExtensions = param.getAttribute("fileExtensions")
-    if fileExtensions:
-        # It is possible that multiple file extensions can be specified in a
-        # comma separated list,  This will extract just the first extension
-        firstFileExtension = fileExtensions.split(",")[0]
-        ext = firstFileExtension
-    else:
-        ext = {
-            "image": ".nii",
-            "transform": ".mat",
-            "file": "",
-            "directory": "",
-            "geometry": ".vtk",
-        }[param.nodeName]
-    return base + ext
-
-
 if __name__ == "__main__":
     # NOTE:  For now either the launcher needs to be found on the default path, or
     # every tool in the modules list must be found on the default path
@@ -715,22 +647,70 @@ if __name__ == "__main__":
 
     launcher = []
 
-    arguments = sys.argv[1:]
-    num_arguments = len(arguments)
-
-    if num_arguments <= 2:
-        output_dir, xml_dir = arguments + [None] * (2 - num_arguments)
-    else:
-        raise ValueError(
-            f"expected at most 2 arguments [output directory, xml directory], received {num_arguments} arguments: {arguments}"
+    parser = argparse.ArgumentParser(
+        description="Generate pydra tasks of Slicer Execution Model tools"
+    )
+    parser.add_argument(
+        "output_dir",
+        nargs="?",
+        help="directory the generated tasks are rooted at (current directory by default)",
+    )
+    parser.add_argument(
+        "xml_dir",
+        nargs="?",
+        help="directory of the <tool>.xml files (the tools are run with --xml by default)",
+    )
+    parser.add_argument(
+        "--discover",
+        nargs="*",
+        metavar="DIR",
+        help="generate every SEM executable found in these directories ($PATH if none) "
+        "instead of the modules listed in this script",
+    )
+    parser.add_argument(
+        "--match",
+        action="append",
+        metavar="PATTERN",
+        help="only probe the executables matching this glob pattern (repeatable)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=16, help="executables probed concurrently"
+    )
+    parser.add_argument(
+        "--probe-timeout",
+        type=float,
+        default=10,
+        help="seconds after which an executable probed with --xml is killed",
+    )
+    parser.add_argument(
+        "--fake-bin",
+        metavar="DIR",
+        help="write a stand-in executable of every tool in DIR, see sem_fake.py",
+    )
+    args = parser.parse_args()
+
+    doms = None
+    if args.discover is not None:
+        if args.xml_dir:
+            parser.error("--discover reads the XML from the executables, not xml_dir")
+        doms = discover_executables(
+            directories=args.discover or None,
+            patterns=args.match or ["*"],
+            launcher=launcher,
+            jobs=args.jobs,
+            timeout=args.probe_timeout,
         )
+        modules_list = list(doms)
 
     # SlicerExecutionModel compliant tools that are usually statically built, and don't need the Slicer3 --launcher
     generate_all_classes(
         modules_list=modules_list,
         launcher=launcher,
-        xml_dir=xml_dir,
-        output_dir=output_dir,
+        xml_dir=args.xml_dir,
+        output_dir=args.output_dir,
+        fake_bin_dir=args.fake_bin,
+        doms=doms,
+        skip_failures=doms is not None,
     )
     # Tools compliant with SlicerExecutionModel called from the Slicer environment (for shared lib compatibility)
     # launcher = ['/home/raid3/gorgolewski/software/slicer/Slicer', '--launch']
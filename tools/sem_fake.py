@@ -0,0 +1,282 @@
+"""
+Stand-in for a Slicer Execution Model executable, driven by its XML.
+
+``generate_tasks.py --fake-bin=DIR`` copies this file to ``DIR`` together
+with one launcher per tool, named after it, that calls :func:`main` with the
+XML of the tool. A stand-in:
+
+* answers ``--xml`` with the XML of the tool;
+* parses the flags (``longflag``/``flag``) and positional arguments
+  (``index``) the XML declares, checks the numbers, vectors and
+  enumerations, and fails like the real tools (``PARSE ERROR``, exit code 1)
+  otherwise;
+* runs for a while, allocates memory and reports its progress on stdout
+  according to the cost model;
+* writes the output files, directories and return parameters it is asked
+  for.
+
+The cost model is a JSON file, ``$SEM_FAKE_COST`` or ``cost.json`` next to
+this file, of ``{"default": {...}, "<tool>": {...}}`` with the keys
+``seconds``, ``seconds_per_input_mb`` (per MB of input files),
+``memory_mb``, ``output_bytes`` (size of every output file) and
+``output_content``, what the outputs are filled with:
+
+* ``"sparse"`` (default): a sparse file of zeros, nothing is written;
+* ``"zeros"``: zeros actually written;
+* ``"random"``: incompressible random bytes;
+* ``"image"``: random low-amplitude values in half of the file and zeros in
+  the other, which compresses about like a brain volume.
+
+The numbers default to 0: a stand-in only writes empty outputs.
+
+Only the standard library is used so that the stand-ins start as fast as a
+Python interpreter can.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import xml.dom.minidom
+
+scalar_types = {"integer": int, "float": float, "double": float}
+vector_types = {
+    "integer-vector": int,
+    "float-vector": float,
+    "double-vector": float,
+    "string-vector": str,
+    "point": float,
+    "region": float,
+}
+file_types = {"image", "file", "transform", "geometry", "directory", "table"}
+ignored = {"label", "description", "#text", "#comment"}
+
+
+def _text(node, tag):
+    elements = node.getElementsByTagName(tag)
+    if elements and elements[0].firstChild is not None:
+        return elements[0].firstChild.nodeValue.strip()
+    return None
+
+
+def parameters(dom):
+    """The parameters declared by the SEM XML ``dom``, as dicts"""
+    params = []
+    for group in dom.getElementsByTagName("parameters"):
+        for node in group.childNodes:
+            if node.nodeName in ignored:
+                continue
+            params.append(
+                {
+                    "name": _text(node, "name"),
+                    "type": node.nodeName,
+                    "longflag": (_text(node, "longflag") or "").lstrip("-") or None,
+                    "flag": (_text(node, "flag") or "").lstrip("-") or None,
+                    "index": _text(node, "index"),
+                    "channel": _text(node, "channel") or "input",
+                    "default": _text(node, "default"),
+                    "multiple": node.getAttribute("multiple") == "true",
+                    "choices": [
+                        element.firstChild.nodeValue.strip()
+                        for element in node.getElementsByTagName("element")
+                        if element.firstChild is not None
+                    ],
+                }
+            )
+    return params
+
+
+def vector(item_type):
+    """argparse type of a comma separated vector of ``item_type``
+
+    >>> vector(int)("1,2,3")
+    '1,2,3'
+    >>> vector(float)("1,x")
+    Traceback (most recent call last):
+    ...
+    argparse.ArgumentTypeError: invalid float vector: '1,x'
+    """
+
+    def check(value):
+        try:
+            [item_type(item) for item in value.split(",") if item]
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"invalid {item_type.__name__} vector: {value!r}"
+            )
+        return value
+
+    return check
+
+
+class Parser(argparse.ArgumentParser):
+    def error(self, message):
+        # same report and exit code as the TCLAP parser of the real tools
+        sys.stderr.write(f"PARSE ERROR: {message}\n")
+        self.print_usage(sys.stderr)
+        sys.exit(1)
+
+
+def build_parser(tool, params):
+    parser = Parser(prog=tool, conflict_handler="resolve")
+    parser.add_argument("--xml", action="store_true")
+    parser.add_argument("--returnparameterfile")
+    parser.add_argument("--processinformationaddress")
+    positional = sorted(
+        (param for param in params if param["index"] is not None),
+        key=lambda param: int(param["index"]),
+    )
+    for param in positional:
+        parser.add_argument(param["name"], **_argument(param))
+    for param in params:
+        if param["index"] is not None:
+            continue
+        names = [f"--{param['longflag'] or param['name']}"]
+        if param["flag"]:
+            names.append(f"-{param['flag']}")
+        options = _argument(param)
+        if param["type"] == "boolean":
+            options = {"action": "store_true"}
+        elif param["multiple"]:
+            options["action"] = "append"
+        parser.add_argument(*names, dest=param["name"], **options)
+    return parser
+
+
+def _argument(param):
+    if param["choices"]:
+        return {"choices": param["choices"]}
+    if param["type"] in scalar_types:
+        return {"type": scalar_types[param["type"]]}
+    if param["type"] in vector_types:
+        return {"type": vector(vector_types[param["type"]])}
+    return {}
+
+
+def cost_model(tool):
+    path = os.environ.get("SEM_FAKE_COST") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "cost.json"
+    )
+    try:
+        with open(path) as f:
+            model = json.load(f)
+    except FileNotFoundError:
+        model = {}
+    cost = dict(model.get("default", {}))
+    cost.update(model.get(tool, {}))
+    return cost
+
+
+def _values(value):
+    if value is None or value is False or value is True:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [item for value in values for item in str(value).split(",") if item]
+
+
+def _progress(tool, seconds):
+    print(
+        f"<filter-start>\n<filter-name>{tool}</filter-name>\n"
+        f"<filter-comment>stand-in run</filter-comment>\n</filter-start>",
+        flush=True,
+    )
+    steps = max(1, min(10, int(seconds * 2)))
+    for step in range(1, steps + 1):
+        time.sleep(seconds / steps)
+        print(f"<filter-progress>{step / steps:.2f}</filter-progress>", flush=True)
+    print(
+        f"<filter-end>\n<filter-name>{tool}</filter-name>\n"
+        f"<filter-time>{seconds:.2f}</filter-time>\n</filter-end>",
+        flush=True,
+    )
+
+
+output_contents = ["sparse", "zeros", "random", "image"]
+
+# clears the high bits of random bytes, the values of an "image" output
+_low_nibble = bytes(i & 0x0F for i in range(256))
+
+
+def write_output(path, size, content="sparse", chunk_size=1 << 20):
+    """Write ``size`` bytes of ``content`` (see :data:`output_contents`) to ``path``
+
+    >>> import gzip, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "out.nii")
+    >>> write_output(path, 1 << 16, "random")
+    >>> len(gzip.compress(open(path, "rb").read())) > 1 << 16
+    True
+    """
+    if content not in output_contents:
+        raise ValueError(
+            f"unknown output content {content!r}, one of {output_contents}"
+        )
+    with open(path, "wb") as f:
+        if content == "sparse":
+            f.truncate(size)
+            return
+        written = 0
+        while written < size:
+            n = min(chunk_size, size - written)
+            if content == "zeros" or (content == "image" and written >= size // 2):
+                chunk = bytes(n)
+            else:
+                chunk = os.urandom(n)
+                if content == "image":
+                    chunk = chunk.translate(_low_nibble)
+            f.write(chunk)
+            written += n
+
+
+def run(tool, xml_text, argv):
+    if "--xml" in argv:
+        sys.stdout.write(xml_text)
+        return 0
+    params = parameters(xml.dom.minidom.parseString(xml_text))
+    args = vars(build_parser(tool, params).parse_args(argv))
+    cost = cost_model(tool)
+
+    input_bytes = 0
+    for param in params:
+        if param["channel"] == "input" and param["type"] in file_types:
+            for path in _values(args.get(param["name"])):
+                if os.path.isfile(path):
+                    input_bytes += os.path.getsize(path)
+    seconds = cost.get("seconds", 0) + cost.get("seconds_per_input_mb", 0) * (
+        input_bytes / 2 ** 20
+    )
+    memory = None
+    if cost.get("memory_mb"):
+        size = int(cost["memory_mb"] * 2 ** 20)
+        memory = bytearray(size)
+        # touch every page so that the memory is resident
+        memory[::4096] = b"\1" * len(range(0, size, 4096))
+    _progress(tool, seconds)
+    del memory
+
+    returned = []
+    for param in params:
+        if param["channel"] != "output":
+            continue
+        value = args.get(param["name"])
+        if param["type"] not in file_types:
+            returned.append(f"{param['name']} = {param['default'] or 0}")
+            continue
+        for path in _values(value):
+            if param["type"] == "directory":
+                os.makedirs(path, exist_ok=True)
+                continue
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_output(
+                path,
+                int(cost.get("output_bytes", 0)),
+                cost.get("output_content", "sparse"),
+            )
+    if args.get("returnparameterfile"):
+        with open(args["returnparameterfile"], "w") as f:
+            f.write("".join(line + "\n" for line in returned))
+    return 0
+
+
+def main(tool, xml_text):
+    sys.exit(run(tool, xml_text, sys.argv[1:]))